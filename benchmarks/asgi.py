@@ -0,0 +1,98 @@
+"""
+WSGI versus ASGI: latency and throughput of the async read views under
+concurrent load.
+
+    python -m benchmarks.asgi --clients 1 8 32 --duration 10
+
+The database is seeded as for ``benchmarks.load`` and served twice by
+``benchmarks.server``: by Django's threaded WSGI server and by uvicorn
+(``pip install uvicorn``). For each number of concurrent clients, every
+client logs in as a Sales User and requests the dashboard, the product list
+and the order list in turn until the time is up.
+
+Under WSGI every request gets its own thread, and the async views run in an
+event loop of their own inside it. Under ASGI one event loop serves all
+requests; the sync parts of each request run on its own thread and the
+views' independent queries on executor threads.
+"""
+import argparse
+import itertools
+import threading
+import time
+
+from benchmarks.common import benchmark_database, print_table, summarize
+from benchmarks.load import Client, seed, start_server
+
+from django.db import connection
+
+PAGES = ['/', '/products/', '/orders/', '/products/?category=Audio']
+
+
+def drive(client, stop_at, warmup_until, results, errors):
+    try:
+        for page in itertools.cycle(PAGES):
+            if time.monotonic() >= stop_at:
+                break
+            status, ms, queries = client.request('GET', page)
+            if status != 200:
+                errors.append(f"HTTP {status} for {page}")
+            elif time.monotonic() >= warmup_until:
+                results.append(ms)
+    except Exception as exc:
+        errors.append(repr(exc))
+
+
+def run(port, usernames, clients, duration, warmup):
+    logged_in = []
+    for i in range(clients):
+        client = Client(port)
+        client.login(usernames[i % len(usernames)])
+        logged_in.append(client)
+    results, errors = [], []
+    warmup_until = time.monotonic() + warmup
+    stop_at = warmup_until + duration
+    threads = [threading.Thread(target=drive, args=(client, stop_at, warmup_until, results, errors)) for client in logged_in]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=10, help="Seconds of measured load per run.")
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=20000)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        usernames = seed(argparse.Namespace(
+            products=args.products, customers=args.customers, orders=args.orders,
+            clients=max(args.clients), admin_share=0,
+        ))['sales']
+        database = connection.settings_dict['NAME']
+        connection.close()
+
+        rows = []
+        for mode in ('wsgi', 'asgi'):
+            server, port = start_server(database, asgi=mode == 'asgi')
+            try:
+                for clients in args.clients:
+                    results, errors = run(port, usernames, clients, args.duration, args.warmup)
+                    if errors:
+                        print(f"{mode}, {clients} clients: {len(errors)} errors, e.g. {errors[0]}")
+                    timings = summarize(results) if results else {}
+                    rows.append([mode, clients, len(results), round(len(results) / args.duration, 1),
+                                 timings.get('p50_ms'), timings.get('p95_ms'), timings.get('p99_ms')])
+            finally:
+                server.terminate()
+                server.wait()
+        print_table(['server', 'clients', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Cache backends under several worker processes: ``erp.shared_cache``
+versus Django's LocMem and file-based backends.
+
+    python -m benchmarks.cache --processes 4 --operations 5000
+
+Each process plays a web worker doing cache-aside reads of rendered
+fragments: ``get()`` a key drawn from a skewed distribution (a few hot
+pages, a long tail) and, on a miss, "render" the value - ``--render-ms`` of
+CPU - and ``set()`` it. LocMem keeps a copy per process, so every process
+renders every hot page itself; the shared backends render it once.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import percentile, print_table
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from erp.shared_cache import SharedMemoryCache
+
+
+def make_cache(backend, directory):
+    if backend == 'locmem':
+        return LocMemCache('benchmark', {'OPTIONS': {'MAX_ENTRIES': 100_000}})
+    if backend == 'file':
+        return FileBasedCache(os.path.join(directory, 'files'), {'OPTIONS': {'MAX_ENTRIES': 100_000}})
+    return SharedMemoryCache(os.path.join(directory, 'table'), {'OPTIONS': {'SLOTS': 8192, 'SLOT_SIZE': 16384}})
+
+
+def render(key, render_ms):
+    deadline = time.perf_counter() + render_ms / 1000
+    while time.perf_counter() < deadline:
+        pass
+    return f'<tr><td>{key}</td></tr>' * random.randint(20, 200)
+
+
+def worker(backend, directory, keys, operations, render_ms, seed, results):
+    cache = make_cache(backend, directory)
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    names = [f'fragment:{rank}' for rank in range(keys)]
+    hits = 0
+    timings = []
+    start = time.perf_counter()
+    for key in rng.choices(names, weights, k=operations):
+        begin = time.perf_counter()
+        value = cache.get(key)
+        if value is None:
+            cache.set(key, render(key, render_ms), 300)
+        else:
+            hits += 1
+        timings.append((time.perf_counter() - begin) * 1000)
+    results.put((hits, time.perf_counter() - start, timings))
+
+
+def run(backend, args):
+    directory = tempfile.mkdtemp()
+    try:
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(backend, directory, args.keys, args.operations, args.render_ms, seed, results))
+            for seed in range(args.processes)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+    total = args.processes * args.operations
+    hits = sum(hits for hits, seconds, timings in collected)
+    timings = [timing for hits, seconds, chunk in collected for timing in chunk]
+    return [backend, round(total / wall), f'{hits / total:.1%}', total - hits,
+            round(percentile(timings, 50) * 1000), round(percentile(timings, 99) * 1000)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--operations', type=int, default=5000, help='per process')
+    parser.add_argument('--keys', type=int, default=2000)
+    parser.add_argument('--render-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    rows = [run(backend, args) for backend in ['locmem', 'file', 'shared']]
+    print(f'{args.processes} processes x {args.operations} operations, {args.keys} keys, {args.render_ms} ms per render')
+    print_table(['backend', 'ops_per_s', 'hit_rate', 'renders', 'p50_us', 'p99_us'], rows)
+
+
+if __name__ == '__main__':
+    main()
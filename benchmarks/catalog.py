@@ -0,0 +1,105 @@
+"""
+Reading prices and stock for a storefront: scraping the HTML product list
+versus the JSON catalog (``erp.catalog``).
+
+    python -m benchmarks.catalog --products 2000 --skus 200
+
+Four ways to get what a storefront or POS terminal needs:
+
+* ``html scrape``: walk every page of ``/products/`` (10 rows a page),
+  as the terminals did;
+* ``json pages``: walk ``/api/products/`` with ``fields`` and ``limit=500``;
+* ``json bulk``: look ``--skus`` products up by SKU in one request;
+* ``json 304``: revalidate the bulk lookup with ``If-None-Match`` while
+  nothing changed.
+"""
+import argparse
+import random
+import re
+from html import unescape
+
+from benchmarks.common import benchmark_database, measure, print_table, summarize
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+
+from erp.models import Product
+
+NEXT_LINK = re.compile(r'href="\?cursor=([^"]+)">Next<')
+FIELDS = 'sku,selling_price,available_qty'
+
+
+def count_queries(func):
+    queries = 0
+
+    def counter(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(counter):
+        func()
+    return queries
+
+
+def scrape(client):
+    url, pages = '/products/', 0
+    while url:
+        body = client.get(url).content.decode()
+        pages += 1
+        match = NEXT_LINK.search(body)
+        url = f'/products/?cursor={unescape(match.group(1))}' if match else None
+    return pages
+
+
+def json_pages(client):
+    params, pages = {'fields': FIELDS, 'limit': 500}, 0
+    while True:
+        body = client.get('/api/products/', params).json()
+        pages += 1
+        if not body['next']:
+            return pages
+        params['cursor'] = body['next']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--skus', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        Product.objects.bulk_create([
+            Product(sku=f'SKU-{i:05d}', name=f'Product {i}', category=f'Category {i % 9}', cost_price=5, selling_price=9, stock_qty=50)
+            for i in range(args.products)
+        ])
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(User.objects.create_superuser('bench', password='bench'))
+        skus = ','.join(f'SKU-{i:05d}' for i in random.Random(1).sample(range(args.products), args.skus))
+        bulk = {'fields': FIELDS, 'sku': skus}
+        etag = client.get('/api/products/', bulk)['ETag']
+
+        def revalidate():
+            response = client.get('/api/products/', bulk, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 304
+
+        cases = [
+            ('html scrape', args.products, lambda: scrape(client)),
+            ('json pages', args.products, lambda: json_pages(client)),
+            ('json bulk', args.skus, lambda: client.get('/api/products/', bulk)),
+            ('json 304', args.skus, revalidate),
+        ]
+        rows = []
+        for name, count, func in cases:
+            func()
+            queries = count_queries(func)
+            timing = summarize(measure(func, args.repeat))
+            rows.append([name, count, queries, timing['p50_ms'], f'{count / timing["p50_ms"] * 1000:,.0f}'])
+    print(f"{args.products} products, p50 over {args.repeat} runs")
+    print_table(['method', 'products', 'queries', 'p50 ms', 'products/s'], rows)
+
+
+if __name__ == '__main__':
+    main()
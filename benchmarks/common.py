@@ -0,0 +1,75 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks never touch ``db.sqlite3``: they run against a throwaway copy of
+the test database, created before and destroyed after each run, with a
+cache file of their own. Run them
+from the project root, e.g. ``python -m benchmarks.search``.
+"""
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'simple_erp.settings')
+django.setup()
+
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+
+
+@contextlib.contextmanager
+def private_cache():
+    """Point the default cache at a temporary file for the duration."""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = {**settings.CACHES['default'], 'LOCATION': os.path.join(directory, 'benchmark.cache')}
+        with override_settings(CACHES={**settings.CACHES, 'default': cache}):
+            yield
+
+
+@contextlib.contextmanager
+def benchmark_database():
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with private_cache():
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func, repeat=20):
+    """Call ``func`` ``repeat`` times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(timings):
+    return {
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+    }
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers, ['-' * width for width in widths], *rows]:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,105 @@
+"""
+Streaming export: peak memory and throughput as the table grows.
+
+    python -m benchmarks.export --rows 100000 1000000 3000000
+
+Peak memory (traced Python allocations) is measured while the whole stream
+is consumed, and compared with loading the same rows into a list first, as
+the export used to. Throughput is timed in a separate run without tracing.
+"""
+import argparse
+import datetime
+import time
+import tracemalloc
+
+from benchmarks.common import benchmark_database, print_table
+
+from django.db import connection, transaction
+
+from erp import exports
+from erp.models import Product
+
+BATCH = 50_000
+
+
+def seed(count, start=0):
+    products = list(Product.objects.values_list('pk', flat=True))
+    first = datetime.datetime(2026, 1, 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(start, count, BATCH):
+            cursor.executemany(
+                "INSERT INTO erp_stockmovement (product_id, qty, timestamp, notes) VALUES (%s, %s, %s, %s)",
+                [
+                    (products[i % len(products)], -(i % 9 + 1), first + datetime.timedelta(seconds=i * 7), f"Order ORD-{i:07d} Confirmed")
+                    for i in range(offset, min(offset + BATCH, count))
+                ],
+            )
+
+
+def consume(chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+def stream(fmt):
+    export = exports.EXPORTS['stock-movements']
+    return exports.FORMATS[fmt][0](export.headers, export.queryset())
+
+
+class RowList(list):
+    """A list that quacks like the queryset ``stream_*`` iterate over."""
+
+    def iterator(self, chunk_size=None):
+        return iter(self)
+
+
+def materialized(fmt):
+    export = exports.EXPORTS['stock-movements']
+    return exports.FORMATS[fmt][0](export.headers, RowList(export.queryset()))
+
+
+def peak_mb(func):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        consume(func())
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000, 3_000_000])
+    parser.add_argument('--formats', nargs='+', choices=sorted(exports.FORMATS), default=['csv', 'xlsx'])
+    parser.add_argument('--baseline-limit', type=int, default=1_000_000,
+                        help="Skip the materialized baseline above this many rows.")
+    args = parser.parse_args()
+
+    with benchmark_database():
+        Product.objects.bulk_create([
+            Product(sku=f'SKU-{i:04d}', name=f'Product {i}', category='General', cost_price=1, selling_price=2, stock_qty=0)
+            for i in range(1000)
+        ])
+        table = []
+        seeded = 0
+        for count in sorted(args.rows):
+            seed(count, seeded)
+            seeded = count
+            for fmt in args.formats:
+                start = time.perf_counter()
+                size = consume(stream(fmt))
+                elapsed = time.perf_counter() - start
+                baseline = peak_mb(lambda: materialized(fmt)) if count <= args.baseline_limit else '-'
+                table.append([
+                    count, fmt, round(size / 2**20, 1), round(elapsed, 1), f'{count / elapsed:,.0f}',
+                    peak_mb(lambda: stream(fmt)), baseline,
+                ])
+        print("stock-movements export, whole stream consumed")
+        print_table(['rows', 'format', 'output MB', 'seconds', 'rows/s', 'peak MB', 'list() peak MB'], table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Overhead of ``erp.instrumentation`` on real page requests.
+
+    python -m benchmarks.instrumentation --rounds 10 --repeat 50
+
+Each page is requested through the test client with the middleware and the
+timed template backend switched on and off. The two configurations
+alternate, in both orders, round by round so that cache warm-up and machine
+noise hit both alike; the overhead is the difference of the medians. A new
+client is made for every round because a client builds its middleware chain
+once, on its first request.
+"""
+import argparse
+import random
+
+from benchmarks.common import benchmark_database, measure, percentile, print_table
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import Client, override_settings
+
+from erp import orders
+from erp.models import Customer, Product
+
+PAGES = ['/dashboard/', '/products/', '/customers/', '/orders/', '/products/?q=product']
+
+
+def plain_settings():
+    middleware = [name for name in settings.MIDDLEWARE if not name.startswith('erp.instrumentation.')]
+    templates = [dict(engine, BACKEND='django.template.backends.django.DjangoTemplates') for engine in settings.TEMPLATES]
+    return override_settings(MIDDLEWARE=middleware, TEMPLATES=templates)
+
+
+def seed(count):
+    rng = random.Random(1)
+    products = Product.objects.bulk_create([
+        Product(sku=f'SKU-{i:05d}', name=f'Product {i}', category=f'Category {i % 9}',
+                cost_price=5, selling_price=9, stock_qty=rng.randint(100, 150))
+        for i in range(count)
+    ])
+    customers = Customer.objects.bulk_create([
+        Customer(code=f'Cust-{i:05d}', name=f'Customer {i}', phone='555-0100', address='1 Bench Road')
+        for i in range(count)
+    ])
+    orders.create_orders([
+        (rng.choice(customers), rng.choice(['PENDING', 'CONFIRMED']),
+         [(product, rng.randint(1, 3)) for product in rng.sample(products, 3)])
+        for _ in range(count)
+    ])
+    return User.objects.create_superuser('bench', password='bench')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        user = seed(args.rows)
+        timings = {(page, on): [] for page in PAGES for on in (False, True)}
+        for round_number in range(args.rounds):
+            for on in ((False, True) if round_number % 2 else (True, False)):
+                with (override_settings() if on else plain_settings()):
+                    client = Client(HTTP_HOST='localhost')
+                    client.force_login(user)
+                    for page in PAGES:
+                        client.get(page)
+                        timings[page, on] += measure(lambda: client.get(page), args.repeat)
+
+        rows = []
+        for page in PAGES:
+            off, on = percentile(timings[page, False], 50), percentile(timings[page, True], 50)
+            rows.append([page, f'{off:.2f}', f'{on:.2f}', f'{on - off:+.3f}', f'{(on - off) / off * 100:+.1f}%'])
+        print_table(['page', 'off p50 ms', 'on p50 ms', 'delta ms', 'overhead'], rows)
+
+
+if __name__ == '__main__':
+    main()
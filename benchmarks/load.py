@@ -0,0 +1,339 @@
+"""
+End-to-end load benchmark: concurrent Sales User and Admin sessions against
+a locally started server.
+
+    python -m benchmarks.load --clients 8 --duration 30 --admin-share 0.25
+    python -m benchmarks.load --compare before.json after.json
+
+A throwaway database is seeded (``--products``, ``--customers``,
+``--orders``), the roles from ``create_roles.py`` are created, and the app is
+served by ``benchmarks.server`` in a separate process. Each client logs in
+as a Sales User or an Admin and runs that role's weighted mix of requests
+(``MIXES``) until the time is up. Throughput, p50/p95/p99 latency and SQL
+queries per request are reported per action and overall, and saved as JSON
+(``--output``) so that runs can be compared with ``--compare``.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.cookies import SimpleCookie
+from pathlib import Path
+from urllib.parse import urlencode
+
+from benchmarks.common import benchmark_database, print_table, summarize
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.db import connection
+
+from erp import orders
+from erp.models import Customer, Product, SalesOrder
+
+PASSWORD = 'load-test'
+WORDS = ['dell', 'laptop', 'monitor', 'cable', 'mouse', 'keyboard', 'phone', 'tablet', 'charger',
+         'wireless', 'pro', 'mini', 'ultra', 'stand', 'dock', 'case', 'printer', 'router']
+CATEGORIES = ['Electronics', 'Accessories', 'Networking', 'Office', 'Audio']
+
+# Weighted actions per role. Sales Users cannot change order status.
+MIXES = {
+    'sales': {'dashboard': 3, 'product-search': 4, 'order-list': 3, 'order-create': 2},
+    'admin': {'dashboard': 2, 'product-search': 1, 'order-list': 2, 'order-confirm': 3, 'order-cancel': 1},
+}
+
+
+def seed(args):
+    rng = random.Random(1)
+    products = Product.objects.bulk_create([
+        Product(sku=f'SKU-{i:06d}', name=' '.join(rng.choice(WORDS).title() for _ in range(3)),
+                category=rng.choice(CATEGORIES), cost_price=5, selling_price=rng.randint(6, 500), stock_qty=10**6)
+        for i in range(args.products)
+    ], batch_size=5000)
+    customers = Customer.objects.bulk_create([
+        Customer(code=f'Cust-{i:06d}', name=f'Customer {i}', phone='555-0100', address='1 Load Street')
+        for i in range(args.customers)
+    ], batch_size=5000)
+    for start in range(0, args.orders, 1000):
+        orders.create_orders([
+            (rng.choice(customers), 'CONFIRMED' if rng.random() < 0.3 else 'PENDING',
+             [(product, rng.randint(1, 5)) for product in rng.sample(products, rng.randint(1, 4))])
+            for _ in range(min(1000, args.orders - start))
+        ])
+
+    import create_roles
+    create_roles.create_roles()
+    groups = {'sales': Group.objects.get(name='Sales User'), 'admin': Group.objects.get(name='Admin')}
+    users = {'sales': [], 'admin': []}
+    for i in range(args.clients):
+        role = 'admin' if i < round(args.clients * args.admin_share) else 'sales'
+        username = f'load-{role}-{i}'
+        # Not superusers: every request checks the role's permissions.
+        user = User.objects.create_user(username, password=PASSWORD)
+        user.groups.add(groups[role])
+        users[role].append(username)
+    return users
+
+
+class OrderPool:
+    """Order ids shared by the admin clients, so each confirm/cancel changes a status."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = list(SalesOrder.objects.filter(status='PENDING').values_list('pk', flat=True))
+        self.confirmed = list(SalesOrder.objects.filter(status='CONFIRMED').values_list('pk', flat=True))
+        self.product_ids = list(Product.objects.values_list('pk', flat=True))
+        self.customer_ids = list(Customer.objects.values_list('pk', flat=True))
+
+    def take(self, status, rng):
+        source = self.pending if status == 'PENDING' else self.confirmed
+        with self.lock:
+            if not source:
+                return None
+            index = rng.randrange(len(source))
+            source[index], source[-1] = source[-1], source[index]
+            return source.pop()
+
+    def put(self, status, pk):
+        with self.lock:
+            (self.pending if status == 'PENDING' else self.confirmed).append(pk)
+
+
+class Client:
+    def __init__(self, port):
+        self.port = port
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, form=None):
+        headers = {'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items())}
+        body = None
+        if form is not None:
+            body = urlencode(form, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.cookies.get('csrftoken', '')
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                start = time.perf_counter()
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+                elapsed = (time.perf_counter() - start) * 1000
+                break
+            except (http.client.HTTPException, OSError):
+                # The server closed the kept-alive connection; retry once on a new one.
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return response.status, elapsed, int(response.getheader('X-SQL-Queries', '-1'))
+
+    def login(self, username):
+        self.request('GET', '/login/')
+        status, elapsed, queries = self.request('POST', '/login/', {'username': username, 'password': PASSWORD})
+        if status != 302:
+            raise RuntimeError(f"Login as {username} failed with HTTP {status}")
+
+
+def run_action(client, action, pool, rng):
+    """Perform one action; returns ``(status, ms, queries)`` or None if there was nothing to do."""
+    if action == 'dashboard':
+        return client.request('GET', '/')
+    if action == 'product-search':
+        return client.request('GET', '/products/?' + urlencode({'q': rng.choice(WORDS)}))
+    if action == 'order-list':
+        return client.request('GET', '/orders/')
+    if action == 'order-create':
+        lines = rng.sample(pool.product_ids, rng.randint(1, 5))
+        form = {'customer': rng.choice(pool.customer_ids), 'items-TOTAL_FORMS': len(lines), 'items-INITIAL_FORMS': 0}
+        for i, pk in enumerate(lines):
+            form.update({f'items-{i}-product': pk, f'items-{i}-qty': rng.randint(1, 5)})
+        return client.request('POST', '/orders/add/', form)
+    source, target, verb = {
+        'order-confirm': ('PENDING', 'CONFIRMED', 'confirm'),
+        'order-cancel': ('CONFIRMED', 'CANCELLED', 'cancel'),
+    }[action]
+    pk = pool.take(source, rng)
+    if pk is None:
+        return None
+    result = client.request('GET', f'/orders/{pk}/status/{verb}/')
+    if target == 'CONFIRMED':
+        pool.put('CONFIRMED', pk)
+    return result
+
+
+def drive(port, role, username, pool, seed, warmup_until, stop_at, results, errors):
+    rng = random.Random(seed)
+    actions, weights = zip(*MIXES[role].items())
+    client = Client(port)
+    try:
+        client.login(username)
+        while time.monotonic() < stop_at:
+            action = rng.choices(actions, weights)[0]
+            result = run_action(client, action, pool, rng)
+            if result is not None and time.monotonic() >= warmup_until:
+                results.append((role, action, time.monotonic(), *result))
+    except Exception as exc:
+        errors.append(f"{username}: {exc!r}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database, asgi=False):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.server', str(database), str(port), *(['--asgi'] if asgi else []),
+         '--cache', str(settings.CACHES['default']['LOCATION'])],
+        cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server, port
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("The benchmark server exited on startup.")
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("The benchmark server did not start.")
+
+
+def summarize_results(rows, seconds):
+    timings = [ms for ms, queries, status in rows]
+    queries = [queries for ms, queries, status in rows if queries >= 0]
+    return {
+        'requests': len(rows),
+        'errors': sum(1 for ms, queries, status in rows if status >= 400),
+        'throughput_rps': round(len(rows) / seconds, 1),
+        **summarize(timings),
+        'sql_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'sql_max': max(queries) if queries else None,
+    }
+
+
+def report(results, seconds):
+    def rows(keep):
+        return [(ms, queries, status) for role, action, at, status, ms, queries in results if keep(role, action)]
+
+    summary = {'overall': summarize_results(rows(lambda role, action: True), seconds), 'actions': {}}
+    for role, mix in MIXES.items():
+        for action in mix:
+            selected = rows(lambda r, a: (r, a) == (role, action))
+            if selected:
+                summary['actions'][f'{role}:{action}'] = summarize_results(selected, seconds)
+    return summary
+
+
+def print_summary(summary):
+    headers = ['action', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'SQL/req', 'SQL max']
+    table = []
+    for name, stats in [*summary['actions'].items(), ('overall', summary['overall'])]:
+        table.append([name, stats['requests'], stats['errors'], stats['throughput_rps'], stats['p50_ms'],
+                      stats['p95_ms'], stats['p99_ms'], stats['sql_per_request'], stats['sql_max']])
+    print_table(headers, table)
+
+
+def compare(before_path, after_path):
+    before, after = (json.loads(Path(path).read_text()) for path in (before_path, after_path))
+    metrics = ['throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'sql_per_request']
+    table = []
+    pairs = [(name, before['results']['actions'][name], stats)
+             for name, stats in after['results']['actions'].items() if name in before['results']['actions']]
+    pairs.append(('overall', before['results']['overall'], after['results']['overall']))
+    for name, old, new in pairs:
+        row = [name]
+        for metric in metrics:
+            if old.get(metric) in (None, 0) or new.get(metric) is None:
+                row.append(f"{old.get(metric)} -> {new.get(metric)}")
+            else:
+                row.append(f"{old[metric]} -> {new[metric]} ({(new[metric] - old[metric]) / old[metric] * 100:+.0f}%)")
+        table.append(row)
+    print_table(['action', *metrics], table)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--admin-share', type=float, default=0.25, help="Share of the clients logged in as Admin.")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of measured load.")
+    parser.add_argument('--warmup', type=float, default=3, help="Seconds of load before measuring.")
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/load-<time>.json).")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two result files and exit.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    started = datetime.datetime.now()
+    with benchmark_database():
+        users = seed(args)
+        pool = OrderPool()
+        database = connection.settings_dict['NAME']
+        connection.close()
+        server, port = start_server(database)
+        try:
+            results, errors, threads = [], [], []
+            warmup_until = time.monotonic() + args.warmup
+            stop_at = warmup_until + args.duration
+            for i, (role, username) in enumerate((role, name) for role, names in users.items() for name in names):
+                threads.append(threading.Thread(
+                    target=drive, args=(port, role, username, pool, args.seed + i, warmup_until, stop_at, results, errors),
+                ))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    for error in errors:
+        print(error, file=sys.stderr)
+    summary = report(results, args.duration)
+    print(f"{args.clients} clients ({len(users['admin'])} admin), {args.duration:g}s measured after {args.warmup:g}s warm-up; "
+          f"{args.products} products, {args.customers} customers, {args.orders} orders")
+    print_summary(summary)
+
+    output = Path(args.output or Path(settings.BASE_DIR) / 'benchmarks' / 'results' / f"load-{started:%Y%m%d-%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    output.write_text(json.dumps({
+        'started': started.isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': config,
+        'client_errors': errors,
+        'results': summary,
+    }, indent=2))
+    print(f"Saved {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Order creation throughput: the old save-per-line view logic versus
+``erp.orders.create_order()``.
+
+    python -m benchmarks.order_create --orders 50 --lines 1 10 50 200
+"""
+import argparse
+import time
+
+from benchmarks.common import benchmark_database, print_table
+
+from django.db import connection, transaction
+
+from erp import orders
+from erp.models import Customer, Product, SalesOrder, SalesOrderItem
+
+
+def create_per_line(customer, lines):
+    # What order_create_view used to do: save the order, every item (reading
+    # its product's price lazily), then the order again with the total.
+    with transaction.atomic():
+        order = SalesOrder(customer=customer)
+        order.save()
+        total = 0
+        for product_id, qty in lines:
+            item = SalesOrderItem(order=order, product_id=product_id, qty=qty)
+            item.price = item.product.selling_price
+            item.save()
+            total += item.total
+        order.total_amount = total
+        order.save()
+
+
+def create_batched(customer, lines):
+    # What the view does now: the formset loads the products in one query.
+    products = Product.objects.only('sku', 'name', 'selling_price', 'cost_price').in_bulk([pk for pk, qty in lines])
+    orders.create_order(customer, [(products[pk], qty) for pk, qty in lines])
+
+
+def run(func, customer, lines, count):
+    queries = 0
+
+    def counter(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        for _ in range(count):
+            func(customer, lines)
+        elapsed = time.perf_counter() - start
+    return queries / count, count * len(lines) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=50)
+    parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 50, 200])
+    args = parser.parse_args()
+
+    with benchmark_database():
+        customer = Customer.objects.create(code='C-1', name='Customer', phone='555-0100', address='1 Road')
+        products = Product.objects.bulk_create([
+            Product(sku=f'SKU-{i}', name=f'Product {i}', category='General', cost_price=5, selling_price=10, stock_qty=10**6)
+            for i in range(max(args.lines))
+        ])
+        rows = []
+        for count in args.lines:
+            lines = [(product.pk, 1 + i % 5) for i, product in enumerate(products[:count])]
+            before_queries, before_rate = run(create_per_line, customer, lines, args.orders)
+            after_queries, after_rate = run(create_batched, customer, lines, args.orders)
+            rows.append([count, round(before_queries, 1), round(after_queries, 1),
+                         f'{before_rate:,.0f}', f'{after_rate:,.0f}', f'{after_rate / before_rate:.1f}x'])
+    print(f"{args.orders} orders per size; queries are per order")
+    print_table(['lines', 'queries before', 'queries after', 'lines/s before', 'lines/s after', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Queries per save: re-fetching the stored row in pre_save versus tracking the
+loaded values in memory.
+
+    python -m benchmarks.order_saves
+
+"Before" is emulated by dropping the remembered values before each save,
+which makes the save handlers fall back to reading the row, as they always
+did before tracking.
+"""
+import argparse
+
+from benchmarks.common import benchmark_database, print_table
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from erp.models import Customer, Product, SalesOrder, SalesOrderItem
+
+
+def forget(instance, refetch):
+    if refetch:
+        instance._loaded_values = {}
+    return instance
+
+
+def count(func):
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def scenarios(customer, product, refetch):
+    def create_order():
+        # What order_create_view does: save the order, its items, then the total.
+        order = forget(SalesOrder(customer=customer), refetch)
+        order.save()
+        item = SalesOrderItem(order=order, product=product, qty=1, price=product.selling_price)
+        item.save()
+        order.total_amount = item.total
+        forget(order, refetch).save()
+
+    def edit_order():
+        order = forget(SalesOrder.objects.latest('pk'), refetch)
+        order.total_amount += 1
+        order.save()
+
+    def confirm_by_save():
+        order = forget(SalesOrder.objects.filter(status='PENDING').latest('pk'), refetch)
+        order.status = 'CONFIRMED'
+        order.save()
+
+    def edit_product():
+        item = forget(Product.objects.get(pk=product.pk), refetch)
+        item.name += '!'
+        item.save()
+
+    return {
+        'create order + save total': create_order,
+        'edit loaded order': edit_order,
+        'confirm via save()': confirm_by_save,
+        'edit loaded product': edit_product,
+    }
+
+
+def main():
+    argparse.ArgumentParser().parse_args()
+    with benchmark_database():
+        customer = Customer.objects.create(code='C-1', name='Customer', phone='555-0100', address='1 Road')
+        product = Product.objects.create(sku='SKU-1', name='Product', category='General', cost_price=5, selling_price=10, stock_qty=10**6)
+        for _ in range(4):
+            scenarios(customer, product, False)['create order + save total']()
+        # Warm up the day's sales rollup row so both runs update it in place.
+        SalesOrder.objects.earliest('pk').confirm()
+
+        before = {name: count(func) for name, func in scenarios(customer, product, True).items()}
+        after = {name: count(func) for name, func in scenarios(customer, product, False).items()}
+
+        order = SalesOrder.objects.filter(status='PENDING').latest('pk')
+        after['confirm()'] = count(order.confirm)
+        before['confirm()'] = '-'
+
+    print("Queries per operation, including loading the instance")
+    print_table(['operation', 'before (re-fetch)', 'after (tracked)'], [[name, before[name], after[name]] for name in after])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Sales report latency against the length of the reported period.
+
+    python -m benchmarks.sales_report --products 500 --years 3
+
+The report reads only the daily rollups, so its cost follows the number of
+(day, product) rows in the range; how many orders were rolled up into them
+does not matter.
+"""
+import argparse
+import datetime
+import random
+
+from benchmarks.common import benchmark_database, measure, print_table, summarize
+
+from erp import analytics
+from erp.models import DailySalesRollup, Product
+
+CATEGORIES = ['Laptops', 'Monitors', 'Cables', 'Peripherals', 'Phones', 'Storage', 'Audio', 'Networking']
+
+
+def seed(products, days, end, density):
+    rng = random.Random(1)
+    items = Product.objects.bulk_create([
+        Product(sku=f'SKU-{i:05d}', name=f'Product {i}', category=rng.choice(CATEGORIES),
+                cost_price=5, selling_price=8, stock_qty=0)
+        for i in range(products)
+    ])
+    batch = []
+    for offset in range(days):
+        day = end - datetime.timedelta(days=offset)
+        for product in items:
+            if rng.random() < density:
+                units = rng.randint(1, 20)
+                batch.append(DailySalesRollup(day=day, product=product, units=units, revenue=units * 8, cost=units * 5))
+        if len(batch) >= 20000:
+            DailySalesRollup.objects.bulk_create(batch)
+            batch = []
+    DailySalesRollup.objects.bulk_create(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--density', type=float, default=0.3, help="Share of products sold on a given day.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    end = datetime.date(2026, 10, 18)
+    with benchmark_database():
+        seed(args.products, args.years * 366 * 2, end, args.density)
+        rows = []
+        for days in (30, 90, 365, args.years * 365):
+            start = end - datetime.timedelta(days=days - 1)
+            for group in analytics.GROUPINGS:
+                report = analytics.sales_report(start, end, group)
+                timings = summarize(measure(lambda: analytics.sales_report(start, end, group), args.repeat))
+                rows.append([days, group, report['rows'], timings['p50_ms'], timings['p95_ms']])
+        print(f"{args.products} products, {DailySalesRollup.objects.count()} rollup rows "
+              f"(each report also loads the previous period for comparison)")
+        print_table(['days', 'group', 'rollup rows read', 'p50 ms', 'p95 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Product search: FTS5/trigram index versus the old ``icontains`` filter.
+
+    python -m benchmarks.search --products 200000
+
+The index wins by a wide margin on selective queries, and its cost grows with
+the number of matches rather than with the size of the catalog.
+"""
+import argparse
+import random
+
+from benchmarks.common import benchmark_database, measure, print_table, summarize
+
+from django.db.models import Q
+
+from erp import search
+from erp.models import Product
+
+WORDS = ['dell', 'laptop', 'monitor', 'cable', 'mouse', 'keyboard', 'phone', 'tablet', 'charger',
+         'wireless', 'pro', 'mini', 'ultra', 'stand', 'dock', 'case', 'printer', 'router']
+QUERIES = ['dell', 'wire', 'SKU-0042', 'SKU-01234', 'monitor stand', 'dock mini pro']
+
+
+def seed(count):
+    rng = random.Random(1)
+    batch = []
+    for i in range(count):
+        name = ' '.join(rng.choice(WORDS).title() for _ in range(3))
+        batch.append(Product(sku=f'SKU-{i:06d}', name=name, category=rng.choice(WORDS).title(),
+                             cost_price=1, selling_price=2, stock_qty=rng.randint(0, 500)))
+        if len(batch) == 5000:
+            Product.objects.bulk_create(batch)
+            batch = []
+    Product.objects.bulk_create(batch)
+
+
+def first_page(queryset):
+    # What ProductListView does: count the matches, then fetch one page.
+    return queryset.count(), list(queryset[:10])
+
+
+def like_search(q):
+    return first_page(Product.objects.filter(Q(name__icontains=q) | Q(sku__icontains=q)).order_by('pk'))
+
+
+def index_search(q):
+    return first_page(search.search_products(Product.objects.all(), q))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        seed(args.products)
+        rows = []
+        for q in QUERIES:
+            like = summarize(measure(lambda: like_search(q), args.repeat))
+            index = summarize(measure(lambda: index_search(q), args.repeat))
+            matches = index_search(q)[0]
+            rows.append([q, matches, like['p50_ms'], index['p50_ms'], round(like['p50_ms'] / max(index['p50_ms'], 0.001), 1)])
+        print(f"{args.products} products, count + first page, p50 over {args.repeat} runs")
+        print_table(['query', 'matches', 'LIKE ms', 'index ms', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Confirmation throughput on one hot SKU as its stock is spread over more
+shards (``erp.sharding``).
+
+    python -m benchmarks.shards --threads 8 --orders 400 --shards 0 1 2 4 8
+
+For each shard count, ``--orders`` pending orders for the same product are
+created up front, then ``--threads`` threads confirm them concurrently, each
+in its own transaction and database connection. Shard count 0 is the
+unsharded product row. Confirmations that fail (on SQLite: "database is
+locked" once a thread has waited out the busy timeout) are counted, and the
+stock is checked to add up either way.
+
+On SQLite every write transaction takes the database-wide write lock, so
+the threads queue there whatever the shard count and the rows only show the
+(small) cost of the extra shard queries. The gain is for databases with row
+locks, where confirmations of different home shards no longer wait on one
+another.
+"""
+import argparse
+import queue
+import threading
+import time
+
+from benchmarks.common import benchmark_database, percentile, print_table
+
+from django.db import connection
+
+from erp import orders, sharding
+from erp.models import Customer, Product, SalesOrder
+
+
+def confirm_all(order_ids, threads):
+    pending = queue.Queue()
+    for pk in order_ids:
+        pending.put(pk)
+    timings, errors = [], []
+
+    def worker():
+        try:
+            while True:
+                try:
+                    pk = pending.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.perf_counter()
+                try:
+                    SalesOrder.objects.get(pk=pk).confirm()
+                except Exception as exc:
+                    errors.append(exc)
+                timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, timings, errors
+
+
+def run(customer, shards, args):
+    product = Product.objects.create(sku=f'HOT-{shards}', name='Hot product', category='General',
+                                     cost_price=5, selling_price=10, stock_qty=args.orders * 2)
+    sharding.shard(product, shards)
+    created = orders.create_orders([(customer, 'PENDING', [(product, 1)]) for _ in range(args.orders)])
+    elapsed, timings, errors = confirm_all([order.pk for order in created], args.threads)
+    stock_qty, reserved_qty = sharding.levels([product.pk])[product.pk]
+    confirmed = args.orders - len(errors)
+    assert (stock_qty, reserved_qty) == (2 * args.orders - confirmed, args.orders - confirmed), (stock_qty, reserved_qty)
+    return [shards, f'{confirmed / elapsed:,.0f}', f'{percentile(timings, 50):.2f}', f'{percentile(timings, 99):.2f}', len(errors)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=400)
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with benchmark_database():
+        customer = Customer.objects.create(code='C-1', name='Customer', phone='555-0100', address='1 Road')
+        rows = [run(customer, shards, args) for shards in args.shards]
+    print(f"{args.orders} confirmations of one SKU by {args.threads} threads ({connection.vendor})")
+    print_table(['shards', 'confirms/s', 'p50_ms', 'p99_ms', 'failed'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Static file serving: ``erp.serving.serve`` versus ``django.views.static.serve``.
+
+    python -m benchmarks.static --requests 2000
+
+Both views are called in-process on the same files, so the numbers are the
+per-request cost inside Django, body included. "bytes" is what goes on the
+wire: the old view has no ETag or ranges, so a cached or partial copy still
+costs a full download, and it never sends compressed variants.
+"""
+import argparse
+import os
+import random
+import shutil
+import string
+import tempfile
+
+from benchmarks.common import measure, print_table, summarize
+
+from django.test import RequestFactory
+from django.utils.http import http_date
+from django.views import static as django_static
+
+from erp import serving
+
+FILES = {
+    # name: size in bytes
+    'app.0123456789ab.css': 30_000,
+    'vendor.0123456789ab.js': 300_000,
+    'logo.0123456789ab.png': 60_000,
+}
+
+
+def make_files(root):
+    rng = random.Random(1)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(500)]
+    for name, size in FILES.items():
+        path = os.path.join(root, name)
+        if name.endswith('.png'):
+            data = rng.randbytes(size)
+        else:
+            text = ''
+            while len(text) < size:
+                text += f'.{rng.choice(words)} {{ {rng.choice(words)}: {rng.randint(0, 99)}px; }}\n'
+            data = text[:size].encode()
+        with open(path, 'wb') as f:
+            f.write(data)
+        serving.compress(path)
+
+
+def call(view, request, path, root):
+    response = view(request, path, document_root=root)
+    body = response.streaming_content if response.streaming else [response.content]
+    size = sum(len(chunk) for chunk in body)
+    response.close()
+    return response.status_code, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        make_files(root)
+        factory = RequestFactory()
+        rows = []
+        for name in FILES:
+            path = os.path.join(root, name)
+            etag = serving.metadata.get(path).etag
+            scenarios = [
+                ('full GET', {}),
+                ('GET, gzip accepted', {'HTTP_ACCEPT_ENCODING': 'gzip, deflate, br'}),
+                ('revalidate (ETag / IMS)', {'HTTP_IF_NONE_MATCH': etag,
+                                             'HTTP_IF_MODIFIED_SINCE': http_date(os.stat(path).st_mtime)}),
+                ('Range: first 4 KB', {'HTTP_RANGE': 'bytes=0-4095'}),
+            ]
+            for label, headers in scenarios:
+                request = factory.get(f'/static/{name}', **headers)
+                # Django's view only looks at If-Modified-Since.
+                old_request = factory.get(f'/static/{name}', **{k: v for k, v in headers.items() if k != 'HTTP_IF_NONE_MATCH'})
+                for view_name, view, req in [('django serve', django_static.serve, old_request),
+                                             ('erp.serving', serving.serve, request)]:
+                    status, size = call(view, req, name, root)
+                    timings = measure(lambda: call(view, req, name, root), args.requests)
+                    summary = summarize(timings)
+                    rows.append([name, label, view_name, status, size,
+                                 round(summary['mean_ms'] * 1000), round(summary['p95_ms'] * 1000)])
+        print_table(['file', 'request', 'view', 'status', 'bytes', 'mean_us', 'p95_us'], rows)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
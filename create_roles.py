@@ -11,6 +11,10 @@ from erp.models import Product, Customer, SalesOrder, SalesOrderItem, StockMovem
 def create_roles():
     admin_group, created = Group.objects.get_or_create(name='Admin')
     sales_group, created = Group.objects.get_or_create(name='Sales User')
+
+    # Admin: every permission of the ERP, so admins need not be superusers
+    admin_group.permissions.add(*Permission.objects.filter(content_type__app_label='erp'))
+
     ct_product = ContentType.objects.get_for_model(Product)
     sales_group.permissions.add(Permission.objects.get(codename='view_product', content_type=ct_product))
     
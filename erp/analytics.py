@@ -0,0 +1,127 @@
+"""
+Sales and margin analytics over the daily rollups.
+
+A date range of ``DailySalesRollup`` rows is loaded once into NumPy column
+arrays; group-bys are ``np.unique`` plus ``np.bincount``, daily series are
+dense arrays with one slot per day and moving averages come from cumulative
+sums. The work is proportional to the number of rollup rows in the range
+(days x products sold), not to the number of orders behind them.
+"""
+import datetime
+
+import numpy as np
+from django.db.models import CharField, FloatField
+from django.db.models.functions import Cast
+
+from .models import DailySalesRollup, Product
+
+GROUPINGS = ('category', 'product', 'day')
+MAX_GROUPS = 50
+
+
+def _ratio(numerator, denominator):
+    return float(numerator) / float(denominator) * 100 if denominator else None
+
+
+def _figures(units, revenue, cost):
+    margin = revenue - cost
+    return {
+        'units': int(units), 'revenue': float(revenue), 'cost': float(cost),
+        'margin': float(margin), 'margin_pct': _ratio(margin, revenue),
+    }
+
+
+def moving_average(values, window):
+    """Trailing mean over ``window`` slots; the first slots average what is available."""
+    values = np.asarray(values, dtype=np.float64)
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+class SalesData:
+    """Rollup rows for ``date_from``..``date_to`` (inclusive) as column arrays."""
+
+    def __init__(self, date_from, date_to):
+        self.date_from = date_from
+        self.date_to = date_to
+        # Days come back as ISO strings and money as floats: NumPy parses those
+        # in bulk, far faster than building date and Decimal objects row by row.
+        rows = (
+            DailySalesRollup.objects.filter(day__range=(date_from, date_to)).order_by()
+            .values_list(Cast('day', CharField()), 'product_id', 'product__category', 'units',
+                         Cast('revenue', FloatField()), Cast('cost', FloatField()))
+        )
+        columns = list(zip(*rows)) or [()] * 6
+        self.day = np.array(columns[0], dtype='datetime64[D]')
+        self.product = np.array(columns[1], dtype=np.int64)
+        self.category = np.array(columns[2], dtype=str)
+        self.units = np.array(columns[3], dtype=np.int64)
+        self.revenue = np.array(columns[4], dtype=np.float64)
+        self.cost = np.array(columns[5], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.day)
+
+    def _mask(self, date_from, date_to):
+        return (self.day >= np.datetime64(date_from, 'D')) & (self.day <= np.datetime64(date_to, 'D'))
+
+    def totals(self, date_from=None, date_to=None):
+        mask = self._mask(date_from or self.date_from, date_to or self.date_to)
+        return _figures(self.units[mask].sum(), self.revenue[mask].sum(), self.cost[mask].sum())
+
+    def group_by(self, key, date_from=None, date_to=None):
+        """Totals per ``key`` (one of ``GROUPINGS``) as ``[(label, figures)]``, by revenue or by day."""
+        mask = self._mask(date_from or self.date_from, date_to or self.date_to)
+        labels, inverse = np.unique(getattr(self, key)[mask], return_inverse=True)
+        sums = [np.bincount(inverse, weights=values[mask], minlength=len(labels)) for values in (self.units, self.revenue, self.cost)]
+        order = np.arange(len(labels)) if key == 'day' else np.argsort(-sums[1], kind='stable')
+        return [(labels[i].item(), _figures(sums[0][i], sums[1][i], sums[2][i])) for i in order]
+
+    def daily(self, measure, date_from=None, date_to=None):
+        """Dense per-day series of ``measure`` (``units``, ``revenue``, ``cost`` or ``margin``)."""
+        date_from, date_to = date_from or self.date_from, date_to or self.date_to
+        mask = self._mask(date_from, date_to)
+        values = self.revenue - self.cost if measure == 'margin' else getattr(self, measure)
+        offsets = (self.day[mask] - np.datetime64(date_from, 'D')).astype(np.int64)
+        return np.bincount(offsets, weights=values[mask], minlength=(date_to - date_from).days + 1)
+
+
+def change(current, previous):
+    """Percentage change of every figure from ``previous`` to ``current``."""
+    return {name: _ratio(current[name] - previous[name], abs(previous[name])) for name in ('units', 'revenue', 'cost', 'margin')}
+
+
+def sales_report(date_from, date_to, group='category', window=7):
+    """
+    Everything the sales report shows for a period: totals compared with the
+    period of the same length just before it, totals per ``group`` and, per
+    day, revenue with its ``window``-day moving average.
+    """
+    length = date_to - date_from + datetime.timedelta(days=1)
+    previous_from, previous_to = date_from - length, date_from - datetime.timedelta(days=1)
+    data = SalesData(previous_from, date_to)
+    current = data.totals(date_from, date_to)
+    previous = data.totals(previous_from, previous_to)
+
+    groups = data.group_by(group, date_from, date_to)
+    if group == 'product':
+        groups = groups[:MAX_GROUPS]
+        products = Product.objects.only('sku', 'name').in_bulk([label for label, figures in groups])
+        groups = [(products[label], figures) for label, figures in groups]
+
+    # The moving average also covers the first days using the previous period.
+    revenue = data.daily('revenue', previous_from, date_to)
+    trend = moving_average(revenue, window)[len(revenue) - length.days:]
+    days = [date_from + datetime.timedelta(days=offset) for offset in range(length.days)]
+    return {
+        'current': current,
+        'previous': previous,
+        'change': change(current, previous),
+        'previous_from': previous_from,
+        'previous_to': previous_to,
+        'groups': groups,
+        'daily': list(zip(days, revenue[-length.days:].tolist(), trend.tolist())),
+        'rows': len(data),
+    }
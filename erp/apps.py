@@ -5,4 +5,5 @@ class ErpConfig(AppConfig):
     name = 'erp'
 
     def ready(self):
+        import erp.instrumentation
         import erp.signals
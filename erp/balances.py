@@ -0,0 +1,143 @@
+"""
+Customer balances and statements.
+
+``Customer.balance`` is what the customer owes: the opening balance plus
+the totals of their confirmed orders. It is kept up to date by ``post()``,
+which appends ``CustomerLedgerEntry`` rows - each carrying the balance
+after it - and sets the new balance, in a fixed number of queries however
+many entries are posted. Confirming an order posts its total and
+cancelling a confirmed order posts it back, in the same transaction as the
+stock change (see ``erp.orders``); creating a customer or editing their
+opening balance posts the difference (see ``erp.signals``).
+
+A statement over a date range reads the last entry before the range for
+the opening balance and then the entries in the range: nothing is summed,
+however long the customer's history. ``reconcile()`` (``manage.py
+reconcile_balances``) recomputes every balance from the orders with one
+aggregate query and posts an adjustment for any drift.
+"""
+import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Customer, CustomerLedgerEntry
+from . import versions
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+ZERO = Decimal('0.00')
+
+
+def post(entries):
+    """
+    Post ``[(customer_id, amount, order_id, notes), ...]`` in order.
+    Returns ``{customer_id: balance}`` after the entries.
+    """
+    entries = [entry for entry in entries if entry[1]]
+    if not entries:
+        return {}
+    customer_ids = sorted({customer_id for customer_id, amount, order_id, notes in entries})
+    with transaction.atomic():
+        # Locked in primary key order, like products in erp.stock.
+        balances = dict(
+            Customer.objects.select_for_update().filter(pk__in=customer_ids)
+            .order_by('pk').values_list('pk', 'balance')
+        )
+        rows = []
+        for customer_id, amount, order_id, notes in entries:
+            balances[customer_id] += amount
+            rows.append(CustomerLedgerEntry(customer_id=customer_id, order_id=order_id, amount=amount,
+                                            balance=balances[customer_id], notes=notes))
+        CustomerLedgerEntry.objects.bulk_create(rows)
+        Customer.objects.filter(pk__in=customer_ids).update(balance=Case(
+            *[When(pk=pk, then=Value(balance, output_field=MONEY)) for pk, balance in balances.items()],
+            default=F('balance'),
+            output_field=MONEY,
+        ))
+        # update() sends no signals.
+        versions.bump(Customer)
+    return balances
+
+
+def post_orders(orders, sign=1):
+    """Charge confirmed ``orders`` to their customers (``sign=-1`` credits them back)."""
+    verb = 'Confirmed' if sign > 0 else 'Cancelled'
+    return post([
+        (order.customer_id, sign * order.total_amount, order.pk, f"Order {order.order_number} {verb}")
+        for order in orders
+    ])
+
+
+def expected_balances(queryset=None):
+    """Customers annotated with ``expected``: the opening balance plus their confirmed orders."""
+    queryset = Customer.objects.all() if queryset is None else queryset
+    confirmed = Sum('salesorder__total_amount', filter=Q(salesorder__status='CONFIRMED'))
+    return queryset.annotate(expected=F('opening_balance') + Coalesce(confirmed, Value(ZERO), output_field=MONEY))
+
+
+def _drift(queryset):
+    # Compared in Python: SQLite sums decimals as floats, which an equality test in SQL would trip over.
+    rows = expected_balances(queryset).order_by('pk').values_list('pk', 'balance', 'expected')
+    drift = {}
+    for pk, balance, expected in rows.iterator():
+        expected = Decimal(str(expected)).quantize(ZERO)
+        if balance != expected:
+            drift[pk] = (balance, expected)
+    return drift
+
+
+def reconcile(dry_run=False):
+    """
+    Compare every balance with the orders and post the difference. Returns
+    ``{customer_id: (stored, expected)}`` for the customers that drifted.
+    """
+    drift = _drift(Customer.objects.all())
+    if not drift or dry_run:
+        return drift
+    with transaction.atomic():
+        # Lock the drifted customers, then look again: an order confirmed in
+        # between changes both figures.
+        locked = Customer.objects.select_for_update().filter(pk__in=list(drift)).order_by('pk')
+        list(locked.values_list('pk', flat=True))
+        drift = _drift(Customer.objects.filter(pk__in=list(drift)))
+        post([(pk, expected - balance, None, "Reconciliation adjustment") for pk, (balance, expected) in drift.items()])
+    return drift
+
+
+class Statement:
+    def __init__(self, customer, date_from, date_to, opening_balance, entries):
+        self.customer = customer
+        self.date_from = date_from
+        self.date_to = date_to
+        self.opening_balance = opening_balance
+        self.entries = entries
+
+    @property
+    def closing_balance(self):
+        return self.entries[-1].balance if self.entries else self.opening_balance
+
+    @property
+    def charges(self):
+        return sum((entry.charge for entry in self.entries if entry.charge), ZERO)
+
+    @property
+    def credits(self):
+        return sum((entry.credit for entry in self.entries if entry.credit), ZERO)
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def statement(customer, date_from, date_to):
+    """The customer's entries between two dates (inclusive), with the balances before and after."""
+    entries = CustomerLedgerEntry.objects.filter(customer=customer).order_by('timestamp', 'id')
+    before = entries.filter(timestamp__lt=_start_of(date_from)).order_by('-timestamp', '-id').values_list('balance', flat=True).first()
+    in_range = list(
+        entries.filter(timestamp__gte=_start_of(date_from), timestamp__lt=_start_of(date_to + datetime.timedelta(days=1)))
+        .select_related('order')
+    )
+    return Statement(customer, date_from, date_to, before if before is not None else ZERO, in_range)
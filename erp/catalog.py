@@ -0,0 +1,137 @@
+"""
+Read-only JSON catalog of products and customers, for the storefront and
+POS terminals that used to scrape the HTML lists.
+
+    GET /api/products/?fields=sku,selling_price,available_qty&limit=200
+    GET /api/products/?fields=sku,available_qty&sku=USB-C,MOUSE
+    GET /api/customers/?code=Cust-001&code=Cust-002
+
+* ``fields`` picks the fields returned (all by default); only their columns
+  are selected.
+* ``sku`` (``code`` for customers) fetches up to ``MAX_KEYS`` rows by key
+  with one query, in the order asked for; keys that match nothing are
+  listed in ``missing``.
+* Otherwise rows come in primary key order, ``limit`` per page, with keyset
+  pagination (``erp.pagination``): pass ``next`` or ``previous`` back as
+  ``cursor``. ``count=1`` adds the total.
+
+Every response carries a strong ``ETag`` made of the query and the version
+of the table (``erp.versions``), which changes with any row of it. A
+request whose ``If-None-Match`` still matches is answered 304 from the cache
+alone, without reading the table.
+
+The stock of a sharded product is as of the last rebalance (see
+``erp.sharding``).
+"""
+import hashlib
+import json
+
+from .models import Customer, Product
+from .pagination import CursorPaginator
+from . import versions
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+MAX_KEYS = 500
+
+
+class Catalog:
+    def __init__(self, model, key, fields):
+        self.model = model
+        self.key = key
+        # {field: the columns it is computed from}
+        self.fields = fields
+
+    @property
+    def permission(self):
+        return f'{self.model._meta.app_label}.view_{self.model._meta.model_name}'
+
+    def parse(self, params):
+        """
+        Validate a query string (a ``QueryDict``) into ``(fields, keys, cursor,
+        limit, with_count)``. Raises ValueError with a message for the client,
+        or ``erp.pagination.InvalidCursor``.
+        """
+        fields = [name.strip() for value in params.getlist('fields') for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown field {unknown[0]!r}; choose from {', '.join(self.fields)}.")
+        fields = list(dict.fromkeys(fields)) or list(self.fields)
+
+        keys = [key.strip() for value in params.getlist(self.key) for key in value.split(',') if key.strip()]
+        keys = list(dict.fromkeys(keys))
+        if len(keys) > MAX_KEYS:
+            raise ValueError(f"At most {MAX_KEYS} {self.key} values per request.")
+
+        try:
+            limit = int(params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ValueError("limit must be a number.")
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}.")
+        cursor = params.get('cursor') or None
+        if cursor:
+            self.paginator(self.model.objects.all(), limit).decode(cursor)
+        return fields, keys, cursor, limit, params.get('count') == '1'
+
+    def etag(self, query):
+        """A strong ETag for ``query`` over the current version of the table."""
+        # Read before the rows: a change committed in between moves the
+        # version on, so the ETag can only be too old, never too new.
+        version, = versions.versions(self.model)
+        payload = json.dumps([self.model._meta.label_lower, version, *query], separators=(',', ':'))
+        return '"%s"' % hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def paginator(self, queryset, limit):
+        return CursorPaginator(queryset, ['id'], limit)
+
+    def _row(self, obj, fields):
+        return {name: getattr(obj, name) for name in fields}
+
+    def fetch(self, query):
+        """The response body for ``query``, as validated by ``parse()``."""
+        fields, keys, cursor, limit, with_count = query
+        columns = {column for name in fields for column in self.fields[name]}
+        if keys:
+            columns.add(self.key)
+        queryset = self.model.objects.only(*sorted(columns))
+        if keys:
+            found = {getattr(obj, self.key): obj for obj in queryset.filter(**{f'{self.key}__in': keys})}
+            return {
+                'results': [self._row(found[key], fields) for key in keys if key in found],
+                'missing': [key for key in keys if key not in found],
+            }
+        page = self.paginator(queryset, limit).page(cursor, with_count=with_count)
+        body = {
+            'results': [self._row(obj, fields) for obj in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        }
+        if with_count:
+            body['count'] = page.count
+        return body
+
+
+CATALOGS = {
+    'products': Catalog(Product, 'sku', {
+        'id': ['id'],
+        'sku': ['sku'],
+        'name': ['name'],
+        'category': ['category'],
+        'selling_price': ['selling_price'],
+        'cost_price': ['cost_price'],
+        'stock_qty': ['stock_qty'],
+        'reserved_qty': ['reserved_qty'],
+        'available_qty': ['stock_qty', 'reserved_qty'],
+    }),
+    'customers': Catalog(Customer, 'code', {
+        'id': ['id'],
+        'code': ['code'],
+        'name': ['name'],
+        'phone': ['phone'],
+        'email': ['email'],
+        'address': ['address'],
+        'balance': ['balance'],
+        'created_at': ['created_at'],
+    }),
+}
@@ -0,0 +1,65 @@
+"""
+Concurrent ORM queries for async views.
+
+Django's async ORM methods (``acount()``, ``aget()``, ``async for`` ...) hand
+their query to ``sync_to_async(thread_sensitive=True)``, i.e. to the one
+thread that serves the request, so ``asyncio.gather()`` over them still runs
+the queries one after another. ``gather()`` here runs each callable with
+``thread_sensitive=False`` instead, on a pool of ``QUERY_THREADS`` threads
+that each hold their own database connection, so independent queries
+overlap (the database drivers release the GIL while they wait).
+
+Inside a transaction the callables are run one after another on the
+request's thread, since only its connection sees the transaction's writes.
+The same happens when ``settings.CONCURRENT_QUERIES`` is False: every hop to
+another thread costs a little, so running sub-millisecond queries (SQLite on
+a local disk) concurrently can be slower than running them in a row.
+
+The pool is shared by all requests and event loops of the process. The
+event loop's default executor would not do: under WSGI every request runs its
+async view in a new event loop, which would start new threads, and open new
+connections, for every request. Pool threads treat each callable as Django
+treats a request: ``close_old_connections()`` runs before and after it, so
+``CONN_MAX_AGE`` and ``CONN_HEALTH_CHECKS`` apply and a connection left
+broken or in a transaction is not reused.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+QUERY_THREADS = 8
+
+executor = ThreadPoolExecutor(max_workers=QUERY_THREADS, thread_name_prefix='erp-query')
+
+
+def _call_in_a_row(funcs):
+    """On the request's thread: call ``funcs`` if they must not run concurrently, else return None."""
+    in_transaction = any(connection.in_atomic_block for connection in connections.all(initialized_only=True))
+    if getattr(settings, 'CONCURRENT_QUERIES', True) and not in_transaction:
+        return None
+    return [func() for func in funcs]
+
+
+def _call_in_pool(func):
+    close_old_connections()
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+async def gather(*funcs):
+    """Call the synchronous callables ``funcs`` concurrently; return their results in order."""
+    results = await sync_to_async(_call_in_a_row)(funcs)
+    if results is not None:
+        return results
+    return await asyncio.gather(*(sync_to_async(_call_in_pool, thread_sensitive=False, executor=executor)(func) for func in funcs))
+
+
+def load_permissions(user):
+    """Fill ``user``'s permission cache, so templates checking ``perms`` run no queries."""
+    if user.is_active and not user.is_superuser:
+        user.get_all_permissions()
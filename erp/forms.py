@@ -1,6 +1,7 @@
 from django import forms
-from django.forms import inlineformset_factory
-from .models import SalesOrder, SalesOrderItem
+from django.forms import BaseInlineFormSet, inlineformset_factory
+from django.utils.functional import cached_property
+from .models import Product, SalesOrder, SalesOrderItem
 
 class OrderCreateForm(forms.ModelForm):
     class Meta:
@@ -8,8 +9,75 @@ class OrderCreateForm(forms.ModelForm):
         fields = ['customer', 'status']
         exclude = ['order_number', 'order_date', 'created_by', 'total_amount', 'status']
 
+class OrderImportForm(forms.Form):
+    FORMAT_CHOICES = [('csv', 'CSV'), ('jsonl', 'JSON Lines')]
+
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=FORMAT_CHOICES)
+
+class PreloadedModelChoiceField(forms.ModelChoiceField):
+    """A ``ModelChoiceField`` that takes submitted objects from ``preloaded`` when it can."""
+    preloaded = None
+
+    def to_python(self, value):
+        if self.preloaded and value not in self.empty_values:
+            try:
+                return self.preloaded[int(value)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_python(value)
+
+class SalesOrderItemForm(forms.ModelForm):
+    product = PreloadedModelChoiceField(queryset=Product.objects.all())
+
+    class Meta:
+        model = SalesOrderItem
+        fields = ['product', 'qty']
+
+class BaseSalesOrderItemFormSet(BaseInlineFormSet):
+    """
+    Load the product choices once for the whole formset instead of once per
+    row, and the submitted products (with their prices) in one query.
+    """
+
+    @cached_property
+    def product_choices(self):
+        return [('', '---------')] + [(product.pk, str(product)) for product in Product.objects.only('sku', 'name')]
+
+    @cached_property
+    def submitted_products(self):
+        ids = set()
+        for i in range(self.total_form_count()):
+            value = self.data.get(self.add_prefix(i) + '-product', '')
+            if value.isdigit():
+                ids.add(int(value))
+        return Product.objects.only('sku', 'name', 'selling_price', 'cost_price').in_bulk(ids)
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        form.fields['product'].choices = self.product_choices
+        if self.is_bound:
+            form.fields['product'].preloaded = self.submitted_products
+        return form
+
+    def order_lines(self):
+        """``[(product, qty), ...]`` for the filled-in, non-deleted rows."""
+        return [
+            (form.cleaned_data['product'], form.cleaned_data['qty'])
+            for form in self.forms
+            if form.cleaned_data.get('product') and not form.cleaned_data.get('DELETE')
+        ]
+
+    @property
+    def empty_form(self):
+        form = super().empty_form
+        form.fields['product'].choices = self.product_choices
+        return form
+
 SalesOrderItemFormSet = inlineformset_factory(
     SalesOrder, SalesOrderItem,
+    form=SalesOrderItemForm,
+    formset=BaseSalesOrderItemFormSet,
     fields=['product', 'qty'],
     extra=1,
     can_delete=True
@@ -0,0 +1,92 @@
+"""
+Cached template fragments with model-driven invalidation.
+
+A fragment is cached under a key made of
+
+* its name;
+* the current *version* of each model or object it depends on (see
+  ``erp.versions``), bumped whenever a row of that model (or that one
+  object) is saved or deleted, so a change makes every affected key
+  obsolete without having to find and delete them;
+* optionally the permission set of the user, for fragments whose output
+  depends on ``{% if perms... %}`` checks;
+* optionally any other value, e.g. the rows of the page being rendered.
+
+Templates use the ``fragments`` tag library::
+
+    {% fragment 'order-detail' order 'erp.product' %} ... {% endfragment %}
+    {% fragment 'product-rows' 'erp.product' vary=products perms=True %} ... {% endfragment %}
+
+Dependencies are model labels (``'erp.product'``), model classes, or model
+instances for a per-object version. ``erp.signals`` bumps the versions of
+``Product``, ``Customer``, ``SalesOrder`` and ``SalesOrderItem`` on save
+and delete; code that writes with ``update()`` or ``bulk_create()`` calls
+``versions.bump()`` itself.
+
+Fragments live in the default cache, like the versions. A request reading
+from a replica (``erp.routers``) uses cached fragments but caches none of
+its own: the replica may lag behind the versions, which come from the
+primary. Hits, misses and the render time saved are reported through
+``erp.instrumentation``.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import models
+from django.utils.safestring import mark_safe
+
+from . import instrumentation, routers
+from .versions import dependency, versions
+
+TIMEOUT = 600
+
+
+def permissions_key(user):
+    """A short digest of ``user``'s permission set, computed once per user object."""
+    if user is None or not user.is_authenticated:
+        return 'anonymous'
+    if user.is_active and user.is_superuser:
+        # Superusers pass every check; listing their permissions would cost queries.
+        return 'superuser'
+    key = getattr(user, '_fragment_permissions_key', None)
+    if key is None:
+        permissions = ','.join(sorted(user.get_all_permissions()))
+        key = user._fragment_permissions_key = hashlib.md5(permissions.encode()).hexdigest()[:16]
+    return key
+
+
+def _vary_token(value):
+    if isinstance(value, models.Model):
+        return dependency(value)
+    if isinstance(value, (list, tuple, models.QuerySet)):
+        return '[' + ','.join(_vary_token(item) for item in value) + ']'
+    return repr(value)
+
+
+def fragment_key(name, dependencies=(), vary=None, user=None):
+    parts = [str(version) for version in versions(*dependencies)] if dependencies else []
+    parts.append(_vary_token(vary))
+    if user is not None:
+        parts.append(permissions_key(user))
+    digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return f'erp:fragment:{name}:{digest}'
+
+
+def cached(name, key, render, timeout=TIMEOUT):
+    """
+    The cached HTML under ``key``, or ``render()``'s output, which is then
+    cached unless it was read from a replica.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        html, seconds = entry
+        instrumentation.record_fragment(name, hit=True, seconds=seconds)
+        return mark_safe(html)
+    start = time.perf_counter()
+    html = render()
+    seconds = time.perf_counter() - start
+    if not routers.reading_from_replica():
+        cache.set(key, (str(html), seconds), timeout)
+    instrumentation.record_fragment(name, hit=False, seconds=seconds)
+    return html
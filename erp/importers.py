@@ -0,0 +1,224 @@
+"""
+Streaming bulk import of sales orders.
+
+Input is parsed lazily and processed in chunks of ``chunk_size`` orders. For
+each chunk, the customers and products it references are loaded with one
+query each into lookup maps, and the orders are written in bulk by
+``erp.orders.create_orders()``. Records that cannot be imported (malformed
+input, unknown customer or SKU, a pending order the stock cannot cover)
+are skipped and reported with their line number; the rest of the file is
+still imported.
+
+Supported formats:
+
+* CSV with a header row and the columns ``order_ref``, ``customer_code``,
+  ``sku``, ``qty`` and optionally ``status``. Consecutive rows sharing an
+  ``order_ref`` form one order.
+* JSON Lines, one order per line::
+
+      {"ref": "WEB-1001", "customer": "Cust-001", "status": "PENDING",
+       "items": [{"sku": "USB-C", "qty": 3}]}
+"""
+import csv
+import itertools
+import json
+import time
+
+from .models import Product, Customer, SalesOrder
+from .reservations import InsufficientStock
+from . import orders
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+STATUSES = {choice for choice, label in SalesOrder.STATUS_CHOICES}
+
+
+class OrderRecord:
+    def __init__(self, line, ref, customer_code=None, status='PENDING', items=None, error=None):
+        self.line = line
+        self.ref = ref
+        self.customer_code = customer_code
+        self.status = status
+        self.items = items or []
+        self.error = error
+
+
+class ImportReport:
+    def __init__(self):
+        self.orders = 0
+        self.lines = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def skip(self, record, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((record.line, record.ref, message))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def orders_per_second(self):
+        return self.orders / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+
+def _parse_qty(value):
+    qty = int(value)
+    if qty <= 0:
+        raise ValueError("quantity must be positive")
+    return qty
+
+
+def _status(value):
+    status = (value or 'PENDING').strip().upper()
+    if status not in STATUSES:
+        raise ValueError(f"unknown status {value!r}")
+    return status
+
+
+def _ref(row):
+    return (row.get('order_ref') or '').strip()
+
+
+def _csv_record(group):
+    line, first = group[0]
+    record = OrderRecord(line, _ref(first), (first.get('customer_code') or '').strip())
+    try:
+        if not record.ref:
+            raise ValueError("missing order_ref")
+        record.status = _status(first.get('status'))
+        for row_line, row in group:
+            sku = (row.get('sku') or '').strip()
+            if not sku:
+                raise ValueError(f"line {row_line}: missing sku")
+            try:
+                record.items.append((sku, _parse_qty(row.get('qty'))))
+            except (TypeError, ValueError) as exc:
+                raise ValueError(f"line {row_line}: invalid qty {row.get('qty')!r}") from exc
+    except ValueError as exc:
+        record.error = str(exc)
+    return record
+
+
+def read_csv(lines):
+    """
+    Yield ``OrderRecord``s from CSV text lines, grouping consecutive rows by
+    ``order_ref``. Reading stops at a line that cannot be decoded or parsed,
+    which fails the order being read.
+    """
+    reader = csv.DictReader(lines)
+    group = []
+    try:
+        for row in reader:
+            if group and _ref(row) != _ref(group[0][1]):
+                yield _csv_record(group)
+                group = []
+            group.append((reader.line_num, row))
+    except (UnicodeDecodeError, csv.Error) as exc:
+        record = _csv_record(group) if group else OrderRecord(reader.line_num + 1, '')
+        record.error = f"line {reader.line_num + 1}: unreadable, the rest of the file was skipped: {exc}"
+        yield record
+        return
+    if group:
+        yield _csv_record(group)
+
+
+def read_jsonl(lines):
+    """
+    Yield one ``OrderRecord`` per JSON line. Reading stops at text that
+    cannot be decoded, reported as one more record.
+    """
+    line = 0
+    try:
+        for line, text in enumerate(lines, start=1):
+            if not text.strip():
+                continue
+            record = OrderRecord(line, '')
+            try:
+                data = json.loads(text)
+                record.ref = str(data.get('ref', ''))
+                record.customer_code = str(data['customer']).strip()
+                record.status = _status(data.get('status'))
+                record.items = [(str(item['sku']).strip(), _parse_qty(item['qty'])) for item in data['items']]
+                if not record.items:
+                    raise ValueError("order has no items")
+            except (AttributeError, KeyError, TypeError, ValueError) as exc:
+                record.error = f"invalid record: {exc}"
+            yield record
+    except UnicodeDecodeError as exc:
+        yield OrderRecord(line + 1, '', error=f"unreadable, the rest of the file was skipped: {exc}")
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def import_orders(records, user=None, chunk_size=CHUNK_SIZE):
+    report = ImportReport()
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(chunk, user, report)
+    report.finish()
+    return report
+
+
+def resolve(records, report):
+    """
+    Look up the customers and products of ``records`` with one query each.
+    Returns ``create_orders()`` entries for the records that resolve and
+    reports the others as skipped.
+    """
+    return [entry for record, entry in _resolve(records, report)]
+
+
+def _resolve(records, report):
+    valid = []
+    for record in records:
+        if record.error:
+            report.skip(record, record.error)
+        else:
+            valid.append(record)
+    records = valid
+    customers = Customer.objects.only('pk', 'code').in_bulk({r.customer_code for r in records}, field_name='code')
+    skus = {sku for r in records for sku, qty in r.items}
+    products = {p.sku: p for p in Product.objects.filter(sku__in=skus).only('pk', 'sku', 'selling_price', 'cost_price')}
+
+    entries = []
+    for record in records:
+        customer = customers.get(record.customer_code)
+        missing = sorted({sku for sku, qty in record.items if sku not in products})
+        if customer is None:
+            report.skip(record, f"unknown customer {record.customer_code!r}")
+        elif missing:
+            report.skip(record, f"unknown SKU {', '.join(missing)}")
+        else:
+            entries.append((record, (customer, record.status, [(products[sku], qty) for sku, qty in record.items])))
+    return entries
+
+
+def _import_chunk(chunk, user, report):
+    resolved = _resolve(chunk, report)
+    try:
+        _create(resolved, user, report)
+    except InsufficientStock:
+        # Nothing of the chunk was saved; find the orders at fault one by one.
+        for record, entry in resolved:
+            try:
+                _create([(record, entry)], user, report)
+            except InsufficientStock as exc:
+                report.skip(record, f"not enough stock: {exc}")
+
+
+def _create(resolved, user, report):
+    entries = [entry for record, entry in resolved]
+    report.orders += len(orders.create_orders(entries, user=user))
+    report.lines += sum(len(lines) for customer, status, lines in entries)
@@ -0,0 +1,311 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` times every request and, while it runs, counts and
+times the SQL it executes and the template rendering (through
+``InstrumentedDjangoTemplates``, a drop-in template backend). Every database
+connection gets an execute wrapper when it is opened; it records into the
+current request's ``RequestTiming``, found through a context variable, so
+queries run from ``sync_to_async`` threads are counted too. The figures are
+
+* sent back in a ``Server-Timing`` header (``db``, ``tpl``, ``total``, and
+  ``frag`` for the render time saved by cached fragments, see
+  ``erp.fragments``), so they show up in the browser's network panel;
+* aggregated per resolved view name into in-process counters and
+  histograms, served in the Prometheus text format at ``/metrics``;
+* logged with the request's SQL to the ``erp.performance`` logger when the
+  request takes longer than ``SLOW_REQUEST_MS``.
+
+The histograms are cumulative, as Prometheus expects; rates and percentiles
+over a time window are computed by the scraper. Each process keeps its own
+figures. Streaming responses are measured until the response is returned,
+not until the stream is consumed.
+"""
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('erp.performance')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SLOW_QUERIES_LOGGED = 20
+# Any other method is counted as 'other', so clients cannot add series.
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+_current = contextvars.ContextVar('erp_request_timing', default=None)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.queries = []
+        self.template_seconds = 0.0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        self.fragment_seconds_saved = 0.0
+
+    @property
+    def sql_seconds(self):
+        return sum(elapsed for elapsed, sql in self.queries)
+
+
+def current_timing():
+    """The ``RequestTiming`` of the request being handled, if any."""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        # list.append() is atomic, so concurrent queries of one request can share the list.
+        timing.queries.append((time.perf_counter() - start, sql))
+
+
+def record_fragment(name, hit, seconds):
+    """Count a fragment cache lookup; ``seconds`` is the fragment's render time, saved on a hit."""
+    timing = _current.get()
+    if timing is not None:
+        if hit:
+            timing.fragment_hits += 1
+            timing.fragment_seconds_saved += seconds
+        else:
+            timing.fragment_misses += 1
+    registry.observe_fragment(name, hit, seconds)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def label(value):
+    """``value`` escaped for a Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.responses = {}
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.slow = 0
+
+
+class FragmentMetrics:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.render_seconds = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.fragments = {}
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.fragments = {}
+
+    def observe_fragment(self, name, hit, seconds):
+        with self.lock:
+            metrics = self.fragments.get(name)
+            if metrics is None:
+                metrics = self.fragments[name] = FragmentMetrics()
+            if hit:
+                metrics.hits += 1
+                metrics.seconds_saved += seconds
+            else:
+                metrics.misses += 1
+                metrics.render_seconds += seconds
+
+    def observe(self, view, method, status, seconds, timing, slow):
+        with self.lock:
+            metrics = self.views.get(view)
+            if metrics is None:
+                metrics = self.views[view] = ViewMetrics()
+            key = (method if method in METHODS else 'other', status)
+            metrics.responses[key] = metrics.responses.get(key, 0) + 1
+            metrics.duration.observe(seconds)
+            metrics.queries.observe(len(timing.queries))
+            metrics.sql_seconds += timing.sql_seconds
+            metrics.template_seconds += timing.template_seconds
+            metrics.slow += slow
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            views = sorted(self.views.items())
+            fragments = sorted(self.fragments.items())
+            lines = []
+
+            def family(name, kind, help_text):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+            def histogram(name, view, data):
+                cumulative = 0
+                for bound, count in zip((*data.buckets, '+Inf'), data.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{view="{label(view)}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{view="{label(view)}"}} {data.sum:.6f}')
+                lines.append(f'{name}_count{{view="{label(view)}"}} {data.count}')
+
+            family('erp_http_responses_total', 'counter', 'Responses by view, method and status code.')
+            for view, metrics in views:
+                for (method, status), count in sorted(metrics.responses.items()):
+                    lines.append(f'erp_http_responses_total{{view="{label(view)}",method="{label(method)}",status="{label(status)}"}} {count}')
+            family('erp_http_request_duration_seconds', 'histogram', 'Time spent handling the request.')
+            for view, metrics in views:
+                histogram('erp_http_request_duration_seconds', view, metrics.duration)
+            family('erp_db_queries_per_request', 'histogram', 'SQL queries run per request.')
+            for view, metrics in views:
+                histogram('erp_db_queries_per_request', view, metrics.queries)
+            family('erp_db_query_seconds_total', 'counter', 'Time spent executing SQL.')
+            for view, metrics in views:
+                lines.append(f'erp_db_query_seconds_total{{view="{label(view)}"}} {metrics.sql_seconds:.6f}')
+            family('erp_template_render_seconds_total', 'counter', 'Time spent rendering templates.')
+            for view, metrics in views:
+                lines.append(f'erp_template_render_seconds_total{{view="{label(view)}"}} {metrics.template_seconds:.6f}')
+            family('erp_http_slow_requests_total', 'counter', 'Requests slower than SLOW_REQUEST_MS.')
+            for view, metrics in views:
+                lines.append(f'erp_http_slow_requests_total{{view="{label(view)}"}} {metrics.slow}')
+            family('erp_fragment_cache_requests_total', 'counter', 'Cached template fragment lookups by result.')
+            for name, metrics in fragments:
+                lines.append(f'erp_fragment_cache_requests_total{{fragment="{label(name)}",result="hit"}} {metrics.hits}')
+                lines.append(f'erp_fragment_cache_requests_total{{fragment="{label(name)}",result="miss"}} {metrics.misses}')
+            family('erp_fragment_render_seconds_total', 'counter', 'Time spent rendering fragments on cache misses.')
+            for name, metrics in fragments:
+                lines.append(f'erp_fragment_render_seconds_total{{fragment="{label(name)}"}} {metrics.render_seconds:.6f}')
+            family('erp_fragment_render_seconds_saved_total', 'counter', 'Render time saved by fragment cache hits.')
+            for name, metrics in fragments:
+                lines.append(f'erp_fragment_render_seconds_saved_total{{fragment="{label(name)}"}} {metrics.seconds_saved:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _slow_request_ms():
+    return getattr(settings, 'SLOW_REQUEST_MS', 500)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timing = RequestTiming()
+        token = _current.set(timing)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing, time.perf_counter() - start)
+
+    def finish(self, request, response, timing, seconds):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        slow = seconds * 1000 >= _slow_request_ms()
+        server_timing = (
+            f'db;dur={timing.sql_seconds * 1000:.1f};desc="{len(timing.queries)} queries", '
+            f'tpl;dur={timing.template_seconds * 1000:.1f}, total;dur={seconds * 1000:.1f}'
+        )
+        lookups = timing.fragment_hits + timing.fragment_misses
+        if lookups:
+            server_timing += f', frag;dur={timing.fragment_seconds_saved * 1000:.1f};desc="{timing.fragment_hits}/{lookups} cached"'
+        response['Server-Timing'] = server_timing
+        registry.observe(view, request.method, response.status_code, seconds, timing, slow)
+        if slow:
+            self.log_slow_request(request, view, seconds, timing)
+        return response
+
+    def log_slow_request(self, request, view, seconds, timing):
+        slowest = sorted(timing.queries, key=lambda query: query[0], reverse=True)[:SLOW_QUERIES_LOGGED]
+        logger.warning(
+            "Slow request: %s %s (%s) took %.0f ms; %d queries in %.0f ms, templates %.0f ms\n%s",
+            request.method, request.path, view, seconds * 1000, len(timing.queries),
+            timing.sql_seconds * 1000, timing.template_seconds * 1000,
+            '\n'.join(f'  {elapsed * 1000:8.1f} ms  {sql}' for elapsed, sql in slowest),
+        )
+
+
+class TimedTemplate:
+    """Wraps a backend template to add its render time to the current request."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timing.template_seconds += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing top-level renders for ``PerformanceMiddleware``."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,113 @@
+"""
+Point-in-time stock from the ``StockMovement`` ledger.
+
+``Product.stock_qty`` only holds the current level; past levels come from
+the ledger. Each product's level is periodically written to a
+``StockSnapshot`` row, and the stock at any instant is the nearest snapshot
+at or before it plus the movements in between - a short range scan on
+``(product, timestamp)`` instead of a sum over the product's whole history.
+
+Snapshots are taken ``SNAPSHOT_DELAY`` in the past: a movement is
+timestamped when it is written, shortly before its transaction commits, and
+a snapshot must only cover movements that are already visible. Snapshots
+older than ``KEEP_ALL_DAYS`` are compacted to the last one per product and
+month. Dropping a snapshot never changes a result, it only lengthens the
+range that has to be summed.
+"""
+import datetime
+
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import Product, StockMovement, StockShard, StockSnapshot
+
+SNAPSHOT_DELAY = datetime.timedelta(minutes=5)
+KEEP_ALL_DAYS = 31
+BEGINNING = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _with_ledger(queryset, as_of, use_snapshots=True):
+    """
+    Annotate products with ``base_qty``/``base_at`` (their latest snapshot at
+    or before ``as_of``, if any) and ``delta``, the sum of the movements
+    after it up to ``as_of`` (NULL when there are none).
+    """
+    if use_snapshots:
+        latest = StockSnapshot.objects.filter(product=OuterRef('pk'), as_of__lte=as_of).order_by('-as_of')
+        queryset = queryset.annotate(
+            base_qty=Coalesce(Subquery(latest.values('qty')[:1]), 0),
+            base_at=Coalesce(Subquery(latest.values('as_of')[:1]), Value(BEGINNING)),
+        )
+    else:
+        queryset = queryset.annotate(base_qty=Value(0), base_at=Value(BEGINNING))
+    movements = (
+        StockMovement.objects.filter(product=OuterRef('pk'), timestamp__gt=OuterRef('base_at'), timestamp__lte=as_of)
+        .order_by().values('product').annotate(total=Sum('qty')).values('total')
+    )
+    return queryset.annotate(delta=Subquery(movements, output_field=IntegerField()))
+
+
+def _level():
+    return F('base_qty') + Coalesce('delta', 0)
+
+
+def levels(as_of=None, queryset=None):
+    """Return ``{product_id: qty}`` as of ``as_of`` (default: now) for ``queryset`` (default: all products)."""
+    as_of = as_of or timezone.now()
+    queryset = Product.objects.all() if queryset is None else queryset
+    return dict(_with_ledger(queryset, as_of).order_by().values_list('pk', _level()))
+
+
+def stock_at(product, timestamp):
+    """Stock of ``product`` (instance or pk) at ``timestamp``, read from the nearest snapshot plus the movements since."""
+    product_id = getattr(product, 'pk', product)
+    return levels(timestamp, Product.objects.filter(pk=product_id)).get(product_id, 0)
+
+
+def take_snapshots(as_of=None):
+    """
+    Snapshot every product whose stock moved since its last snapshot. Returns
+    the number written. Taking the same ``as_of`` again, even concurrently,
+    rewrites its snapshots rather than failing.
+    """
+    as_of = as_of or timezone.now() - SNAPSHOT_DELAY
+    moved = _with_ledger(Product.objects.all(), as_of).filter(delta__isnull=False)
+    snapshots = [
+        StockSnapshot(product_id=pk, as_of=as_of, qty=qty)
+        for pk, qty in moved.order_by('pk').values_list('pk', _level()).iterator()
+    ]
+    StockSnapshot.objects.bulk_create(
+        snapshots, batch_size=1000, update_conflicts=True, unique_fields=['product', 'as_of'], update_fields=['qty'],
+    )
+    return len(snapshots)
+
+
+def compact_snapshots(before=None):
+    """Keep only the last snapshot per product and month before ``before``. Returns the number deleted."""
+    before = before or timezone.now() - datetime.timedelta(days=KEEP_ALL_DAYS)
+    old = StockSnapshot.objects.filter(as_of__lt=before).annotate(month=TruncMonth('as_of'))
+    superseded = old.filter(Exists(old.filter(
+        product=OuterRef('product'), month=OuterRef('month'), as_of__gt=OuterRef('as_of'),
+    )))
+    deleted, _ = StockSnapshot.objects.filter(pk__in=superseded.values('pk')).delete()
+    return deleted
+
+
+def check_consistency(use_snapshots=True):
+    """
+    Compare the ledger with ``Product.stock_qty``, or the sum of the shards
+    of a sharded product (see ``erp.sharding``). Returns ``{product_id:
+    (ledger_qty, stock_qty)}`` for every product where they disagree. With
+    ``use_snapshots=False`` the whole ledger is summed, independently of the
+    snapshots.
+    """
+    shards = StockShard.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(total=Sum('qty')).values('total')
+    products = _with_ledger(Product.objects.all(), timezone.now(), use_snapshots).annotate(
+        current=Case(
+            When(stock_shards__gt=0, then=Coalesce(Subquery(shards, output_field=IntegerField()), 0)),
+            default=F('stock_qty'),
+        ),
+    )
+    drift = products.annotate(ledger=_level()).exclude(ledger=F('current'))
+    return {pk: (ledger, current) for pk, ledger, current in drift.order_by('pk').values_list('pk', 'ledger', 'current')}
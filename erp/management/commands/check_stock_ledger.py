@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp import ledger
+from erp.models import Product
+
+
+class Command(BaseCommand):
+    help = "Compare the stock movement ledger with Product.stock_qty and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Sum the whole ledger instead of starting from snapshots.")
+
+    def handle(self, *args, **options):
+        drift = ledger.check_consistency(use_snapshots=not options['full'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Ledger and stock levels agree."))
+            return
+        skus = Product.objects.in_bulk(list(drift))
+        for pk, (ledger_qty, stock_qty) in drift.items():
+            self.stdout.write(f"{skus[pk].sku}: ledger {ledger_qty}, stock_qty {stock_qty} ({stock_qty - ledger_qty:+d})")
+        raise CommandError(f"{len(drift)} products disagree with the ledger.")
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from erp import reservations
+
+
+class Command(BaseCommand):
+    help = "Release the stock held by pending orders whose reservations have expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help="Keep sweeping every this many seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            count, units = reservations.expire()
+            self.stdout.write(f"Released {count} expired reservations ({units} units).")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
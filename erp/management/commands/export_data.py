@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp import exports
+
+
+class Command(BaseCommand):
+    help = "Stream orders, order items or stock movements to a CSV or XLSX file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', help="First day to export (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='date_to', help="Last day to export (YYYY-MM-DD).")
+        parser.add_argument('--output', help="Output file; CSV is written to stdout by default.")
+
+    def handle(self, *args, **options):
+        try:
+            date_from = exports.parse_day(options['date_from'])
+            date_to = exports.parse_day(options['date_to'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options['format'] == 'xlsx' and not options['output']:
+            raise CommandError("XLSX exports need --output.")
+
+        export = exports.EXPORTS[options['kind']]
+        stream, content_type = exports.FORMATS[options['format']]
+        chunks = stream(export.headers, export.queryset(date_from, date_to))
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        mode, encoding = ('wb', None) if options['format'] == 'xlsx' else ('w', 'utf-8')
+        with open(options['output'], mode, encoding=encoding, newline=None if encoding is None else '') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from erp import importers
+
+
+class Command(BaseCommand):
+    help = "Stream-import sales orders from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(importers.READERS), help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=importers.CHUNK_SIZE)
+        parser.add_argument('--user', help="Username recorded as the creator of the orders.")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        fmt = options['format'] or path.suffix.lstrip('.').lower()
+        if fmt not in importers.READERS:
+            raise CommandError(f"Unknown format {fmt!r}; use --format.")
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']!r} does not exist.")
+
+        with path.open(newline='', encoding='utf-8') as stream:
+            report = importers.import_orders(importers.READERS[fmt](stream), user=user, chunk_size=options['chunk_size'])
+
+        for line, ref, message in report.errors:
+            self.stderr.write(f"line {line} ({ref or 'no ref'}): {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report.orders} orders ({report.lines} lines) in {report.elapsed:.2f}s: "
+            f"{report.orders_per_second:.0f} orders/s, {report.lines_per_second:.0f} lines/s. "
+            f"Skipped {report.skipped}."
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from erp import sharding
+
+
+class Command(BaseCommand):
+    help = "Even out the stock of sharded products across their shards and roll it up into the products."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help="Keep rebalancing every this many seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            moved = sharding.rebalance()
+            self.stdout.write(f"Moved {moved} units between shards.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from erp import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from the confirmed orders."
+
+    def handle(self, *args, **options):
+        count = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} daily rollup rows."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from erp import balances
+from erp.models import Customer
+
+
+class Command(BaseCommand):
+    help = "Recompute customer balances from their confirmed orders and correct any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without correcting it.")
+
+    def handle(self, *args, **options):
+        drift = balances.reconcile(dry_run=options['dry_run'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Balances are in sync."))
+            return
+        codes = dict(Customer.objects.filter(pk__in=list(drift)).values_list('pk', 'code'))
+        verb = "would be corrected" if options['dry_run'] else "corrected"
+        for pk, (stored, expected) in drift.items():
+            self.stdout.write(f"{codes[pk]}: balance {stored}, orders say {expected} ({verb} by {expected - stored:+})")
+        self.stdout.write(f"{len(drift)} balances {verb}.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from erp import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard counters from the source tables and report any drift."
+
+    def handle(self, *args, **options):
+        drift = stats.reconcile()
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Counters are in sync."))
+            return
+        for name, delta in sorted(drift.items()):
+            self.stdout.write(f"{name}: corrected by {delta:+d}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from erp import search
+
+
+class Command(BaseCommand):
+    help = "Create the product search index if needed and rebuild it from the product table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if not search.install(connection):
+            search.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS(f"Product search index rebuilt ({connection.vendor})."))
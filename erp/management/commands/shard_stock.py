@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp import sharding
+from erp.models import Product
+
+
+class Command(BaseCommand):
+    help = "Spread the stock of hot products over several counter rows, or gather it back with --shards 0."
+
+    def add_arguments(self, parser):
+        parser.add_argument('skus', nargs='+', metavar='SKU')
+        parser.add_argument('--shards', type=int, required=True, help="Number of shards; 0 or 1 unshards.")
+
+    def handle(self, *args, **options):
+        if options['shards'] < 0:
+            raise CommandError("--shards cannot be negative.")
+        products = {product.sku: product for product in Product.objects.filter(sku__in=options['skus'])}
+        missing = [sku for sku in options['skus'] if sku not in products]
+        if missing:
+            raise CommandError(f"Unknown SKU: {', '.join(missing)}")
+        for sku in options['skus']:
+            product = products[sku]
+            sharding.shard(product, options['shards'])
+            if product.stock_shards:
+                self.stdout.write(f"{sku}: {product.stock_qty} in stock over {product.stock_shards} shards.")
+            else:
+                self.stdout.write(f"{sku}: {product.stock_qty} in stock, unsharded.")
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+
+from erp import ledger
+
+
+class Command(BaseCommand):
+    help = "Snapshot the stock of every product that moved since its last snapshot, then compact old snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help="Snapshot time (ISO 8601). Defaults to a few minutes ago.")
+        parser.add_argument('--keep-days', type=int, default=ledger.KEEP_ALL_DAYS,
+                            help="Snapshots older than this are compacted to one per product and month.")
+        parser.add_argument('--no-compact', action='store_true')
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            as_of = parse_datetime(options['as_of'])
+            if as_of is None:
+                raise CommandError(f"Invalid --as-of {options['as_of']!r}.")
+            if timezone.is_naive(as_of):
+                as_of = timezone.make_aware(as_of)
+        written = ledger.take_snapshots(as_of)
+        self.stdout.write(f"Wrote {written} snapshots.")
+        if not options['no_compact']:
+            deleted = ledger.compact_snapshots(timezone.now() - datetime.timedelta(days=options['keep_days']))
+            self.stdout.write(f"Compacted away {deleted} snapshots.")
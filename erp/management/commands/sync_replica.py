@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from erp import replication
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into its read replicas (a stand-in for real replication)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help="Replica aliases. Defaults to DATABASE_REPLICAS.")
+        parser.add_argument('--interval', type=float, help="Keep syncing every this many seconds.")
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or getattr(settings, 'DATABASE_REPLICAS', [])
+        unknown = sorted(set(aliases) - set(settings.DATABASES))
+        if unknown:
+            raise CommandError(f"Unknown database alias {', '.join(unknown)}.")
+        if not aliases:
+            raise CommandError("No replicas: pass an alias or set DATABASE_REPLICAS.")
+        while True:
+            for alias in aliases:
+                try:
+                    replication.sync(alias)
+                except ValueError as exc:
+                    raise CommandError(str(exc))
+            self.stdout.write(f"Synced {', '.join(aliases)}.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
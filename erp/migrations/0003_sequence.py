@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+def seed_order_number_sequence(apps, schema_editor):
+    # Continue after the numbers handed out by the old Max('id') scheme.
+    SalesOrder = apps.get_model('erp', 'SalesOrder')
+    Sequence = apps.get_model('erp', 'Sequence')
+    db_alias = schema_editor.connection.alias
+    last = SalesOrder.objects.using(db_alias).aggregate(max_id=models.Max('id'))['max_id'] or 0
+    for number in SalesOrder.objects.using(db_alias).values_list('order_number', flat=True).iterator():
+        suffix = number.rpartition('-')[2]
+        if suffix.isdigit():
+            last = max(last, int(suffix))
+    Sequence.objects.using(db_alias).create(name='order_number', next_value=last + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0002_product_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.BigIntegerField(default=1, help_text='First value not yet handed out to any process')),
+            ],
+        ),
+        migrations.RunPython(seed_order_number_sequence, migrations.RunPython.noop),
+    ]
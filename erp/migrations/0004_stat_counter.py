@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-18 09:32
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_counters(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Product = apps.get_model('erp', 'Product')
+    Customer = apps.get_model('erp', 'Customer')
+    SalesOrder = apps.get_model('erp', 'SalesOrder')
+    StatCounter = apps.get_model('erp', 'StatCounter')
+    today = timezone.now().date()
+    StatCounter.objects.using(db_alias).bulk_create([
+        StatCounter(name='products', value=Product.objects.using(db_alias).count()),
+        StatCounter(name='customers', value=Customer.objects.using(db_alias).count()),
+        StatCounter(name='low_stock', value=Product.objects.using(db_alias).filter(stock_qty__lt=10).count()),
+        StatCounter(name=f'orders:{today.isoformat()}', value=SalesOrder.objects.using(db_alias).filter(order_date=today).count()),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0003_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='stock_qty',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
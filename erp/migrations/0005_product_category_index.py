@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0004_stat_counter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='category',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
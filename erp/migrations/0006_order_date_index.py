@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-18 09:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0005_product_category_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['order_date', 'id'], name='erp_order_date_id_idx'),
+        ),
+    ]
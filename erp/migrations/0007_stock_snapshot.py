@@ -0,0 +1,65 @@
+# Generated by Django 6.0 on 2026-10-18 09:45
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def record_opening_balances(apps, schema_editor):
+    # Stock entered through the product form was never logged; book the
+    # difference as an opening balance dated before the product's first
+    # movement, so that the ledger adds up to stock_qty at any point in time.
+    Product = apps.get_model('erp', 'Product')
+    StockMovement = apps.get_model('erp', 'StockMovement')
+    db_alias = schema_editor.connection.alias
+    ledger = dict(
+        StockMovement.objects.using(db_alias).values('product_id')
+        .annotate(total=models.Sum('qty')).values_list('product_id', 'total')
+    )
+    first = dict(
+        StockMovement.objects.using(db_alias).values('product_id')
+        .annotate(first=models.Min('timestamp')).values_list('product_id', 'first')
+    )
+    now = timezone.now()
+    for pk, stock_qty in Product.objects.using(db_alias).values_list('pk', 'stock_qty').iterator():
+        difference = stock_qty - ledger.get(pk, 0)
+        if difference:
+            movement = StockMovement.objects.using(db_alias).create(product_id=pk, qty=difference, notes='Opening balance')
+            opened = first[pk] - datetime.timedelta(seconds=1) if pk in first else now
+            StockMovement.objects.using(db_alias).filter(pk=movement.pk).update(timestamp=opened)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0006_order_date_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField(help_text='The snapshot covers every movement timestamped at or before this time')),
+                ('qty', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'timestamp'], name='erp_movement_product_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='erp.product'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('product', 'as_of'), name='erp_snapshot_product_as_of'),
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0 on 2026-10-18 09:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    SalesOrderItem = apps.get_model('erp', 'SalesOrderItem')
+    DailySalesRollup = apps.get_model('erp', 'DailySalesRollup')
+    db_alias = schema_editor.connection.alias
+    money = models.DecimalField(max_digits=14, decimal_places=2)
+    rows = (
+        SalesOrderItem.objects.using(db_alias).filter(order__status='CONFIRMED')
+        .values('order__order_date', 'product_id')
+        .annotate(units=models.Sum('qty'), revenue=models.Sum('total'),
+                  cost=models.Sum(models.F('qty') * models.F('product__cost_price'), output_field=money))
+        .order_by()
+    )
+    DailySalesRollup.objects.using(db_alias).bulk_create([
+        DailySalesRollup(day=row['order__order_date'], product_id=row['product_id'],
+                         units=row['units'], revenue=row['revenue'], cost=row['cost'])
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0007_stock_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='erp.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'product'), name='erp_rollup_day_product')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
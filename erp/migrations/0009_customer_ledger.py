@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 10:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    Customer = apps.get_model('erp', 'Customer')
+    CustomerLedgerEntry = apps.get_model('erp', 'CustomerLedgerEntry')
+    db_alias = schema_editor.connection.alias
+    customers = Customer.objects.using(db_alias).annotate(
+        confirmed=models.Sum('salesorder__total_amount', filter=models.Q(salesorder__status='CONFIRMED')),
+    )
+    updated, entries = [], []
+    for customer in customers.iterator():
+        customer.balance = customer.opening_balance + (customer.confirmed or 0)
+        if customer.balance:
+            updated.append(customer)
+            entries.append(CustomerLedgerEntry(customer=customer, amount=customer.balance, balance=customer.balance,
+                                               notes="Balance brought forward"))
+    Customer.objects.using(db_alias).bulk_update(updated, ['balance'], batch_size=500)
+    CustomerLedgerEntry.objects.using(db_alias).bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0008_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Running balance, maintained by erp.balances', max_digits=14),
+        ),
+        migrations.CreateModel(
+            name='CustomerLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('notes', models.CharField(blank=True, max_length=200)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='erp.customer')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='erp.salesorder')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', 'timestamp', 'id'], name='erp_ledger_customer_ts_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp', '0011_stock_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesorderitem',
+            name='cost',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='qty times the cost price when the order was confirmed; see erp.rollups', max_digits=12, null=True),
+        ),
+    ]
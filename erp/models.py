@@ -1,31 +1,120 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 
-class Product(models.Model):
+class TrackedFieldsMixin:
+    """
+    Remembers the values of ``tracked_fields`` as they were loaded from (or
+    last saved to) the database, so that save handlers can tell what changed
+    without re-reading the row.
+
+    ``maintained_fields`` are kept up to date with ``F()`` updates by the
+    stock and balance engines; ``save()`` of an existing row never writes
+    them, so a stale instance cannot undo those updates.
+    """
+    tracked_fields = ()
+    maintained_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked_fields()
+        return instance
+
+    def _remember_tracked_fields(self, names=None):
+        deferred = self.get_deferred_fields()
+        loaded_values = getattr(self, '_loaded_values', {})
+        for name in self.tracked_fields if names is None else set(self.tracked_fields) & set(names):
+            if name not in deferred:
+                loaded_values[name] = getattr(self, name)
+        self._loaded_values = loaded_values
+
+    def loaded_value(self, name):
+        """The stored value of a tracked field, or None for an unsaved instance."""
+        loaded_values = getattr(self, '_loaded_values', {})
+        if name in loaded_values:
+            return loaded_values[name]
+        if self.pk is None:
+            return None
+        # Built by hand with an existing pk, or the field was deferred.
+        return type(self)._base_manager.filter(pk=self.pk).values_list(name, flat=True).first()
+
+    def _savable_fields(self, update_fields):
+        if update_fields is None:
+            deferred = self.get_deferred_fields()
+            update_fields = [field.attname for field in self._meta.concrete_fields
+                             if not field.primary_key and field.attname not in deferred]
+        return [name for name in update_fields if name not in self.maintained_fields]
+
+    def save(self, *args, **kwargs):
+        if self.maintained_fields and not self._state.adding and not kwargs.get('force_insert'):
+            requested = kwargs.get('update_fields')
+            kwargs['update_fields'] = self._savable_fields(requested)
+            if requested and not kwargs['update_fields']:
+                # Only maintained fields were named: write nothing, but still
+                # send the signals that act on their change.
+                self.save_base(using=kwargs.get('using'), update_fields=[])
+                return
+        super().save(*args, **kwargs)
+        self._remember_tracked_fields(kwargs.get('update_fields'))
+
+class Product(TrackedFieldsMixin, models.Model):
     sku = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=200)
-    category = models.CharField(max_length=100)
+    category = models.CharField(max_length=100, db_index=True)
     cost_price = models.DecimalField(max_digits=10, decimal_places=2)
     selling_price = models.DecimalField(max_digits=10, decimal_places=2)
-    stock_qty = models.IntegerField(default=0)
+    stock_qty = models.IntegerField(default=0, db_index=True)
+    reserved_qty = models.IntegerField(default=0, editable=False,
+                                       help_text="Units held for pending orders, maintained by erp.reservations")
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False,
+                                                    help_text="If not 0, the stock lives in this many StockShard rows; see erp.sharding")
     image = models.ImageField(upload_to='products/', blank=True, null=True)
 
+    tracked_fields = ('stock_qty', 'image')
+    maintained_fields = ('stock_qty', 'reserved_qty', 'stock_shards')
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        # A stock edit moves the stock by the difference from the level it
+        # was made on, whatever the engine changed since.
+        change = self.stock_qty - self.loaded_value('stock_qty')
+        if not change:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            Product.objects.filter(pk=self.pk).update(stock_qty=F('stock_qty') + change)
+            self.stock_qty, self.reserved_qty = Product.objects.filter(pk=self.pk).values_list('stock_qty', 'reserved_qty').get()
+            # Signal handlers compare with the stored level: make it the one the change applies to.
+            self._loaded_values['stock_qty'] = self.stock_qty - change
+            super().save(*args, **kwargs)
+        self._remember_tracked_fields(['stock_qty'])
+
+    @property
+    def available_qty(self):
+        return self.stock_qty - self.reserved_qty
+
     def __str__(self):
         return f"{self.sku} - {self.name}"
 
-class Customer(models.Model):
+class Customer(TrackedFieldsMixin, models.Model):
     code = models.CharField(max_length=50, unique=True, help_text="Unique Customer ID")
     name = models.CharField(max_length=200)
     phone = models.CharField(max_length=20)
     address = models.TextField()
     email = models.EmailField(blank=True, null=True)
     opening_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False,
+                                  help_text="Running balance, maintained by erp.balances")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    tracked_fields = ('opening_balance',)
+    maintained_fields = ('balance',)
+
     def __str__(self):
         return f"{self.name} ({self.code})"
 
-class SalesOrder(models.Model):
+class SalesOrder(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('CONFIRMED', 'Confirmed'),
@@ -39,11 +128,49 @@ class SalesOrder(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
 
+    class Meta:
+        indexes = [
+            # Serves the order list's keyset pagination on (-order_date, -id).
+            models.Index(fields=['order_date', 'id'], name='erp_order_date_id_idx'),
+        ]
+
+    tracked_fields = ('status',)
+    # Only changed by _transition(), a compare-and-set on the stored status.
+    maintained_fields = ('status',)
+
     def save(self, *args, **kwargs):
         if not self.order_number:
-            last_id = SalesOrder.objects.aggregate(max_id=models.Max('id'))['max_id'] or 0
-            self.order_number = f"ORD-{last_id + 1:04d}"
-        super().save(*args, **kwargs)
+            from .sequences import order_numbers
+            self.order_number = order_numbers.next_number()
+        stored = None if self._state.adding else self.loaded_value('status')
+        if stored is None or stored == self.status:
+            return super().save(*args, **kwargs)
+        # A status set by hand goes through the same compare-and-set as
+        # confirm() and cancel(), so its stock is moved exactly once.
+        with transaction.atomic():
+            if not self._transition(stored, self.status):
+                raise ValueError(f"Order {self.order_number} is no longer {stored}; reload it before changing its status.")
+            super().save(*args, **kwargs)
+
+    def _transition(self, source, target):
+        # Compare-and-set on the stored status, so an order confirmed or
+        # cancelled concurrently is never processed twice.
+        from .orders import apply_status_change
+        with transaction.atomic():
+            if not SalesOrder.objects.filter(pk=self.pk, status=source).update(status=target):
+                return False
+            self.status = target
+            apply_status_change(self, source, target)
+        self._remember_tracked_fields(['status'])
+        return True
+
+    def confirm(self):
+        """Confirm a pending order, deducting its stock. Returns False if it was not pending."""
+        return self._transition('PENDING', 'CONFIRMED')
+
+    def cancel(self):
+        """Cancel the order, restoring stock if it was confirmed. Returns False if it was already cancelled."""
+        return self._transition('CONFIRMED', 'CANCELLED') or self._transition('PENDING', 'CANCELLED')
 
     def __str__(self):
         return self.order_number
@@ -54,6 +181,10 @@ class SalesOrderItem(models.Model):
     qty = models.IntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     total = models.DecimalField(max_digits=12, decimal_places=2, editable=False)
+    cost = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True, editable=False,
+        help_text='qty times the cost price when the order was confirmed; see erp.rollups',
+    )
 
     def save(self, *args, **kwargs):
         self.total = self.qty * self.price
@@ -62,6 +193,32 @@ class SalesOrderItem(models.Model):
     def __str__(self):
         return f"{self.order.order_number} - {self.product.name}"
 
+class CustomerLedgerEntry(models.Model):
+    """A change to a customer's balance, with the balance after it; see erp.balances."""
+    customer = models.ForeignKey(Customer, related_name='ledger_entries', on_delete=models.CASCADE)
+    order = models.ForeignKey(SalesOrder, null=True, blank=True, on_delete=models.SET_NULL)
+    timestamp = models.DateTimeField(auto_now_add=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    notes = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        indexes = [
+            # Serves statements: the last entry before a date, then a range.
+            models.Index(fields=['customer', 'timestamp', 'id'], name='erp_ledger_customer_ts_idx'),
+        ]
+
+    @property
+    def charge(self):
+        return self.amount if self.amount > 0 else None
+
+    @property
+    def credit(self):
+        return -self.amount if self.amount < 0 else None
+
+    def __str__(self):
+        return f"{self.customer_id} {self.amount:+} = {self.balance}"
+
 class StockMovement(models.Model):
     MOVEMENT_TYPES = [
         ('IN', 'In'),
@@ -71,8 +228,88 @@ class StockMovement(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     qty = models.IntegerField(help_text="Negative for Out, Positive for In")
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
     notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Serves the per-product range sums of erp.ledger.
+            models.Index(fields=['product', 'timestamp'], name='erp_movement_product_ts_idx'),
+        ]
+
     def __str__(self):
          return f"{self.product.sku} - {self.qty} ({self.timestamp})"
+
+class StockReservation(models.Model):
+    """Units of a product held for a pending order until ``expires_at``; see erp.reservations."""
+    order = models.ForeignKey(SalesOrder, related_name='reservations', on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE)
+    qty = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='erp_reservation_order_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} holds {self.qty} x {self.product_id} until {self.expires_at}"
+
+class StockShard(models.Model):
+    """Part of a hot product's stock (``qty``) and of its reservations (``reserved``); see erp.sharding."""
+    product = models.ForeignKey(Product, related_name='shards', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    qty = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='erp_shard_product_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.qty} ({self.reserved} reserved)"
+
+class StockSnapshot(models.Model):
+    product = models.ForeignKey(Product, related_name='snapshots', on_delete=models.CASCADE)
+    as_of = models.DateTimeField(help_text="The snapshot covers every movement timestamped at or before this time")
+    qty = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'as_of'], name='erp_snapshot_product_as_of'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} = {self.qty} @ {self.as_of}"
+
+class Sequence(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1, help_text="First value not yet handed out to any process")
+
+    def __str__(self):
+        return f"{self.name} ({self.next_value})"
+
+class StatCounter(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+class DailySalesRollup(models.Model):
+    """Confirmed sales per day and product, maintained by erp.rollups."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='erp_rollup_day_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.units} units"
@@ -0,0 +1,109 @@
+"""
+Sales order workflow.
+
+New orders are written by ``create_orders()`` in a fixed number of queries
+whatever their size: order numbers come from the preallocated sequence
+block, line totals are computed in memory from the products' prices, and
+orders and items are inserted with ``bulk_create``. The order form, the JSON
+endpoint and the bulk importer all go through it.
+
+Pending orders reserve their stock (see ``erp.reservations``); an order
+that would take more than is available is refused with
+``InsufficientStock``.
+
+Status changes go through ``SalesOrder.confirm()`` and ``cancel()``, or
+through a plain ``save()``; either way a compare-and-set on the stored
+status decides which transaction applies the side effects below, so they
+run once. A ``save()`` whose instance no longer has the stored status is
+refused with ValueError.
+"""
+from django.db import transaction
+
+from .models import SalesOrder, SalesOrderItem
+from .sequences import order_numbers
+from . import balances, reservations, rollups, stats, stock, versions
+
+
+def create_orders(entries, user=None):
+    """
+    Create orders from ``[(customer, status, [(product, qty), ...]), ...]``.
+
+    Products must come with ``selling_price`` loaded, and with ``cost_price``
+    too for orders created as ``CONFIRMED``, whose stock is deducted right
+    away. ``PENDING`` orders reserve theirs, and none of the orders is
+    created if any lacks stock: ``InsufficientStock`` is raised instead.
+    Returns the saved orders.
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+    user_id = user.pk if user else None
+    orders, order_lines = [], []
+    for (customer, status, lines), number in zip(entries, order_numbers.take_numbers(len(entries))):
+        lines = [(product, qty, qty * product.selling_price) for product, qty in lines]
+        orders.append(SalesOrder(
+            order_number=number, customer=customer, created_by_id=user_id, status=status,
+            total_amount=sum(total for product, qty, total in lines),
+        ))
+        order_lines.append(lines)
+
+    with transaction.atomic():
+        SalesOrder.objects.bulk_create(orders)
+        SalesOrderItem.objects.bulk_create([
+            SalesOrderItem(
+                order_id=order.pk, product_id=product.pk, qty=qty, price=product.selling_price, total=total,
+                cost=qty * product.cost_price if order.status == 'CONFIRMED' else None,
+            )
+            for order, lines in zip(orders, order_lines)
+            for product, qty, total in lines
+        ])
+
+        deltas, sales, pending = {}, {}, []
+        for order, lines in zip(orders, order_lines):
+            if order.status == 'PENDING':
+                quantities = {}
+                for product, qty, total in lines:
+                    quantities[product.pk] = quantities.get(product.pk, 0) + qty
+                pending.append((order.pk, quantities))
+            elif order.status == 'CONFIRMED':
+                for product, qty, total in lines:
+                    deltas[product.pk] = deltas.get(product.pk, 0) - qty
+                    units, revenue, cost = sales.get((order.order_date, product.pk), (0, 0, 0))
+                    sales[order.order_date, product.pk] = (units + qty, revenue + total, cost + qty * product.cost_price)
+        reservations.reserve(pending)
+        if deltas:
+            confirmed = [order.order_number for order in orders if order.status == 'CONFIRMED']
+            notes = f"Order {confirmed[0]} Confirmed" if len(confirmed) == 1 else f"Orders {confirmed[0]}..{confirmed[-1]} Confirmed"
+            stock.apply_movements(deltas, user_id=user_id, notes=notes)
+            rollups.add(sales)
+            balances.post_orders([order for order in orders if order.status == 'CONFIRMED'])
+        stats.adjust({stats.orders_on(orders[0].order_date): len(orders)})
+        # bulk_create() sends no signals.
+        versions.bump(SalesOrder, SalesOrderItem)
+
+    for order in orders:
+        order._remember_tracked_fields()
+    return orders
+
+
+def create_order(customer, lines, user=None, status='PENDING'):
+    """Create one order from ``[(product, qty), ...]``; see ``create_orders()``."""
+    return create_orders([(customer, status, lines)], user=user)[0]
+
+
+def apply_status_change(order, old_status, new_status):
+    """Move stock, book or unbook the sale and charge or credit the customer for a status transition."""
+    if old_status == new_status:
+        return
+    # confirm() and cancel() change the status with update(), which sends no signals.
+    versions.bump(order)
+    if new_status == 'CONFIRMED':
+        stock.deduct_order(order)
+        rollups.record_order(order)
+        balances.post_orders([order])
+    elif new_status == 'CANCELLED' and old_status == 'CONFIRMED':
+        stock.restore_order(order)
+        rollups.record_order(order, sign=-1)
+        balances.post_orders([order], sign=-1)
+    elif new_status == 'CANCELLED':
+        reservations.release([order.pk])
@@ -0,0 +1,163 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``OFFSET n`` plus a ``COUNT(*)`` per page, each page is fetched
+with a ``WHERE (ordering columns) < (last row seen)`` filter, which an index
+on the ordering columns turns into a short range scan however deep the page
+is. Pages are addressed by an opaque token encoding the direction and the
+boundary row's ordering values; the exact total is only counted on request.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, values], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, values = json.loads(payload)
+    except (binascii.Error, ValueError, TypeError) as exc:
+        raise InvalidCursor(token) from exc
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(token)
+    return direction, values
+
+
+class CursorPage:
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate ``queryset`` on ``ordering``, e.g. ``('-order_date', '-id')``.
+
+    The last ordering field must be unique (normally the primary key) so that
+    every row has a distinct position.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.per_page = per_page
+
+    def count(self):
+        return self.queryset.count()
+
+    def _boundary(self, values, reverse):
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            step = Q(**{f'{self.fields[i]}__{"lt" if descending else "gt"}': values[i]})
+            for name, value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{name: value})
+            condition |= step
+        return condition
+
+    def _values(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def decode(self, cursor):
+        """
+        ``cursor``'s direction and ordering values, as the Python values of
+        their fields. Raises ``InvalidCursor`` for a token this paginator could
+        not have made.
+        """
+        direction, values = decode_cursor(cursor)
+        if len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        parsed = []
+        for name, value in zip(self.fields, values):
+            # A list or dict would pass str() through a CharField's to_python().
+            if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+                raise InvalidCursor(cursor)
+            try:
+                parsed.append(self.queryset.model._meta.get_field(name).to_python(value))
+            except (ValidationError, TypeError, ValueError) as exc:
+                raise InvalidCursor(cursor) from exc
+        return direction, parsed
+
+    def page(self, cursor=None, with_count=False):
+        """The page at ``cursor``; see ``decode()``."""
+        direction, values = self.decode(cursor) if cursor else ('next', None)
+        reverse = direction == 'prev'
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._boundary(values, reverse))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = encode_cursor('next', self._values(rows[-1]))
+            if (has_more and reverse) or (values is not None and not reverse):
+                previous_cursor = encode_cursor('prev', self._values(rows[0]))
+        return CursorPage(rows, next_cursor, previous_cursor, self.count() if with_count else None)
+
+
+class CursorPaginationMixin:
+    """
+    ``ListView`` mixin switching ``paginate_by`` to keyset pagination.
+
+    Views return the ordering from ``get_cursor_ordering()``; returning None
+    (e.g. for rank-ordered search results) keeps the regular paginator.
+    """
+    cursor_ordering = None
+    cursor_param = 'cursor'
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_cursor_ordering()
+        if not ordering:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, ordering, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_param), with_count=self.request.GET.get('count') == '1')
+        except InvalidCursor:
+            raise Http404("Invalid page cursor.")
+        return paginator, page, page.object_list, page.has_other_pages()
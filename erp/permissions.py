@@ -0,0 +1,65 @@
+"""
+Permission checks served from the cache.
+
+``ModelBackend`` loads a user's permissions - their own and those of their
+groups, the roles set up by ``create_roles.py`` - with two queries, once
+per request. ``CachedModelBackend`` keeps the result in the default cache
+across requests, under a key carrying two versions (see ``erp.versions``):
+
+* ``auth.group``, bumped when a group's permissions change or a group or
+  permission is deleted, which affects every member;
+* ``auth.user:<pk>``, bumped when that user's groups or own permissions
+  change.
+
+Both are bumped from ``m2m_changed`` and ``post_delete`` (see
+``erp.signals``) as the change is made, so a revoked permission stops
+working on the very next check. Permissions read from a lagging replica
+(``erp.routers``) are used for that request but never cached. In the steady state ``has_perm()``,
+``PermissionRequiredMixin`` and ``{% if perms... %}`` run no queries.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from . import routers, versions
+
+GROUPS = 'auth.group'
+TIMEOUT = 3600
+
+
+def user_dependency(user_id):
+    return versions.dependency(get_user_model(), user_id)
+
+
+def _cache_key(user):
+    group_version, user_version = versions.versions(GROUPS, user_dependency(user.pk))
+    # Superusers get every permission, so losing the flag must change the key.
+    return f'erp:permissions:{user.pk}:{int(user.is_superuser)}:{group_version}:{user_version}'
+
+
+class CachedModelBackend(ModelBackend):
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = _cache_key(user_obj)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                if not routers.reading_from_replica():
+                    cache.set(key, permissions, TIMEOUT)
+            user_obj._perm_cache = set(permissions)
+        return user_obj._perm_cache
+
+
+def membership_changed(instance, reverse, pk_set, action):
+    """Bump the versions of the users whose groups or own permissions an ``m2m_changed`` signal reports."""
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        versions.bump(user_dependency(instance.pk))
+    elif pk_set:
+        versions.bump(*[user_dependency(pk) for pk in pk_set])
+    else:
+        # group.user_set.clear(): the members are gone already.
+        versions.bump(GROUPS)
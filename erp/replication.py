@@ -0,0 +1,22 @@
+"""
+Stand-in replication for SQLite replicas.
+
+Real deployments replicate with the database server (streaming replication,
+a managed read replica, ...). For local development and tests, ``sync()``
+copies the primary into a replica with SQLite's online backup API, which
+gives a consistent snapshot of the primary without blocking its writers for
+long. Run ``manage.py sync_replica --interval N`` to keep replicas a few
+seconds behind, like a real lagging replica.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def sync(alias, source=DEFAULT_DB_ALIAS):
+    """Overwrite replica ``alias`` with a snapshot of ``source``."""
+    primary = connections[source]
+    replica = connections[alias]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise ValueError("Stand-in replication only supports SQLite databases.")
+    primary.ensure_connection()
+    replica.ensure_connection()
+    primary.connection.backup(replica.connection)
@@ -0,0 +1,201 @@
+"""
+Stock reservations for pending orders.
+
+A pending order holds its units with ``StockReservation`` rows, one per
+order and product, so that a burst of orders cannot all be promised the
+same stock. ``Product.reserved_qty`` is the sum of a product's reservations,
+kept in step with ``F()`` updates as rows come and go, so
+``Product.available_qty`` (``stock_qty - reserved_qty``) costs nothing to
+read.
+
+* ``create_orders()`` reserves the lines of new pending orders with
+  ``reserve()``, which raises ``InsufficientStock`` rather than promise
+  more than is available (after releasing any expired reservations of the
+  products concerned).
+* Saving or deleting an item of a pending order brings its reservation in
+  line with ``sync()`` (see ``erp.signals``). Edits are not refused, much
+  like a stock adjustment.
+* Confirming an order converts its reservation: ``erp.stock.deduct_order``
+  deletes the rows and moves the units out of ``reserved_qty`` in the same
+  update that deducts the stock and writes the ``StockMovement``.
+* Cancelling or deleting a pending order releases its reservation.
+* Reservations expire ``STOCK_RESERVATION_MINUTES`` after they are made,
+  and ``manage.py expire_reservations`` releases them. The order stays
+  pending and can still be confirmed; its units are just no longer held.
+
+Reservations of a product are only written while that product's row is
+locked, in primary key order as in ``erp.stock``, so ``reserved_qty`` stays
+exact under concurrent orders, confirmations and sweeps. For a sharded
+product (see ``erp.sharding``) the order's home shard is locked instead and
+its ``reserved`` holds the units; a home shard short of stock borrows from
+the others before an order is refused.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StockReservation
+from . import sharding
+
+SWEEP_BATCH = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        # [(sku, requested, available), ...]
+        self.shortages = shortages
+        super().__init__("; ".join(
+            f"{sku}: {requested} requested, {max(available, 0)} available" for sku, requested, available in shortages
+        ))
+
+
+def take(reservations):
+    """
+    Delete the ``reservations`` (a queryset) and return ``[(product_id,
+    order_id, qty), ...]`` of what they held. The caller holds the counters'
+    locks and takes the units out of them.
+    """
+    rows = list(reservations.values_list('pk', 'product_id', 'order_id', 'qty'))
+    if not rows:
+        return []
+    StockReservation.objects.filter(pk__in=[pk for pk, product_id, order_id, qty in rows]).delete()
+    return [(product_id, order_id, qty) for pk, product_id, order_id, qty in rows]
+
+
+def _release(reservations, counters):
+    released = {}
+    for product_id, order_id, qty in take(reservations):
+        counters.add(product_id, order_id, reserved=-qty)
+        released[product_id] = released.get(product_id, 0) + qty
+    return released
+
+
+def _expires_at():
+    return timezone.now() + datetime.timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+
+
+def _shortages(counters, demand):
+    """``{counter: shortfall}`` of the counters that cannot cover ``demand``, ``{counter: (key, qty)}``."""
+    short = {}
+    for counter, (key, qty) in demand.items():
+        available = counters.available(counter[0], key)
+        if qty > available:
+            short[counter] = qty - available
+    return short
+
+
+def reserve(entries, strict=True):
+    """
+    Reserve stock for ``[(order_id, {product_id: qty}), ...]``. With
+    ``strict``, raise ``InsufficientStock`` instead of reserving more than
+    a product has available.
+    """
+    entries = [(order_id, {pk: qty for pk, qty in quantities.items() if qty > 0}) for order_id, quantities in entries]
+    keys = {}
+    for order_id, quantities in entries:
+        for pk in quantities:
+            keys.setdefault(pk, set()).add(order_id)
+    if not keys:
+        return
+    # No savepoint: a refusal is meant to undo the caller's whole transaction.
+    with transaction.atomic(savepoint=False):
+        counters = sharding.lock(keys)
+        demand = {}
+        for order_id, quantities in entries:
+            for pk, qty in quantities.items():
+                counter = counters.counter(pk, order_id)
+                key, total = demand.get(counter, (order_id, 0))
+                demand[counter] = (key, total + qty)
+        if strict:
+            short = _shortages(counters, demand)
+            if short:
+                # Lapsed holds may still be waiting for the sweeper.
+                now = timezone.now()
+                for pk, shard in short:
+                    if shard is None:
+                        lapsed = StockReservation.objects.filter(product_id=pk)
+                    else:
+                        lapsed = sharding.home_reservations(counters, pk, demand[pk, shard][0])
+                    _release(lapsed.filter(expires_at__lte=now), counters)
+                short = _shortages(counters, demand)
+            if any(shard is not None for pk, shard in short):
+                for (pk, shard), missing in short.items():
+                    if shard is not None:
+                        sharding.borrow(counters, pk, demand[pk, shard][0], missing)
+                short = _shortages(counters, demand)
+            if short:
+                shortages = {}
+                for (pk, shard), missing in short.items():
+                    key, qty = demand[pk, shard]
+                    sku, requested, available = shortages.get(pk, (counters.sku(pk), 0, 0))
+                    shortages[pk] = (sku, requested + qty, available + counters.available(pk, key))
+                raise InsufficientStock([shortages[pk] for pk in sorted(shortages)])
+        expires_at = _expires_at()
+        StockReservation.objects.bulk_create([
+            StockReservation(order_id=order_id, product_id=pk, qty=qty, expires_at=expires_at)
+            for order_id, quantities in entries
+            for pk, qty in sorted(quantities.items())
+        ])
+        for order_id, quantities in entries:
+            for pk, qty in quantities.items():
+                counters.add(pk, order_id, reserved=qty)
+        counters.save()
+
+
+def sync(order_id, quantities):
+    """Make a pending order's reservation match ``{product_id: qty}``, its current lines."""
+    quantities = {pk: qty for pk, qty in quantities.items() if qty > 0}
+    held = StockReservation.objects.filter(order_id=order_id)
+    product_ids = set(quantities) | set(held.values_list('product_id', flat=True))
+    if not product_ids:
+        return
+    with transaction.atomic():
+        counters = sharding.lock({pk: {order_id} for pk in product_ids})
+        expires_at = min(held.values_list('expires_at', flat=True), default=None) or _expires_at()
+        _release(held, counters)
+        StockReservation.objects.bulk_create([
+            StockReservation(order_id=order_id, product_id=pk, qty=qty, expires_at=expires_at)
+            for pk, qty in sorted(quantities.items())
+        ])
+        for pk, qty in quantities.items():
+            counters.add(pk, order_id, reserved=qty)
+        counters.save()
+
+
+def release(order_ids):
+    """Release the reservations of cancelled or deleted orders."""
+    reservations = StockReservation.objects.filter(order_id__in=order_ids)
+    keys = {}
+    for product_id, order_id in reservations.values_list('product_id', 'order_id'):
+        keys.setdefault(product_id, set()).add(order_id)
+    if not keys:
+        return {}
+    with transaction.atomic():
+        counters = sharding.lock(keys)
+        released = _release(reservations, counters)
+        counters.save()
+        return released
+
+
+def expire(now=None):
+    """
+    Release every reservation that expired by ``now``, a batch of products
+    per transaction. Returns ``(reservations, units)`` released.
+    """
+    now = now or timezone.now()
+    count = units = 0
+    while True:
+        product_ids = sorted(set(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .values_list('product_id', flat=True)[:SWEEP_BATCH]
+        ))
+        if not product_ids:
+            return count, units
+        with transaction.atomic():
+            counters = sharding.lock({pk: {sharding.ALL} for pk in product_ids})
+            expired = StockReservation.objects.filter(product_id__in=product_ids, expires_at__lte=now)
+            count += expired.count()
+            units += sum(_release(expired, counters).values())
+            counters.save()
@@ -0,0 +1,101 @@
+"""
+Daily sales rollups.
+
+``DailySalesRollup`` holds the units, revenue and cost of goods sold per day
+and product for confirmed orders. Confirming an order adds its lines and
+cancelling a confirmed order subtracts them, in the same transaction as the
+stock change, so reports (see ``erp.analytics``) read a table whose size
+depends on the number of days and products sold, never on the number of
+orders. Cost is the product's ``cost_price`` at the time of confirmation,
+kept in ``SalesOrderItem.cost`` so a cancellation takes out what was added.
+
+``rebuild()`` (``manage.py rebuild_sales_rollups``) recomputes the table from
+the orders; lines confirmed before ``cost`` was kept use today's cost prices.
+"""
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import DailySalesRollup, Product, SalesOrderItem
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _lines(items):
+    rows = (
+        items.values('order__order_date', 'product_id')
+        .annotate(units=Sum('qty'), revenue=Sum('total'), cost=Sum(
+            Coalesce('cost', F('qty') * F('product__cost_price'), output_field=MONEY), output_field=MONEY,
+        ))
+        .order_by()
+    )
+    return ((row['order__order_date'], row['product_id'], row['units'], row['revenue'], row['cost']) for row in rows)
+
+
+def order_lines(order_ids):
+    """Return ``{(day, product_id): (units, revenue, cost)}`` summed over the given orders."""
+    return {(day, pk): (units, revenue, cost) for day, pk, units, revenue, cost in _lines(SalesOrderItem.objects.filter(order_id__in=order_ids))}
+
+
+def _matching(keys):
+    products_by_day = {}
+    for day, pk in keys:
+        products_by_day.setdefault(day, []).append(pk)
+    condition = Q()
+    for day, pks in products_by_day.items():
+        condition |= Q(day=day, product_id__in=pks)
+    return DailySalesRollup.objects.filter(condition)
+
+
+def add(deltas, sign=1):
+    """Add ``{(day, product_id): (units, revenue, cost)}``, times ``sign``, to the rollups."""
+    deltas = {key: values for key, values in deltas.items() if any(values)}
+    if not deltas:
+        return
+
+    def increment(field, index, output_field):
+        return F(field) + Case(
+            *[When(day=day, product_id=pk, then=Value(sign * values[index])) for (day, pk), values in deltas.items()],
+            default=Value(0),
+            output_field=output_field,
+        )
+
+    changes = {
+        'units': increment('units', 0, IntegerField()),
+        'revenue': increment('revenue', 1, MONEY),
+        'cost': increment('cost', 2, MONEY),
+    }
+    queryset = _matching(deltas)
+    with transaction.atomic():
+        if queryset.update(**changes) < len(deltas):
+            # First sale of a product on a day: start the row at zero.
+            existing = set(queryset.values_list('day', 'product_id'))
+            missing = [key for key in deltas if key not in existing]
+            DailySalesRollup.objects.bulk_create(
+                [DailySalesRollup(day=day, product_id=pk) for day, pk in missing], ignore_conflicts=True,
+            )
+            _matching(missing).update(**changes)
+
+
+def record_order(order, sign=1):
+    """
+    Add a confirmed order to the rollups, costing its lines at today's cost
+    prices (``sign=-1`` takes it out again, at the cost it was added with).
+    """
+    if sign > 0:
+        cost_price = Product.objects.filter(pk=OuterRef('product_id')).values('cost_price')[:1]
+        SalesOrderItem.objects.filter(order_id=order.pk).update(cost=F('qty') * Subquery(cost_price))
+    add(order_lines([order.pk]), sign)
+
+
+def rebuild():
+    """Recompute every rollup from the confirmed orders. Returns the number of rows written."""
+    items = SalesOrderItem.objects.filter(order__status='CONFIRMED')
+    with transaction.atomic():
+        DailySalesRollup.objects.all().delete()
+        rollups = [
+            DailySalesRollup(day=day, product_id=pk, units=units, revenue=revenue, cost=cost)
+            for day, pk, units, revenue, cost in _lines(items)
+        ]
+        DailySalesRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
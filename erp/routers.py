@@ -0,0 +1,130 @@
+"""
+Primary/replica database routing.
+
+Writes always go to ``default``. Reads go to one of the aliases in
+``settings.DATABASE_REPLICAS`` only while ``ReplicaMiddleware`` is handling
+a request for a view listed in ``settings.REPLICA_VIEWS``; everything else
+(management commands, background work, other views) reads from the primary.
+
+Replicas lag behind the primary, so a user who has just written would not
+see their change. To avoid that, a request that writes anything - the router
+sees every write - marks the user's reads as sticky to the primary for
+``REPLICA_STICKY_SECONDS`` with a cookie, and the rest of that request reads
+from the primary as well. Reads inside a transaction on the primary also stay
+on the primary.
+"""
+import contextvars
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'erp_primary_until'
+
+_routing = contextvars.ContextVar('erp_replica_routing', default=None)
+
+
+class RequestRouting:
+    def __init__(self, request):
+        self.request = request
+        self.wrote = False
+        self.decided = False
+        self.replica = None
+
+    def read_alias(self):
+        if self.wrote:
+            return DEFAULT_DB_ALIAS
+        # The view is only known once the URL is resolved; reads before that
+        # (e.g. from middleware) go to the primary.
+        if not self.decided and self.request.resolver_match is not None:
+            self.decided = True
+            self.replica = choose_replica(self.request)
+        return self.replica or DEFAULT_DB_ALIAS
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.read_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data, just at different points in time.
+        return True
+
+
+def reading_from_replica():
+    """Whether the request being handled reads from a replica."""
+    routing = _routing.get()
+    return routing is not None and routing.read_alias() != DEFAULT_DB_ALIAS
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def _is_sticky(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def choose_replica(request):
+    """The replica ``request`` may read from, or None for the primary."""
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    if (
+        replicas
+        and request.method in ('GET', 'HEAD')
+        and request.resolver_match.url_name in getattr(settings, 'REPLICA_VIEWS', ())
+        and not _is_sticky(request)
+    ):
+        return random.choice(replicas)
+    return None
+
+
+class ReplicaMiddleware:
+    """Let replica-safe views read from a replica, and make writers stick to the primary."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        routing = RequestRouting(request)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(routing, response)
+
+    async def __acall__(self, request):
+        routing = RequestRouting(request)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(routing, response)
+
+    def finish(self, routing, response):
+        if routing.wrote:
+            seconds = sticky_seconds()
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds, httponly=True, samesite='Lax')
+        return response
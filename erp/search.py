@@ -0,0 +1,115 @@
+"""
+Product search index.
+
+On SQLite the catalog is indexed in an FTS5 table (``erp_product_fts``) kept
+in sync with ``erp_product`` by triggers, so every write path - forms,
+admin, ``bulk_create`` and raw SQL - updates it. Results are ranked with
+bm25, weighting SKU over name over category. Every search term is matched
+as a prefix, which gives SKU prefix matching (``DELL-X`` finds ``DELL-XPS``).
+
+On PostgreSQL the same columns get trigram GIN indexes, which serve the
+``ILIKE`` lookups, and results are ranked by ``similarity()``. Other backends
+fall back to the plain ``LIKE`` filter.
+
+The index structures are created after ``migrate`` (the SQLite migration
+machinery rebuilds tables and would silently drop the triggers otherwise),
+and ``manage.py reindex_products`` rebuilds them from scratch.
+"""
+import re
+
+from django.db import connection as default_connection, connections
+from django.db.models import Case, F, FloatField, Func, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'erp_product_fts'
+FTS_RANK = 'bm25(10.0, 5.0, 1.0)'
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        sku, name, category, content='erp_product', content_rowid='id', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON erp_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, sku, name, category) VALUES (new.id, new.sku, new.name, new.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON erp_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, sku, name, category) VALUES ('delete', old.id, old.sku, old.name, old.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF sku, name, category ON erp_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, sku, name, category) VALUES ('delete', old.id, old.sku, old.name, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, sku, name, category) VALUES (new.id, new.sku, new.name, new.category);
+    END""",
+]
+
+POSTGRESQL_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS erp_product_sku_trgm ON erp_product USING gin (UPPER(sku) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS erp_product_name_trgm ON erp_product USING gin (UPPER(name) gin_trgm_ops)",
+]
+
+
+def _sqlite_triggers(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f'{FTS_TABLE}_%'])
+    return {row[0] for row in cursor.fetchall()}
+
+
+def install(connection=None):
+    """Create any missing index structures. Returns True if the index had to be rebuilt."""
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            complete = len(_sqlite_triggers(cursor)) == 3
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', %s)", [FTS_RANK])
+            if not complete:
+                rebuild(connection)
+                return True
+        elif connection.vendor == 'postgresql':
+            for statement in POSTGRESQL_SCHEMA:
+                cursor.execute(statement)
+    return False
+
+
+def rebuild(connection=None):
+    connection = connection or default_connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute("REINDEX INDEX erp_product_sku_trgm")
+            cursor.execute("REINDEX INDEX erp_product_name_trgm")
+
+
+def fts_query(q):
+    """Turn user input into an FTS5 query: each term becomes a prefix phrase."""
+    phrases = []
+    for term in q.split():
+        words = re.findall(r'\w+', term.lower())
+        if words:
+            phrases.append('"%s"*' % ' '.join(words))
+    return ' '.join(phrases)
+
+
+def search_products(queryset, q):
+    """Filter ``queryset`` to products matching ``q``, best matches first."""
+    # The database the queryset reads from, which may be a replica.
+    connection = connections[queryset.db]
+    if connection.vendor == 'sqlite':
+        expression = fts_query(q)
+        if not expression:
+            return queryset.none()
+        rank = RawSQL(
+            f'SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = "erp_product"."id"',
+            [expression], output_field=FloatField(),
+        )
+        return (
+            queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression]))
+            .annotate(search_rank=rank).order_by('search_rank', 'pk')
+        )
+
+    matches = queryset.filter(Q(name__icontains=q) | Q(sku__icontains=q))
+    if connection.vendor == 'postgresql':
+        similarity = Func(F('name'), Value(q), function='similarity', output_field=FloatField())
+        sku_prefix = Case(When(sku__istartswith=q, then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+        return matches.annotate(rank=sku_prefix + similarity).order_by('-rank', 'pk')
+    return matches
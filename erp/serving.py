@@ -0,0 +1,316 @@
+"""
+Static and media file serving.
+
+``collectstatic`` copies every static file under a content-hashed name
+(``admin/css/base.css`` -> ``admin/css/base.5af66c1b1797.css``) and writes
+gzip - and, when the ``brotli`` package is installed, brotli - variants
+next to each text file (``base.5af66c1b1797.css.gz``). Templates refer to
+the hashed names through ``{% static %}``, so those never change and are
+served with a one-year ``immutable`` ``Cache-Control``: browsers do not
+even revalidate them.
+
+``serve()`` replaces ``django.views.static.serve`` for ``/static/`` and
+``/media/``. On top of it, it
+
+* keeps each file's size, mtime, ETag, content type and precompressed
+  variants in an in-process LRU cache (``metadata``), so a request costs
+  one ``open()`` and no ``stat()`` calls; media entries are re-checked every
+  ``MEDIA_RECHECK_SECONDS`` because uploads can replace a file in place;
+* answers ``If-None-Match`` / ``If-Modified-Since`` with ``304``;
+* sends the ``.br`` or ``.gz`` variant the client accepts;
+* answers single byte ranges (``Range``, ``If-Range``) with ``206``.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+# Variants saving less than this are not worth an extra file and a Vary header.
+MIN_COMPRESSION_RATIO = 0.95
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STATIC_CACHE_CONTROL = 'public, max-age=3600'
+MEDIA_CACHE_CONTROL = 'public, max-age=300'
+MEDIA_RECHECK_SECONDS = 2.0
+METADATA_CACHE_SIZE = 4096
+CHUNK_SIZE = 64 * 1024
+
+# ManifestStaticFilesStorage inserts the first 12 hex digits of the MD5.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed names plus precompressed ``.gz``/``.br`` variants, written by ``collectstatic``."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                compress(self.path(name))
+
+
+def compress(path):
+    """Write the compressed variants of ``path`` that are worth keeping; returns their encodings."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    for encoding, suffix in ENCODINGS:
+        if encoding == 'br':
+            if brotli is None:
+                continue
+            compressed = brotli.compress(data, quality=11)
+        else:
+            compressed = _gzip(data)
+        if len(compressed) < len(data) * MIN_COMPRESSION_RATIO:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(encoding)
+    return written
+
+
+def _gzip(data):
+    # mtime=0 keeps the output, and so its ETag, identical across deploys.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class FileInfo:
+    def __init__(self, path, stat):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.last_modified = http_date(stat.st_mtime)
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        content_type, encoding = mimetypes.guess_type(path)
+        self.content_type = content_type or 'application/octet-stream'
+        if content_type and content_type.startswith('text/') and 'charset' not in content_type:
+            self.content_type += '; charset=utf-8'
+        # A file that is itself compressed, e.g. a .tar.gz download.
+        self.encoding = encoding
+        self.variants = {}
+        if not encoding:
+            for name, suffix in ENCODINGS:
+                try:
+                    variant = os.stat(path + suffix)
+                except OSError:
+                    continue
+                self.variants[name] = (path + suffix, variant.st_size, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}-{name}"')
+        self.checked = time.monotonic()
+
+    def same_file(self, stat):
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+
+class MetadataCache:
+    """Thread-safe LRU of ``FileInfo`` by absolute path."""
+
+    def __init__(self, size=METADATA_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, path, recheck=None):
+        """``FileInfo`` for ``path``; raises FileNotFoundError. Entries older than ``recheck`` seconds are re-stat'ed."""
+        with self.lock:
+            info = self.entries.get(path)
+            if info is not None:
+                self.entries.move_to_end(path)
+        if info is not None and (recheck is None or time.monotonic() - info.checked < recheck):
+            self.hits += 1
+            return info
+        self.misses += 1
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.discard(path)
+            raise FileNotFoundError(path)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        if info is not None and info.same_file(stat):
+            info.checked = time.monotonic()
+            return info
+        info = FileInfo(path, stat)
+        with self.lock:
+            self.entries[path] = info
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return info
+
+    def discard(self, path):
+        with self.lock:
+            self.entries.pop(path, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+
+metadata = MetadataCache()
+
+
+def _not_modified(request, info, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison: proxies may add W/ to the ETags they pass on.
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return etag in tags or info.etag in tags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and info.mtime_ns // 1_000_000_000 <= if_modified_since
+
+
+def _accepted_encoding(request, info):
+    if not info.variants:
+        return None
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for name, suffix in ENCODINGS:
+        if name in info.variants and accepted.get(name, 0) > 0:
+            return name
+    return None
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` inclusive for a single ``bytes=`` range, None when the
+    header is absent or not understood (serve the whole file), or ``()`` when
+    the range cannot be satisfied.
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if not length:
+            return ()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return ()
+    if end < start:
+        return None
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, path, document_root=None, cache_control=None, recheck=None):
+    """
+    Serve ``path`` below ``document_root``.
+
+    ``cache_control`` defaults to one year ``immutable`` for content-hashed
+    names and to ``STATIC_CACHE_CONTROL`` otherwise. ``recheck`` is how long
+    cached metadata is trusted without a ``stat()``; None means forever,
+    right for ``collectstatic`` output, which only changes on deploy.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        response = HttpResponse(status=405)
+        response['Allow'] = 'GET, HEAD'
+        return response
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root, path)
+        info = metadata.get(fullpath, recheck)
+    except (FileNotFoundError, ValueError):
+        raise Http404(f"“{path}” does not exist")
+    if cache_control is None:
+        cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(path) else STATIC_CACHE_CONTROL
+
+    byte_range = None
+    if request.META.get('HTTP_RANGE'):
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None or if_range.strip() in (info.etag, info.last_modified):
+            byte_range = parse_range(request.META['HTTP_RANGE'], info.size)
+    # Ranges apply to the identity encoding, so a range request never gets a variant.
+    encoding = None if byte_range is not None else _accepted_encoding(request, info)
+    served_path, size, etag = info.variants[encoding] if encoding else (info.path, info.size, info.etag)
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': info.last_modified,
+        'Cache-Control': cache_control,
+    }
+    if info.variants:
+        headers['Vary'] = 'Accept-Encoding'
+
+    if _not_modified(request, info, etag):
+        response = HttpResponseNotModified()
+    elif byte_range == ():
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{info.size}'
+    elif byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        body = () if request.method == 'HEAD' else _read_range(info.path, start, length)
+        response = StreamingHttpResponse(body, status=206, content_type=info.content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{info.size}'
+        response['Content-Length'] = str(length)
+    else:
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=info.content_type)
+        else:
+            try:
+                response = FileResponse(open(served_path, 'rb'), content_type=info.content_type)
+            except FileNotFoundError:
+                metadata.discard(fullpath)
+                raise Http404(f"“{path}” does not exist")
+        response['Content-Length'] = str(size)
+        if encoding or info.encoding:
+            response['Content-Encoding'] = encoding or info.encoding
+    response['Accept-Ranges'] = 'bytes'
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def serve_static(request, path):
+    """``collectstatic`` output; it only changes on deploy, so metadata is never re-checked."""
+    return serve(request, path, settings.STATIC_ROOT)
+
+
+def serve_media(request, path):
+    """Uploaded files, which can be replaced in place."""
+    return serve(request, path, settings.MEDIA_ROOT, cache_control=MEDIA_CACHE_CONTROL, recheck=MEDIA_RECHECK_SECONDS)
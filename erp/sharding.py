@@ -0,0 +1,279 @@
+"""
+Sharded stock counters for hot products.
+
+Every confirmation writes its products' rows, so the row of a best-seller
+serializes every sale of it. Such a product can keep its stock in
+``stock_shards`` ``StockShard`` rows instead (``manage.py shard_stock SKU
+--shards 8``), each holding part of the units (``qty``) and the part of
+those reserved for pending orders (``reserved``):
+
+* an order's stock changes and reservations go to its *home* shard,
+  ``order_id % stock_shards``, and lock that row only, so orders on the
+  same product mostly lock different rows;
+* a reservation its home shard cannot cover borrows units from the other
+  shards, skipping those locked by other transactions;
+* ``rebalance()`` (``manage.py rebalance_stock_shards --interval 5``)
+  evens out the available units across the shards and rolls the totals up
+  into ``Product.stock_qty`` and ``reserved_qty``.
+
+For a sharded product, those two fields (and so the low-stock counter) are
+as of the last rebalance, which is fine for lists and dashboards;
+``levels()`` sums the shards for exact figures, and the ledger check
+compares against the sum.
+
+Lock order: product rows in primary key order, then shards by product and
+number. A transaction holding a shard of a product only takes more of that
+product's shards with ``SKIP LOCKED``, so it never waits for them.
+
+SQLite locks the whole database for each write transaction, so shards add
+no parallelism there. They pay off on databases with row locks.
+"""
+import random
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Mod
+
+from .models import Product, StockReservation, StockShard
+from . import stats, versions
+
+ALL = 'all'
+
+
+def split(total, parts):
+    """``total`` in ``parts`` near-equal integers."""
+    base, extra = divmod(total, parts)
+    return [base + (i < extra) for i in range(parts)]
+
+
+def random_key():
+    """A home shard key for stock changes that belong to no order."""
+    return random.randrange(1 << 30)
+
+
+def _case(values, key='pk'):
+    return Case(
+        *[When(**{key: pk}, then=Value(value)) for pk, value in values.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+class Counters:
+    """
+    The stock counters of some products, locked for the current transaction:
+    the product row of an unsharded product, and for a sharded one the home
+    shards of the keys asked for (or all its shards). Changes are collected
+    with ``add()`` and written by ``save()``, one ``UPDATE`` per table.
+    """
+
+    def __init__(self):
+        self.products = {}  # {pk: [sku, stock_qty, reserved_qty]}
+        self.shards = {}  # {(pk, shard): [id, qty, reserved]}
+        self.counts = {}  # {pk: (sku, stock_shards)} for the sharded products
+        self.product_changes = {}
+        self.shard_changes = {}
+
+    def lock(self, keys):
+        """
+        Lock the counters that hold the stock of ``{product_id: {key, ...}}``;
+        a key of ``ALL`` takes every shard of a sharded product.
+        """
+        while keys:
+            ids = sorted(keys)
+            self.products.update({
+                pk: [sku, stock_qty, reserved_qty]
+                for pk, sku, stock_qty, reserved_qty in Product.objects.select_for_update()
+                .filter(pk__in=ids, stock_shards=0).order_by('pk').values_list('pk', 'sku', 'stock_qty', 'reserved_qty')
+            })
+            rest = [pk for pk in ids if pk not in self.products]
+            if not rest:
+                break
+            counts = {
+                pk: (sku, count)
+                for pk, sku, count in Product.objects.filter(pk__in=rest).values_list('pk', 'sku', 'stock_shards')
+            }
+            wanted = Q(pk__in=[])
+            for pk, (sku, count) in counts.items():
+                if not count:
+                    continue
+                if ALL in keys[pk]:
+                    wanted |= Q(product_id=pk)
+                else:
+                    wanted |= Q(product_id=pk, shard__in={key % count for key in keys[pk]})
+            found = {
+                (pk, shard): [shard_id, qty, reserved]
+                for shard_id, pk, shard, qty, reserved in StockShard.objects.select_for_update()
+                .filter(wanted).order_by('product_id', 'shard').values_list('id', 'product_id', 'shard', 'qty', 'reserved')
+            }
+            self.shards.update(found)
+            held = {pk for pk, shard in found}
+            self.counts.update({pk: counts[pk] for pk in held})
+            # Sharded or unsharded again since the first read: look again.
+            keys = {pk: keys[pk] for pk in counts if pk not in held}
+        return self
+
+    def home(self, product_id, key):
+        return product_id, key % self.counts[product_id][1]
+
+    def _row(self, product_id, key):
+        if product_id not in self.products and product_id not in self.counts:
+            # Not among the rows locked up front, e.g. a reservation of a line
+            # deleted meanwhile: lock it now.
+            self.lock({product_id: {key}})
+            if product_id not in self.counts:
+                # Deleted products update nothing.
+                self.products.setdefault(product_id, [None, 0, 0])
+        if product_id in self.products:
+            return self.products[product_id], self.product_changes.setdefault(product_id, [0, 0])
+        if self.home(product_id, key) not in self.shards:
+            self.lock({product_id: {key}})
+            return self._row(product_id, key)
+        row = self.shards[self.home(product_id, key)]
+        return row, self.shard_changes.setdefault(row[0], [0, 0])
+
+    def sku(self, product_id):
+        return self.products[product_id][0] if product_id in self.products else self.counts[product_id][0]
+
+    def counter(self, product_id, key):
+        """Which counter keeps ``key``'s units of ``product_id``."""
+        return self.home(product_id, key) if product_id in self.counts else (product_id, None)
+
+    def available(self, product_id, key):
+        row, changes = self._row(product_id, key)
+        return row[-2] - row[-1]
+
+    def add(self, product_id, key, stock=0, reserved=0):
+        """Change the stock and reserved units of ``product_id`` where ``key`` keeps them."""
+        row, changes = self._row(product_id, key)
+        row[-2] += stock
+        row[-1] += reserved
+        changes[0] += stock
+        changes[1] += reserved
+
+    def save(self):
+        changed = self.product_changes or self.shard_changes
+        for model, changes, stock_field, reserved_field in [
+            (Product, self.product_changes, 'stock_qty', 'reserved_qty'),
+            (StockShard, self.shard_changes, 'qty', 'reserved'),
+        ]:
+            fields = {}
+            for index, field in enumerate([stock_field, reserved_field]):
+                values = {pk: change[index] for pk, change in changes.items() if change[index]}
+                if values:
+                    fields[field] = F(field) + _case(values)
+            if fields:
+                model.objects.filter(pk__in=sorted(changes)).update(**fields)
+        if changed:
+            # update() sends no signals.
+            versions.bump(Product)
+        self.product_changes, self.shard_changes = {}, {}
+
+
+def lock(keys):
+    """Lock the counters of ``{product_id: {key, ...}}``; see ``Counters.lock()``."""
+    return Counters().lock(keys)
+
+
+def borrow(counters, product_id, key, units):
+    """
+    Move up to ``units`` available units of a sharded product into the home
+    shard of ``key`` from its other shards, skipping any another
+    transaction holds. Returns the number moved.
+    """
+    mine = [shard for pk, shard in counters.shards if pk == product_id]
+    donors = (
+        StockShard.objects.select_for_update(skip_locked=True)
+        .filter(product_id=product_id, qty__gt=F('reserved')).exclude(shard__in=mine)
+        .order_by('shard').values_list('id', 'qty', 'reserved')
+    )
+    taken = {}
+    for shard_id, qty, reserved in donors:
+        if units <= 0:
+            break
+        taken[shard_id] = min(units, qty - reserved)
+        units -= taken[shard_id]
+    if taken:
+        StockShard.objects.filter(pk__in=list(taken)).update(qty=F('qty') - _case(taken))
+        counters.add(product_id, key, stock=sum(taken.values()))
+    return sum(taken.values())
+
+
+def home_reservations(counters, product_id, key):
+    """The reservations of a sharded product kept in ``key``'s home shard."""
+    pk, shard = counters.home(product_id, key)
+    return (
+        StockReservation.objects.filter(product_id=product_id)
+        .annotate(home=Mod('order_id', Value(counters.counts[product_id][1])))
+        .filter(home=shard)
+    )
+
+
+def levels(product_ids):
+    """Exact ``{product_id: (stock_qty, reserved_qty)}``, summing the shards of sharded products."""
+    products = Product.objects.filter(pk__in=product_ids).annotate(
+        shard_qty=Coalesce(Sum('shards__qty'), 0),
+        shard_reserved=Coalesce(Sum('shards__reserved'), 0),
+    ).values_list('pk', 'stock_shards', 'stock_qty', 'reserved_qty', 'shard_qty', 'shard_reserved')
+    return {
+        pk: (shard_qty, shard_reserved) if count else (stock_qty, reserved_qty)
+        for pk, count, stock_qty, reserved_qty, shard_qty, shard_reserved in products
+    }
+
+
+def _roll_up(product_id, stock_qty, reserved_qty, old_stock_qty):
+    Product.objects.filter(pk=product_id).update(stock_qty=stock_qty, reserved_qty=reserved_qty)
+    stats.adjust_low_stock({product_id: old_stock_qty}, {product_id: stock_qty - old_stock_qty})
+    versions.bump(Product)
+
+
+def shard(product, count):
+    """
+    Spread a product's stock over ``count`` shards, or gather it back into
+    the product row with ``count`` 0 or 1.
+    """
+    count = count if count > 1 else 0
+    with transaction.atomic():
+        old_stock_qty, stock_qty, reserved_qty = Product.objects.select_for_update().filter(pk=product.pk).values_list(
+            'stock_qty', 'stock_qty', 'reserved_qty').get()
+        shards = StockShard.objects.select_for_update().filter(product=product).order_by('shard')
+        totals = shards.aggregate(qty=Sum('qty'), reserved=Sum('reserved'))
+        if totals['qty'] is not None:
+            stock_qty, reserved_qty = totals['qty'], totals['reserved']
+            shards.delete()
+        if count:
+            reserved = [0] * count
+            for order_id, qty in StockReservation.objects.filter(product=product).values_list('order_id', 'qty'):
+                reserved[order_id % count] += qty
+            StockShard.objects.bulk_create([
+                StockShard(product_id=product.pk, shard=number, qty=reserved[number] + share, reserved=reserved[number])
+                for number, share in enumerate(split(stock_qty - reserved_qty, count))
+            ])
+        Product.objects.filter(pk=product.pk).update(stock_shards=count)
+        _roll_up(product.pk, stock_qty, reserved_qty, old_stock_qty)
+    product.stock_shards, product.stock_qty, product.reserved_qty = count, stock_qty, reserved_qty
+
+
+def rebalance():
+    """
+    Even out the available units across each sharded product's shards and
+    roll the totals up into the product. Returns the number of units moved.
+    """
+    moved = 0
+    for product_id in Product.objects.filter(stock_shards__gt=0).order_by('pk').values_list('pk', flat=True):
+        with transaction.atomic():
+            old_stock_qty, old_reserved_qty = Product.objects.select_for_update().filter(pk=product_id).values_list(
+                'stock_qty', 'reserved_qty').get()
+            shards = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('shard'))
+            stock_qty = sum(row.qty for row in shards)
+            reserved_qty = sum(row.reserved for row in shards)
+            changed = []
+            for row, share in zip(shards, split(stock_qty - reserved_qty, len(shards))):
+                if row.qty != row.reserved + share:
+                    moved += max(0, row.qty - row.reserved - share)
+                    row.qty = row.reserved + share
+                    changed.append(row)
+            StockShard.objects.bulk_update(changed, ['qty'])
+            if (stock_qty, reserved_qty) != (old_stock_qty, old_reserved_qty):
+                _roll_up(product_id, stock_qty, reserved_qty, old_stock_qty)
+    return moved
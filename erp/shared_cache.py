@@ -0,0 +1,303 @@
+"""
+A cache backend shared by all worker processes of one machine, without a
+cache server.
+
+Entries live in a memory-mapped file (put it on tmpfs, e.g. ``/dev/shm``)
+laid out as a fixed-size hash table::
+
+    header | set 0: slot 0 .. slot WAYS-1 | set 1: ... | set SLOTS/WAYS-1
+
+A key hashes to one *set* of ``WAYS`` slots and can only live there, so a
+lookup reads at most ``WAYS`` slot headers. A slot holds one entry - key
+hash, last use, expiry, key and pickled value - in at most ``SLOT_SIZE``
+bytes; larger values are not cached. When a set is full, ``set()`` reuses
+an expired slot, or else the least recently used one.
+
+Each set is guarded by an ``fcntl`` byte-range lock on the file, so
+processes only wait for one another when they touch the same set; threads
+of a process are serialized by a lock of their own (``fcntl`` locks belong
+to the process). ``clear()`` locks the whole file. Untouched parts of the
+file take no memory.
+
+Configuration::
+
+    CACHES = {'default': {
+        'BACKEND': 'erp.shared_cache.SharedMemoryCache',
+        'LOCATION': '/dev/shm/simple_erp.cache',
+        'OPTIONS': {'SLOTS': 4096, 'SLOT_SIZE': 16384, 'WAYS': 8},
+    }}
+
+Changing the geometry writes a new, empty file and renames it over the old
+one, which is never truncated while other processes may have it mapped: they
+see it marked retired on their next access and map the new file.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+MAGIC = b'ERPCACHE'
+LAYOUT_VERSION = 2
+HEADER = struct.Struct('<8sIIII')
+# Set once the file has been replaced by one of another geometry.
+RETIRED_OFFSET = HEADER.size
+HEADER_SIZE = 64
+# key hash (0 = empty), last use (ns), expiry (0 = never), value length, key length
+SLOT_HEADER = struct.Struct('<QQdIH2x')
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+class _Table:
+    """The mapped file; one per path and process, shared by the per-thread cache objects."""
+
+    def __init__(self, path, slots, slot_size, ways):
+        if slots % ways:
+            raise ValueError("SLOTS must be a multiple of WAYS")
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError(f"SLOT_SIZE must be larger than {SLOT_HEADER.size}")
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ways = ways
+        self.sets = slots // ways
+        self.size = HEADER_SIZE + slots * slot_size
+        self.lock = threading.Lock()
+        self.fd = self._open()
+        self.mm = mmap.mmap(self.fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    def _open(self):
+        """Open the file at ``path``, first replacing it if its geometry is not ours."""
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                # Another process may have replaced the file while we waited for the lock.
+                if self._is_current(fd):
+                    if not os.fstat(fd).st_size:
+                        self._format(fd)
+                    if self._valid(fd):
+                        return fd
+                    self._replace(fd)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _is_current(self, fd):
+        try:
+            return os.fstat(fd).st_ino == os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _header(self):
+        return HEADER.pack(MAGIC, LAYOUT_VERSION, self.slots, self.slot_size, self.ways)
+
+    def _valid(self, fd):
+        return os.fstat(fd).st_size == self.size and os.pread(fd, HEADER.size + 1, 0) == self._header() + b'\0'
+
+    def _format(self, fd):
+        # Only ever grows the file: processes mapping it never lose pages.
+        os.ftruncate(fd, self.size)
+        os.pwrite(fd, self._header(), 0)
+
+    def _replace(self, old_fd):
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            self._format(fd)
+        finally:
+            os.close(fd)
+        os.rename(temporary, self.path)
+        if os.fstat(old_fd).st_size > RETIRED_OFFSET:
+            os.pwrite(old_fd, b'\1', RETIRED_OFFSET)
+
+    @property
+    def retired(self):
+        return self.mm[RETIRED_OFFSET] != 0
+
+    @contextmanager
+    def locked(self, set_index=None):
+        """Lock one set, or the whole file."""
+        length, start = (1, set_index) if set_index is not None else (0, 0)
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start)
+
+    def clear(self):
+        # Other processes keep the file mapped, so it is emptied in place.
+        with self.locked():
+            for offset in range(HEADER_SIZE, self.size, self.slot_size):
+                if SLOT_HEADER.unpack_from(self.mm, offset)[0]:
+                    self.erase(offset)
+
+    def set_of(self, key_hash):
+        return key_hash % self.sets
+
+    def slot_offsets(self, set_index):
+        first = HEADER_SIZE + set_index * self.ways * self.slot_size
+        return range(first, first + self.ways * self.slot_size, self.slot_size)
+
+    def find(self, set_index, key_hash, key):
+        """Offset and header of the slot holding ``key``, or (None, None). Call with the set locked."""
+        for offset in self.slot_offsets(set_index):
+            header = SLOT_HEADER.unpack_from(self.mm, offset)
+            if header[0] == key_hash and header[4] == len(key) and self.read_key(offset, header) == key:
+                return offset, header
+        return None, None
+
+    def victim(self, set_index, now):
+        """The slot to overwrite: an empty one, else an expired one, else the least recently used."""
+        best, best_rank = None, None
+        for offset in self.slot_offsets(set_index):
+            key_hash, last_used, expires, value_length, key_length = SLOT_HEADER.unpack_from(self.mm, offset)
+            if not key_hash:
+                return offset
+            rank = -1 if expires and expires <= now else last_used
+            if best is None or rank < best_rank:
+                best, best_rank = offset, rank
+        return best
+
+    def read_key(self, offset, header):
+        start = offset + SLOT_HEADER.size
+        return self.mm[start:start + header[4]]
+
+    def read_value(self, offset, header):
+        start = offset + SLOT_HEADER.size + header[4]
+        return self.mm[start:start + header[3]]
+
+    def write(self, offset, key_hash, key, value, expires):
+        SLOT_HEADER.pack_into(self.mm, offset, 0, 0, 0.0, 0, 0)
+        start = offset + SLOT_HEADER.size
+        self.mm[start:start + len(key) + len(value)] = key + value
+        # The hash goes in last: a slot is only found once it is complete.
+        SLOT_HEADER.pack_into(self.mm, offset, key_hash, time.time_ns(), expires or 0.0, len(value), len(key))
+
+    def touch(self, offset, header, expires=None):
+        key_hash, last_used, old_expires, value_length, key_length = header
+        SLOT_HEADER.pack_into(self.mm, offset, key_hash, time.time_ns(),
+                              old_expires if expires is None else expires or 0.0, value_length, key_length)
+
+    def erase(self, offset):
+        SLOT_HEADER.pack_into(self.mm, offset, 0, 0, 0.0, 0, 0)
+
+
+def _table(path, slots, slot_size, ways):
+    key = (path, slots, slot_size, ways)
+    with _tables_lock:
+        pid = os.getpid()
+        table = _tables.get(key)
+        # A forked worker must not share the parent's in-process lock.
+        if table is None or table[0] != pid or table[1].retired:
+            table = _tables[key] = (pid, _Table(path, slots, slot_size, ways))
+        return table[1]
+
+
+def _expired(header, now):
+    return bool(header[2]) and header[2] <= now
+
+
+class SharedMemoryCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = str(location)
+        self.slots = int(options.get('SLOTS', 4096))
+        self.slot_size = int(options.get('SLOT_SIZE', 16384))
+        self.ways = int(options.get('WAYS', 8))
+
+    @property
+    def table(self):
+        return _table(self.location, self.slots, self.slot_size, self.ways)
+
+    def _key(self, key, version):
+        key = self.make_and_validate_key(key, version=version).encode()
+        key_hash = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+        return key_hash, key
+
+    def _store(self, key, value, timeout, only_if_missing=False):
+        key_hash, key = self._key(*key)
+        value = pickle.dumps(value, self.pickle_protocol)
+        expires = self.get_backend_timeout(timeout)
+        table = self.table
+        fits = SLOT_HEADER.size + len(key) + len(value) <= table.slot_size
+        set_index = table.set_of(key_hash)
+        now = time.time()
+        with table.locked(set_index):
+            offset, header = table.find(set_index, key_hash, key)
+            if offset is not None and only_if_missing and not _expired(header, now):
+                return False
+            if not fits:
+                # Too large to cache; do not leave an older value behind.
+                if offset is not None:
+                    table.erase(offset)
+                return False
+            if offset is None:
+                offset = table.victim(set_index, now)
+            table.write(offset, key_hash, key, value, expires)
+            return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store((key, version), value, timeout, only_if_missing=True)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store((key, version), value, timeout)
+
+    def _lookup(self, key, version, found):
+        key_hash, key = self._key(key, version)
+        table = self.table
+        set_index = table.set_of(key_hash)
+        with table.locked(set_index):
+            offset, header = table.find(set_index, key_hash, key)
+            if offset is None:
+                return None
+            if _expired(header, time.time()):
+                table.erase(offset)
+                return None
+            return found(table, offset, header)
+
+    def get(self, key, default=None, version=None):
+        def read(table, offset, header):
+            table.touch(offset, header)
+            return table.read_value(offset, header)
+
+        value = self._lookup(key, version, read)
+        return default if value is None else pickle.loads(value)
+
+    def has_key(self, key, version=None):
+        return self._lookup(key, version, lambda table, offset, header: True) is not None
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        return self._lookup(key, version, lambda table, offset, header: table.touch(offset, header, expires) or True) is not None
+
+    def delete(self, key, version=None):
+        return self._lookup(key, version, lambda table, offset, header: table.erase(offset) or True) is not None
+
+    def incr(self, key, delta=1, version=None):
+        # Read, add and write under the set's lock, so concurrent increments are never lost.
+        def add(table, offset, header):
+            value = pickle.loads(table.read_value(offset, header)) + delta
+            table.write(offset, header[0], table.read_key(offset, header),
+                        pickle.dumps(value, self.pickle_protocol), header[2])
+            return value
+
+        value = self._lookup(key, version, add)
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        return value
+
+    def clear(self):
+        self.table.clear()
@@ -1,63 +1,108 @@
-from django.db.models.signals import pre_save, post_save
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models.signals import m2m_changed, pre_save, post_save, pre_delete, post_delete, post_migrate
 from django.dispatch import receiver
-from django.db import transaction
-from .models import SalesOrder, SalesOrderItem, StockMovement
-
-@receiver(pre_save, sender=SalesOrder)
-def handle_warnings_and_stock_logic(sender, instance, **kwargs):
-    """
-    Handle stock deduction/restoration based on status transition.
-    Using pre_save to catch transition before commit (though stock updates should be atomic).
-    better to use separate method or check db status.
-    """
-    if not instance.pk:
-        if instance.status == 'CONFIRMED':
-            pass
-        return
-
-    try:
-        old_instance = SalesOrder.objects.get(pk=instance.pk)
-    except SalesOrder.DoesNotExist:
-        return
-
-    old_status = old_instance.status
-    new_status = instance.status
-
-    if old_status != new_status:
-        # Status Changed
-        if new_status == 'CONFIRMED' and old_status != 'CONFIRMED':
-            # Deduct Stock
-            deduct_stock(instance)
-        elif new_status == 'CANCELLED' and old_status == 'CONFIRMED':
-            # Restore Stock
-            restore_stock(instance)
-
-def deduct_stock(order):
-    items = order.items.all()
-    for item in items:
-        product = item.product
-        product.stock_qty -= item.qty
-        product.save()
-        
-        # Log movement
-        StockMovement.objects.create(
-            product=product,
-            qty=-item.qty,
-            user=order.created_by, # or current user if available in thread locals, but order.created_by is decent proxy or just None
-            notes=f"Order {order.order_number} Confirmed"
-        )
-
-def restore_stock(order):
-    items = order.items.all()
-    for item in items:
-        product = item.product
-        product.stock_qty += item.qty
-        product.save()
-
-        # Log movement
-        StockMovement.objects.create(
-            product=product,
-            qty=item.qty,
-            user=order.created_by,
-            notes=f"Order {order.order_number} Cancelled"
-        )
+from django.db import connections, transaction
+from django.db.models import F
+from .models import Product, Customer, SalesOrder, SalesOrderItem, StockMovement, StockShard
+from . import balances, permissions, reservations, search, stats, stock, thumbnails, versions
+
+@receiver([post_save, post_delete], sender=SalesOrderItem)
+def sync_reservation(sender, instance, raw=False, **kwargs):
+    """Keep the stock held for a pending order in line with its items."""
+    if not raw and instance.order.status == 'PENDING':
+        reservations.sync(instance.order_id, stock.order_quantities(instance.order_id))
+
+@receiver(pre_delete, sender=SalesOrder)
+def release_reservation(sender, instance, **kwargs):
+    # The cascade would delete the rows without giving the units back.
+    reservations.release([instance.pk])
+
+@receiver(pre_save, sender=Product)
+def remember_stock_level(sender, instance, **kwargs):
+    instance._stored_stock_qty = instance.loaded_value('stock_qty')
+
+@receiver(post_save, sender=Product)
+def count_product(sender, instance, created, **kwargs):
+    stats.adjust({
+        stats.PRODUCTS: 1 if created else 0,
+        stats.LOW_STOCK: stats.is_low_stock(instance.stock_qty) - stats.is_low_stock(instance._stored_stock_qty),
+    })
+
+@receiver(post_save, sender=Product)
+def log_stock_change(sender, instance, created, raw=False, **kwargs):
+    # Stock set through the form or admin goes into the ledger too, so that
+    # movements always add up to stock_qty (see erp.ledger).
+    change = instance.stock_qty - (instance._stored_stock_qty or 0)
+    if change and not raw:
+        StockMovement.objects.create(product=instance, qty=change, notes="Opening stock" if created else "Stock adjustment")
+        if instance.stock_shards:
+            # The rolled-up stock_qty is not where a sharded product's stock lives.
+            StockShard.objects.filter(product=instance, shard=0).update(qty=F('qty') + change)
+
+@receiver(post_save, sender=Product)
+def make_thumbnails(sender, instance, created, raw=False, **kwargs):
+    stored = None if created else instance.loaded_value('image')
+    if instance.image and not raw and instance.image.name != str(stored or ''):
+        thumbnails.schedule(instance.image.name)
+
+@receiver(post_delete, sender=Product)
+def uncount_product(sender, instance, **kwargs):
+    stats.adjust({stats.PRODUCTS: -1, stats.LOW_STOCK: -stats.is_low_stock(instance.stock_qty)})
+
+@receiver(post_save, sender=Customer)
+def count_customer(sender, instance, created, **kwargs):
+    if created:
+        stats.adjust({stats.CUSTOMERS: 1})
+
+@receiver(post_save, sender=Customer)
+def post_opening_balance(sender, instance, created, raw=False, **kwargs):
+    change = instance.opening_balance - (0 if created else instance.loaded_value('opening_balance'))
+    if change and not raw:
+        notes = "Opening balance" if created else "Opening balance changed"
+        instance.balance = balances.post([(instance.pk, change, None, notes)])[instance.pk]
+
+@receiver(post_delete, sender=Customer)
+def uncount_customer(sender, instance, **kwargs):
+    stats.adjust({stats.CUSTOMERS: -1})
+
+@receiver(post_save, sender=SalesOrder)
+def count_order(sender, instance, created, **kwargs):
+    if created:
+        stats.adjust({stats.orders_on(instance.order_date): 1})
+
+@receiver(post_delete, sender=SalesOrder)
+def uncount_order(sender, instance, **kwargs):
+    stats.adjust({stats.orders_on(instance.order_date): -1})
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Customer)
+def invalidate_fragments(sender, instance, **kwargs):
+    versions.bump(sender)
+
+@receiver([post_save, post_delete], sender=SalesOrder)
+def invalidate_order_fragments(sender, instance, **kwargs):
+    versions.bump(sender, instance)
+
+@receiver([post_save, post_delete], sender=SalesOrderItem)
+def invalidate_order_item_fragments(sender, instance, **kwargs):
+    versions.bump(sender, versions.dependency(SalesOrder, instance.order_id))
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    permissions.membership_changed(instance, reverse, pk_set, action)
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, action, **kwargs):
+    if action.startswith('post_'):
+        versions.bump(permissions.GROUPS)
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_all_permissions(sender, **kwargs):
+    versions.bump(permissions.GROUPS)
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    if sender.name == 'erp':
+        search.install(connections[using])
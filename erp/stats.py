@@ -0,0 +1,117 @@
+"""
+Materialized dashboard counters.
+
+The counts shown on the dashboard live in ``StatCounter`` rows that the save,
+delete and stock paths adjust incrementally. Reads go through the cache, so
+an ordinary dashboard view costs no counting query at all. ``reconcile()``
+recomputes every counter from the source tables and is run periodically by
+the ``reconcile_stats`` management command to correct any drift. Counts read
+from a replica are not cached, as the replica may lag behind.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Product, Customer, SalesOrder, StatCounter
+from . import routers
+
+LOW_STOCK_THRESHOLD = 10
+CACHE_TIMEOUT = 60
+DAY_COUNTERS_KEPT = 7
+
+PRODUCTS = 'products'
+CUSTOMERS = 'customers'
+LOW_STOCK = 'low_stock'
+
+
+def orders_on(day):
+    return f"orders:{day.isoformat()}"
+
+
+def is_low_stock(qty):
+    return qty is not None and qty < LOW_STOCK_THRESHOLD
+
+
+def _cache_key(day):
+    return f"erp:dashboard-counts:{day.isoformat()}"
+
+
+def invalidate():
+    cache.delete(_cache_key(timezone.now().date()))
+
+
+def adjust(deltas):
+    """Add signed deltas (``{counter_name: delta}``) to the counters."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    queryset = StatCounter.objects.filter(name__in=deltas)
+    value = F('value') + Case(
+        *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        if queryset.update(value=value) < len(deltas):
+            # A counter seen for the first time (e.g. a new day) starts at zero.
+            existing = set(queryset.values_list('name', flat=True))
+            missing = [name for name in deltas if name not in existing]
+            StatCounter.objects.bulk_create([StatCounter(name=name) for name in missing], ignore_conflicts=True)
+            StatCounter.objects.filter(name__in=missing).update(value=value)
+        transaction.on_commit(invalidate)
+
+
+def adjust_low_stock(previous, deltas):
+    """Track low-stock crossings caused by applying ``deltas`` to ``previous`` levels."""
+    change = 0
+    for pk, qty in previous.items():
+        change += is_low_stock(qty + deltas.get(pk, 0)) - is_low_stock(qty)
+    adjust({LOW_STOCK: change})
+
+
+def dashboard_counts():
+    today = timezone.now().date()
+    key = _cache_key(today)
+    counts = cache.get(key)
+    if counts is None:
+        values = dict(
+            StatCounter.objects.filter(name__in=[PRODUCTS, CUSTOMERS, LOW_STOCK, orders_on(today)])
+            .values_list('name', 'value')
+        )
+        counts = {
+            'total_products': values.get(PRODUCTS, 0),
+            'total_customers': values.get(CUSTOMERS, 0),
+            'orders_today': values.get(orders_on(today), 0),
+            'low_stock_count': values.get(LOW_STOCK, 0),
+        }
+        if not routers.reading_from_replica():
+            cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
+
+
+def reconcile():
+    """Recompute all counters from the source tables. Returns ``{name: drift}``."""
+    today = timezone.now().date()
+    actual = {
+        PRODUCTS: Product.objects.count(),
+        CUSTOMERS: Customer.objects.count(),
+        LOW_STOCK: Product.objects.filter(stock_qty__lt=LOW_STOCK_THRESHOLD).count(),
+    }
+    for offset in range(DAY_COUNTERS_KEPT):
+        day = today - timedelta(days=offset)
+        actual[orders_on(day)] = SalesOrder.objects.filter(order_date=day).count()
+
+    drift = {}
+    with transaction.atomic():
+        stored = dict(StatCounter.objects.select_for_update().values_list('name', 'value'))
+        for name, value in actual.items():
+            if stored.get(name) != value:
+                StatCounter.objects.update_or_create(name=name, defaults={'value': value})
+            if stored.get(name, 0) != value:
+                drift[name] = value - stored.get(name, 0)
+        StatCounter.objects.filter(name__startswith='orders:').exclude(name__in=actual).delete()
+        transaction.on_commit(invalidate)
+    return drift
@@ -0,0 +1,81 @@
+"""
+Set-based stock engine.
+
+All stock changes of an order are applied in a fixed number of queries,
+whatever the number of lines: one aggregate over the order items, one
+locking read of the affected products, one atomic ``F()`` update and one
+bulk insert of ``StockMovement`` rows (plus one counter update when a product
+crosses the low-stock threshold). SQLite splits inserts of more than a few
+hundred rows into batches because of its bound-parameter limit.
+
+Confirming an order also converts its stock reservation (see
+``erp.reservations``): two more queries read and delete the reservation
+rows, and the same update moves the units out of ``reserved_qty``.
+
+The stock of a sharded product (see ``erp.sharding``) moves in the order's
+home shard instead, locked in place of the product row: one more query
+reads the shard counts and one more update writes the shards.
+"""
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import SalesOrderItem, StockMovement, StockReservation
+from . import reservations, sharding, stats
+
+
+def order_quantities(order):
+    """Return ``{product_id: qty}`` for an order, summed per product."""
+    rows = (
+        SalesOrderItem.objects.filter(order=order)
+        .values('product_id')
+        .annotate(total_qty=Sum('qty'))
+        .order_by('product_id')
+    )
+    return {row['product_id']: row['total_qty'] for row in rows}
+
+
+def apply_movements(deltas, user_id=None, notes=None, release=None, key=None):
+    """
+    Apply signed stock deltas (``{product_id: qty}``) atomically.
+
+    Rows are locked in primary key order so that concurrent orders sharing
+    products always queue up instead of deadlocking, and the stock itself is
+    changed with ``stock_qty = stock_qty + delta`` so no update can be lost.
+    ``release`` is a ``StockReservation`` queryset the movement fulfils: it
+    is deleted under the same locks and its units leave ``reserved_qty``.
+    ``key`` picks the home shard of sharded products (the order id; random
+    if not given). Returns the stock levels of the unsharded products read
+    under the lock, before the change.
+    """
+    deltas = {pk: qty for pk, qty in deltas.items() if qty}
+    if not deltas:
+        return {}
+    key = sharding.random_key() if key is None else key
+
+    with transaction.atomic():
+        counters = sharding.lock({pk: {key} for pk in deltas})
+        previous = {pk: counters.products[pk][1] for pk in sorted(deltas) if pk in counters.products}
+        for pk, qty in deltas.items():
+            counters.add(pk, key, stock=qty)
+        if release is not None:
+            for product_id, order_id, qty in reservations.take(release):
+                counters.add(product_id, order_id, reserved=-qty)
+        counters.save()
+        StockMovement.objects.bulk_create([
+            StockMovement(product_id=pk, qty=deltas[pk], user_id=user_id, notes=notes)
+            for pk in sorted(deltas)
+        ])
+        # Sharded products count as low on stock as of their last rebalance.
+        stats.adjust_low_stock(previous, deltas)
+    return previous
+
+
+def deduct_order(order):
+    deltas = {pk: -qty for pk, qty in order_quantities(order).items()}
+    return apply_movements(deltas, user_id=order.created_by_id, notes=f"Order {order.order_number} Confirmed",
+                           release=StockReservation.objects.filter(order=order), key=order.pk)
+
+
+def restore_order(order):
+    return apply_movements(order_quantities(order), user_id=order.created_by_id, notes=f"Order {order.order_number} Cancelled",
+                           key=order.pk)
@@ -0,0 +1,51 @@
+from django import template
+
+from erp import fragments
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, dependencies, vary, perms):
+        self.nodelist = nodelist
+        self.name = name
+        self.dependencies = dependencies
+        self.vary = vary
+        self.perms = perms
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        dependencies = [dependency.resolve(context) for dependency in self.dependencies]
+        vary = self.vary.resolve(context) if self.vary else None
+        user = None
+        if self.perms and self.perms.resolve(context):
+            request = context.get('request')
+            user = context.get('user') or getattr(request, 'user', None)
+        key = fragments.fragment_key(name, dependencies, vary, user)
+        return fragments.cached(name, key, lambda: self.nodelist.render(context))
+
+
+@register.tag
+def fragment(parser, token):
+    """
+    Cache the enclosed template code; see ``erp.fragments``::
+
+        {% fragment name dependency... [vary=value] [perms=True] %} ... {% endfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    positional = []
+    options = {}
+    for bit in bits[1:]:
+        kwarg = template.base.token_kwargs([bit], parser)
+        if kwarg:
+            options.update(kwarg)
+        else:
+            positional.append(parser.compile_filter(bit))
+    unknown = set(options) - {'vary', 'perms'}
+    if unknown:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag got unknown options: {', '.join(sorted(unknown))}.")
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, positional[0], positional[1:], options.get('vary'), options.get('perms'))
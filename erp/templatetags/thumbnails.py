@@ -0,0 +1,33 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from erp import thumbnails
+
+register = template.Library()
+
+
+def _url(image, variant, fmt):
+    return default_storage.url(thumbnails.thumbnail_name(image.name, variant, fmt))
+
+
+@register.simple_tag
+def thumbnail_url(image, variant, fmt='webp'):
+    """URL of a thumbnail of ``image`` (an ``ImageField`` value), or '' if there is no image."""
+    if not image:
+        return ''
+    return _url(image, variant, fmt)
+
+
+@register.simple_tag
+def thumbnail(image, variant, alt='', css_class=''):
+    """A ``<picture>`` with the WebP thumbnail and a JPEG fallback."""
+    if not image:
+        return ''
+    width, height = thumbnails.VARIANTS[variant]
+    # Variants are stored at twice their display size.
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" width="{}" height="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        _url(image, variant, 'webp'), _url(image, variant, 'jpg'), width // 2, height // 2, alt, css_class,
+    )
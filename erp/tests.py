@@ -1,2 +1,1714 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock
 
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import urls
+from django.test.utils import CaptureQueriesContext
+
+from .models import Product, Customer, CustomerLedgerEntry, SalesOrder, SalesOrderItem, StockMovement, StockReservation, StockShard, Sequence, StatCounter, DailySalesRollup
+from . import analytics, balances, concurrency, exports, importers, instrumentation, ledger, replication, reservations, rollups, routers, search, serving, shared_cache, sharding, stats, stock, thumbnails
+from .pagination import CursorPaginator, encode_cursor
+from .orders import create_orders
+from .sequences import BlockSequence
+
+
+def make_product(sku='SKU-1', stock_qty=100, **kwargs):
+    defaults = {'name': sku, 'category': 'General', 'cost_price': 5, 'selling_price': 10}
+    defaults.update(kwargs)
+    return Product.objects.create(sku=sku, stock_qty=stock_qty, **defaults)
+
+
+def make_customer(code='Cust-1', **kwargs):
+    defaults = {'name': code, 'phone': '555-0100', 'address': '123 Fake St'}
+    defaults.update(kwargs)
+    return Customer.objects.create(code=code, **defaults)
+
+
+def make_order(customer, lines, user=None, status='PENDING'):
+    order = SalesOrder.objects.create(customer=customer, created_by=user, status=status)
+    for product, qty in lines:
+        SalesOrderItem.objects.create(order=order, product=product, qty=qty, price=product.selling_price)
+    return order
+
+
+def setUpModule():
+    # The shared cache file outlives a run, and would keep versions of rows
+    # that were rolled back: each run gets a file of its own. Requests are
+    # only logged as slow by the tests that ask for it.
+    global _cache_dir, _cache_settings
+    _cache_dir = tempfile.mkdtemp()
+    _cache_settings = override_settings(CACHES={
+        'default': {**settings.CACHES['default'], 'LOCATION': os.path.join(_cache_dir, 'cache')},
+    }, SLOW_REQUEST_MS=60000)
+    _cache_settings.enable()
+
+
+def tearDownModule():
+    _cache_settings.disable()
+    shutil.rmtree(_cache_dir)
+
+
+class StockEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sales', password='sales')
+        self.customer = make_customer()
+
+    def test_confirm_and_cancel_move_stock(self):
+        mouse = make_product('MOUSE', stock_qty=50)
+        cable = make_product('CABLE', stock_qty=20)
+        order = make_order(self.customer, [(mouse, 3), (cable, 2), (mouse, 4)], user=self.user)
+
+        order.status = 'CONFIRMED'
+        order.save()
+        mouse.refresh_from_db()
+        cable.refresh_from_db()
+        self.assertEqual((mouse.stock_qty, cable.stock_qty), (43, 18))
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(notes__startswith='Order').values_list('product__sku', 'qty', 'user')),
+            [('CABLE', -2, self.user.pk), ('MOUSE', -7, self.user.pk)],
+        )
+
+        order.status = 'CANCELLED'
+        order.save()
+        mouse.refresh_from_db()
+        cable.refresh_from_db()
+        self.assertEqual((mouse.stock_qty, cable.stock_qty), (50, 20))
+
+    def test_query_count_does_not_depend_on_line_count(self):
+        small = make_order(self.customer, [(make_product('ONE'), 1)])
+        large = make_order(self.customer, [(make_product(f'P-{i}'), i + 1) for i in range(25)])
+
+        with CaptureQueriesContext(connection) as small_queries:
+            stock.deduct_order(small)
+        with CaptureQueriesContext(connection) as large_queries:
+            stock.deduct_order(large)
+        self.assertEqual(len(large_queries), len(small_queries))
+        self.assertEqual(StockMovement.objects.filter(notes__startswith='Order').count(), 26)
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.mouse = make_product('MOUSE', stock_qty=50)
+        self.order = make_order(make_customer(), [(self.mouse, 5)])
+
+    def stock(self):
+        return Product.objects.get(pk=self.mouse.pk).stock_qty
+
+    def test_saves_without_status_change_do_not_refetch(self):
+        order = SalesOrder.objects.get(pk=self.order.pk)
+        order.total_amount = 50
+        with self.assertNumQueries(1):
+            order.save()
+        product = Product.objects.get(pk=self.mouse.pk)
+        product.name = 'Mouse'
+        with self.assertNumQueries(1):
+            product.save()
+
+    def test_confirm_and_cancel_apply_side_effects_once(self):
+        stale = SalesOrder.objects.get(pk=self.order.pk)
+        self.assertTrue(self.order.confirm())
+        self.assertFalse(self.order.confirm())
+        self.assertFalse(stale.confirm())
+        self.assertEqual((stale.status, self.stock()), ('PENDING', 45))
+
+        self.assertTrue(self.order.cancel())
+        self.assertFalse(stale.cancel())
+        self.assertEqual((self.order.status, self.stock()), ('CANCELLED', 50))
+
+        # A later save() of the same instance sees the new stored status.
+        self.order.save()
+        self.assertEqual(self.stock(), 50)
+
+    def test_status_saves_from_stale_instances_are_refused(self):
+        stale = SalesOrder.objects.get(pk=self.order.pk)
+        self.assertTrue(self.order.confirm())
+        stale.status = 'CONFIRMED'
+        with self.assertRaisesMessage(ValueError, 'is no longer PENDING'):
+            stale.save()
+        self.assertEqual(self.stock(), 45)
+
+        # Without a status change, a stale save leaves the stored status alone.
+        stale = SalesOrder.objects.get(pk=self.order.pk)
+        self.assertTrue(self.order.cancel())
+        stale.total_amount = 99
+        stale.save()
+        self.assertEqual(SalesOrder.objects.get(pk=self.order.pk).status, 'CANCELLED')
+        self.assertEqual(self.stock(), 50)
+
+    def test_cancelling_a_pending_order_leaves_stock_alone(self):
+        self.assertTrue(self.order.cancel())
+        self.assertEqual(SalesOrder.objects.get().status, 'CANCELLED')
+        self.assertEqual(self.stock(), 50)
+
+
+class OrderCreationTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='admin')
+        self.customer = make_customer('Cust-001')
+        self.products = [make_product(f'P-{i}', selling_price=i + 1) for i in range(40)]
+
+    def post_form(self, count):
+        data = {'customer': self.customer.pk, 'items-TOTAL_FORMS': count, 'items-INITIAL_FORMS': 0}
+        for i, product in enumerate(self.products[:count]):
+            data.update({f'items-{i}-product': product.pk, f'items-{i}-qty': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('order-add'), data)
+        self.assertRedirects(response, reverse('order-list'))
+        return len(queries)
+
+    def test_form_view_query_count_does_not_depend_on_line_count(self):
+        self.client.force_login(self.admin)
+        self.post_form(1)
+        small = self.post_form(2)
+        self.assertEqual(self.post_form(40), small)
+        order = SalesOrder.objects.latest('pk')
+        self.assertEqual((order.items.count(), order.total_amount, order.created_by), (40, 2 * sum(range(1, 41)), self.admin))
+
+    def test_json_endpoint(self):
+        url = reverse('api-order-create')
+        body = {'customer': 'Cust-001', 'status': 'CONFIRMED', 'items': [{'sku': 'P-0', 'qty': 3}, {'sku': 'P-4', 'qty': 1}]}
+        self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 401)
+
+        self.client.force_login(self.admin)
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        order = SalesOrder.objects.get(pk=response.json()['id'])
+        self.assertEqual((order.status, order.total_amount, response.json()['total_amount']), ('CONFIRMED', 8, '8.00'))
+        self.assertEqual(Product.objects.get(sku='P-0').stock_qty, 97)
+
+        body['items'].append({'sku': 'NOPE', 'qty': 1})
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()), (400, {'errors': ["unknown SKU NOPE"]}))
+        response = self.client.post(url, 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_json_endpoint_with_csrf_checks(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.admin)
+        url = reverse('api-order-create')
+        body = {'customer': 'Cust-001', 'items': [{'sku': 'P-0', 'qty': 1}]}
+        response = client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(response.json()['errors'][0].startswith("CSRF check failed"))
+
+        client.get(reverse('dashboard'))
+        token = client.cookies['csrftoken'].value
+        response = client.post(url, body, content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 201)
+
+
+class StockEngineConcurrencyTests(TransactionTestCase):
+    def test_parallel_confirmations_do_not_lose_updates(self):
+        customer = make_customer()
+        hot = make_product('HOT', stock_qty=1000)
+        other = make_product('OTHER', stock_qty=1000)
+        # Alternate line order between orders so lock ordering is exercised.
+        orders = [
+            make_order(customer, [(hot, 3), (other, 1)] if i % 2 else [(other, 1), (hot, 3)])
+            for i in range(8)
+        ]
+        barrier = threading.Barrier(len(orders))
+        errors = []
+
+        def confirm(pk):
+            try:
+                order = SalesOrder.objects.get(pk=pk)
+                order.status = 'CONFIRMED'
+                barrier.wait()
+                with transaction.atomic():
+                    order.save()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirm, args=(order.pk,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        hot.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(hot.stock_qty, 1000 - 3 * len(orders))
+        self.assertEqual(other.stock_qty, 1000 - len(orders))
+        self.assertEqual(StockMovement.objects.filter(product=hot, notes__startswith='Order').count(), len(orders))
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.mouse = make_product('MOUSE', stock_qty=10)
+
+    def levels(self):
+        product = Product.objects.get(pk=self.mouse.pk)
+        held = sum(StockReservation.objects.filter(product=product).values_list('qty', flat=True))
+        self.assertEqual(product.reserved_qty, held)
+        return product.stock_qty, product.available_qty
+
+    def test_pending_orders_hold_stock_until_confirmed(self):
+        order = create_orders([(self.customer, 'PENDING', [(self.mouse, 6)])])[0]
+        self.assertEqual(self.levels(), (10, 4))
+        with self.assertRaisesMessage(reservations.InsufficientStock, 'MOUSE: 5 requested, 4 available'):
+            create_orders([(self.customer, 'PENDING', [(self.mouse, 1)]), (self.customer, 'PENDING', [(self.mouse, 4)])])
+        self.assertEqual(SalesOrder.objects.count(), 1)
+
+        self.assertTrue(order.confirm())
+        self.assertEqual(self.levels(), (4, 4))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(StockMovement.objects.filter(notes__endswith='Confirmed').get().qty, -6)
+
+    def test_cancelling_editing_and_deleting_pending_orders(self):
+        order = create_orders([(self.customer, 'PENDING', [(self.mouse, 3)])])[0]
+        self.assertTrue(order.cancel())
+        self.assertEqual(self.levels(), (10, 10))
+
+        order = make_order(self.customer, [(self.mouse, 2), (self.mouse, 1)])
+        self.assertEqual(self.levels(), (10, 7))
+        item = order.items.first()
+        item.qty = 5
+        item.save()
+        self.assertEqual(self.levels(), (10, 4))
+        item.delete()
+        self.assertEqual(self.levels(), (10, 9))
+        order.delete()
+        self.assertEqual(self.levels(), (10, 10))
+
+    def test_expired_reservations_are_released(self):
+        old, new = create_orders([(self.customer, 'PENDING', [(self.mouse, 4)]) for _ in range(2)])
+        StockReservation.objects.filter(order=old).update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(reservations.expire(), (1, 4))
+        self.assertEqual(self.levels(), (10, 6))
+        self.assertEqual(reservations.expire(), (0, 0))
+
+        # A lapsed reservation the sweeper has not reached yet gives way to a new order.
+        StockReservation.objects.filter(order=new).update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        create_orders([(self.customer, 'PENDING', [(self.mouse, 10)])])
+        self.assertEqual(self.levels(), (10, 0))
+        # The order whose hold lapsed can still be confirmed.
+        self.assertTrue(new.confirm())
+        self.assertEqual(self.levels(), (6, -4))
+
+    def test_stale_product_saves_keep_the_engine_counters(self):
+        stale = Product.objects.get(pk=self.mouse.pk)
+        order = create_orders([(self.customer, 'PENDING', [(self.mouse, 4)])])[0]
+        stale.name = 'Mouse'
+        stale.save()
+        self.assertEqual(self.levels(), (10, 6))
+
+        # A stock edit applies its difference to the current level.
+        self.assertTrue(order.confirm())
+        stale.stock_qty += 5
+        stale.save()
+        self.assertEqual((stale.stock_qty, stale.reserved_qty), (11, 0))
+        self.assertEqual(self.levels(), (11, 11))
+        self.assertEqual(ledger.check_consistency(), {})
+
+    def test_order_entry_points_refuse_orders_without_stock(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        body = {'customer': self.customer.code, 'items': [{'sku': 'MOUSE', 'qty': 11}]}
+        response = self.client.post(reverse('api-order-create'), body, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'errors': ["Not enough stock: MOUSE: 11 requested, 10 available"]})
+
+        report = importers.import_orders(importers.read_jsonl([
+            '{"ref": "W-1", "customer": "%s", "items": [{"sku": "MOUSE", "qty": 8}]}' % self.customer.code,
+            '{"ref": "W-2", "customer": "%s", "items": [{"sku": "MOUSE", "qty": 8}]}' % self.customer.code,
+        ]))
+        self.assertEqual((report.orders, report.errors), (1, [(2, 'W-2', "not enough stock: MOUSE: 8 requested, 2 available")]))
+
+
+class StockShardTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer()
+        self.hot = make_product('HOT', stock_qty=20)
+        sharding.shard(self.hot, 4)
+
+    def shards(self):
+        return list(StockShard.objects.filter(product=self.hot).order_by('shard').values_list('qty', 'reserved'))
+
+    def levels(self):
+        held = sum(StockReservation.objects.filter(product=self.hot).values_list('qty', flat=True))
+        stock_qty, reserved_qty = sharding.levels([self.hot.pk])[self.hot.pk]
+        self.assertEqual(reserved_qty, held)
+        self.assertEqual(ledger.check_consistency(), {})
+        return stock_qty, stock_qty - reserved_qty
+
+    def test_orders_move_stock_in_their_home_shard(self):
+        self.assertEqual(self.shards(), [(5, 0)] * 4)
+        order = create_orders([(self.customer, 'PENDING', [(self.hot, 3)])])[0]
+        home = order.pk % 4
+        self.assertEqual(self.shards()[home], (5, 3))
+        self.assertEqual(self.levels(), (20, 17))
+
+        self.assertTrue(order.confirm())
+        self.assertEqual(self.shards()[home], (2, 0))
+        self.assertEqual(self.levels(), (17, 17))
+        # The product row catches up on the next rebalance.
+        self.assertEqual(Product.objects.get(pk=self.hot.pk).stock_qty, 20)
+        self.assertEqual(sharding.rebalance(), 2)
+        self.assertEqual(sorted(qty for qty, reserved in self.shards()), [4, 4, 4, 5])
+        self.assertEqual(Product.objects.get(pk=self.hot.pk).stock_qty, 17)
+        self.assertEqual(counter(stats.LOW_STOCK), 0)
+
+        self.assertTrue(order.cancel())
+        self.assertEqual(self.levels(), (20, 20))
+
+    def test_home_shard_borrows_before_refusing(self):
+        order = create_orders([(self.customer, 'PENDING', [(self.hot, 12)])])[0]
+        self.assertEqual(self.shards()[order.pk % 4], (12, 12))
+        self.assertEqual(self.levels(), (20, 8))
+        with self.assertRaisesMessage(reservations.InsufficientStock, 'HOT: 9 requested, 8 available'):
+            create_orders([(self.customer, 'PENDING', [(self.hot, 9)])])
+
+        # Lapsed holds are swept from every shard.
+        StockReservation.objects.update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(reservations.expire(), (1, 12))
+        self.assertEqual(self.levels(), (20, 20))
+        create_orders([(self.customer, 'PENDING', [(self.hot, 20)])])
+        self.assertEqual(self.levels(), (20, 0))
+
+    def test_edits_through_the_update_view_keep_the_shards(self):
+        stale = Product.objects.get(pk=self.hot.pk)
+        sharding.shard(Product.objects.get(pk=self.hot.pk), 2)
+        stale.name = 'Stale'
+        stale.save()
+        self.assertEqual(Product.objects.get(pk=self.hot.pk).stock_shards, 2)
+
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        response = self.client.post(reverse('product-edit', args=[self.hot.pk]), {
+            'sku': 'HOT', 'name': 'Hot seller', 'category': 'General',
+            'cost_price': '5.00', 'selling_price': '10.00', 'stock_qty': 26,
+        })
+        self.assertEqual(response.status_code, 302)
+        product = Product.objects.get(pk=self.hot.pk)
+        self.assertEqual((product.name, product.stock_shards, product.stock_qty), ('Hot seller', 2, 26))
+        self.assertEqual(self.shards(), [(16, 0), (10, 0)])
+        self.assertEqual(self.levels(), (26, 26))
+
+    def test_stock_edits_and_unsharding(self):
+        order = create_orders([(self.customer, 'PENDING', [(self.hot, 3)])])[0]
+        product = Product.objects.get(pk=self.hot.pk)
+        product.stock_qty += 10
+        product.save()
+        self.assertEqual(self.shards()[0][0], 15)
+        self.assertEqual(self.levels(), (30, 27))
+
+        sharding.shard(self.hot, 0)
+        self.assertFalse(StockShard.objects.exists())
+        product = Product.objects.get(pk=self.hot.pk)
+        self.assertEqual((product.stock_shards, product.stock_qty, product.available_qty), (0, 30, 27))
+        self.assertEqual(self.levels(), (30, 27))
+        self.assertTrue(order.confirm())
+        self.assertEqual(self.levels(), (27, 27))
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    def run_threads(self, target, args):
+        barrier = threading.Barrier(len(args))
+        errors = []
+
+        def run(*arg):
+            try:
+                barrier.wait()
+                target(*arg)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=arg) for arg in args]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def assertConsistent(self, product):
+        product.refresh_from_db()
+        held = sum(StockReservation.objects.filter(product=product).values_list('qty', flat=True))
+        moved = sum(StockMovement.objects.filter(product=product).values_list('qty', flat=True))
+        self.assertEqual((product.reserved_qty, product.stock_qty), (held, moved))
+        self.assertGreaterEqual(product.available_qty, 0)
+        return product
+
+    def test_burst_of_orders_on_one_sku_never_oversells(self):
+        customer = make_customer()
+        hot = make_product('HOT', stock_qty=50)
+        created = []
+
+        def order(qty):
+            try:
+                created.append(create_orders([(customer, 'PENDING', [(hot, qty)])])[0].pk)
+            except reservations.InsufficientStock:
+                pass
+
+        self.assertEqual(self.run_threads(order, [(3,)] * 24), [])
+        self.assertEqual(len(created), 16)
+        self.assertEqual(self.assertConsistent(hot).available_qty, 2)
+
+        # Confirmations, cancellations, new orders and the sweeper, all at once.
+        StockReservation.objects.filter(order_id__in=created[:4]).update(expires_at=timezone.now())
+        work = ([(lambda pk: SalesOrder.objects.get(pk=pk).confirm(), pk) for pk in created[4:10]]
+                + [(lambda pk: SalesOrder.objects.get(pk=pk).cancel(), pk) for pk in created[10:14]]
+                + [(order, 3)] * 4 + [(lambda _: reservations.expire(), None)] * 2)
+        self.assertEqual(self.run_threads(lambda action, arg: action(arg), work), [])
+        hot = self.assertConsistent(hot)
+        self.assertEqual(hot.stock_qty, 50 - 18)
+        self.assertFalse(StockReservation.objects.filter(order_id__in=created[:14]).exists())
+
+
+    def test_burst_of_orders_on_a_sharded_sku_never_oversells(self):
+        customer = make_customer()
+        hot = make_product('HOT', stock_qty=50)
+        sharding.shard(hot, 4)
+        created = []
+
+        def order(qty):
+            try:
+                created.append(create_orders([(customer, 'PENDING', [(hot, qty)])])[0].pk)
+            except reservations.InsufficientStock:
+                pass
+
+        self.assertEqual(self.run_threads(order, [(3,)] * 24), [])
+        self.assertEqual(len(created), 16)
+        work = ([(lambda pk: SalesOrder.objects.get(pk=pk).confirm(), pk) for pk in created[:8]]
+                + [(lambda pk: SalesOrder.objects.get(pk=pk).cancel(), pk) for pk in created[8:12]]
+                + [(order, 3)] * 4 + [(lambda _: sharding.rebalance(), None)] * 2)
+        self.assertEqual(self.run_threads(lambda action, arg: action(arg), work), [])
+        held = sum(StockReservation.objects.filter(product=hot).values_list('qty', flat=True))
+        moved = sum(StockMovement.objects.filter(product=hot).values_list('qty', flat=True))
+        self.assertEqual(sharding.levels([hot.pk])[hot.pk], (moved, held))
+        self.assertEqual(moved, 50 - 24)
+        self.assertGreaterEqual(held, 3 * 4)
+        self.assertFalse(StockShard.objects.filter(qty__lt=F('reserved')).exists())
+
+
+def day(number):
+    return timezone.make_aware(datetime.datetime(2026, 1, number, 12))
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.mouse = make_product('MOUSE', stock_qty=10)
+        StockMovement.objects.update(timestamp=day(1))
+        for number, qty in [(3, -4), (5, 6), (9, -2)]:
+            movement = StockMovement.objects.create(product=self.mouse, qty=qty)
+            StockMovement.objects.filter(pk=movement.pk).update(timestamp=day(number))
+        Product.objects.filter(pk=self.mouse.pk).update(stock_qty=10)
+        self.history = {day(1) - datetime.timedelta(hours=1): 0, day(2): 10, day(4): 6, day(6): 12, day(10): 10}
+
+    def assertHistory(self):
+        self.assertEqual({when: ledger.stock_at(self.mouse, when) for when in self.history}, self.history)
+
+    def test_stock_at_reads_nearest_snapshot_plus_delta(self):
+        self.assertHistory()
+        self.assertEqual(ledger.take_snapshots(day(4)), 1)
+        self.assertEqual(ledger.take_snapshots(day(4)), 0)
+        self.assertEqual(ledger.take_snapshots(day(6)), 1)
+        self.assertEqual(list(self.mouse.snapshots.order_by('as_of').values_list('qty', flat=True)), [6, 12])
+        self.assertHistory()
+        with self.assertNumQueries(1):
+            ledger.stock_at(self.mouse.pk, day(10))
+
+    def test_overlapping_runs_for_the_same_time_do_not_conflict(self):
+        call_command('snapshot_stock', '--as-of', day(6).isoformat(), '--no-compact', stdout=io.StringIO())
+        # A run that started before the first one committed sees no snapshot yet.
+        with_ledger = ledger._with_ledger
+        with mock.patch.object(ledger, '_with_ledger', lambda queryset, as_of: with_ledger(queryset, as_of, False)):
+            self.assertEqual(ledger.take_snapshots(day(6)), 1)
+        self.assertEqual(list(self.mouse.snapshots.values_list('as_of', 'qty')), [(day(6), 12)])
+
+    def test_compaction_keeps_last_snapshot_per_month(self):
+        for number in (2, 4, 6, 10):
+            ledger.take_snapshots(day(number))
+        self.assertEqual(ledger.compact_snapshots(before=day(8)), 2)
+        self.assertEqual(list(self.mouse.snapshots.order_by('as_of').values_list('as_of', flat=True)), [day(6), day(10)])
+        self.assertHistory()
+
+    def test_consistency_check(self):
+        ledger.take_snapshots(day(6))
+        self.assertEqual(ledger.check_consistency(), {})
+
+        self.mouse.refresh_from_db()
+        self.mouse.stock_qty = 15
+        self.mouse.save()
+        self.assertEqual(ledger.check_consistency(), {})
+
+        Product.objects.filter(pk=self.mouse.pk).update(stock_qty=99)
+        self.assertEqual(ledger.check_consistency(), {self.mouse.pk: (15, 99)})
+        Product.objects.filter(pk=self.mouse.pk).update(stock_qty=15)
+        self.mouse.snapshots.update(qty=0)
+        self.assertEqual(ledger.check_consistency(), {self.mouse.pk: (3, 15)})
+        self.assertEqual(ledger.check_consistency(use_snapshots=False), {})
+
+
+class BlockSequenceTests(TestCase):
+    def test_values_come_from_reserved_blocks(self):
+        Sequence.objects.create(name='test')
+        sequence = BlockSequence('test', block_size=5)
+        with self.assertNumQueries(4):
+            first = sequence.next_value()
+        with self.assertNumQueries(0):
+            rest = [sequence.next_value() for _ in range(4)]
+        self.assertEqual([first] + rest, [1, 2, 3, 4, 5])
+        self.assertEqual(sequence.take(7), list(range(6, 13)))
+        self.assertEqual(Sequence.objects.get(name='test').next_value, 13)
+
+    def test_block_is_dropped_when_its_transaction_rolls_back(self):
+        sequence = BlockSequence('test', block_size=10)
+        try:
+            with transaction.atomic():
+                self.assertEqual(sequence.take(2), [1, 2])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        # The reservation was rolled back, so the values are handed out again
+        # from the table rather than from the stale in-memory block.
+        self.assertEqual(sequence.take(2), [1, 2])
+        self.assertEqual(Sequence.objects.get(name='test').next_value, 11)
+
+    def test_orders_get_sequential_numbers(self):
+        customer = make_customer()
+        numbers = [SalesOrder.objects.create(customer=customer).order_number for _ in range(3)]
+        self.assertEqual(len(set(numbers)), 3)
+        self.assertTrue(all(number.startswith('ORD-') for number in numbers))
+
+
+class BlockSequenceConcurrencyTests(TransactionTestCase):
+    def test_concurrent_processes_never_share_values(self):
+        # Separate allocators stand in for separate worker processes.
+        allocators = [BlockSequence('test', block_size=3) for _ in range(6)]
+        barrier = threading.Barrier(len(allocators))
+        results, errors = [], []
+
+        def allocate(sequence):
+            try:
+                barrier.wait()
+                results.extend(sequence.next_value() for _ in range(10))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate, args=(sequence,)) for sequence in allocators]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 60)
+        self.assertEqual(len(set(results)), 60)
+
+
+def counter(name):
+    return StatCounter.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+
+class DashboardCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_follow_saves_and_deletes(self):
+        product = make_product('LOW', stock_qty=3)
+        make_product('PLENTY', stock_qty=300)
+        customer = make_customer()
+        order = make_order(customer, [(product, 1)])
+        self.assertEqual(counter(stats.PRODUCTS), 2)
+        self.assertEqual(counter(stats.LOW_STOCK), 1)
+        self.assertEqual(counter(stats.CUSTOMERS), 1)
+        self.assertEqual(counter(stats.orders_on(order.order_date)), 1)
+
+        product.stock_qty = 50
+        product.save()
+        self.assertEqual(counter(stats.LOW_STOCK), 0)
+
+        customer.delete()
+        Product.objects.get(sku='PLENTY').delete()
+        self.assertEqual(counter(stats.CUSTOMERS), 0)
+        self.assertEqual(counter(stats.orders_on(order.order_date)), 0)
+        self.assertEqual(counter(stats.PRODUCTS), 1)
+
+    def test_stock_engine_tracks_low_stock_crossings(self):
+        product = make_product(stock_qty=12)
+        order = make_order(make_customer(), [(product, 5)])
+        order.status = 'CONFIRMED'
+        order.save()
+        self.assertEqual(counter(stats.LOW_STOCK), 1)
+        order.status = 'CANCELLED'
+        order.save()
+        self.assertEqual(counter(stats.LOW_STOCK), 0)
+
+    def test_reconcile_corrects_drift(self):
+        make_product(stock_qty=1)
+        StatCounter.objects.filter(name=stats.PRODUCTS).update(value=40)
+        drift = stats.reconcile()
+        self.assertEqual(drift[stats.PRODUCTS], -39)
+        self.assertEqual(counter(stats.PRODUCTS), 1)
+        self.assertEqual(stats.reconcile(), {})
+
+    def test_dashboard_query_count_does_not_depend_on_table_size(self):
+        user = User.objects.create_user('admin', password='admin')
+        self.client.force_login(user)
+        make_product('P-0')
+        # Cleared before both requests, which then also load the session alike.
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('dashboard'))
+        customer = make_customer()
+        for i in range(1, 40):
+            make_order(customer, [(make_product(f'P-{i}', stock_qty=i % 15), 1)])
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(response.context['total_products'], 40)
+        self.assertEqual(response.context['orders_today'], 39)
+
+
+class ProductSearchTests(TestCase):
+    def search(self, q):
+        return list(search.search_products(Product.objects.all(), q).values_list('sku', flat=True))
+
+    def test_prefix_matches_ranked_by_sku_first(self):
+        make_product('DELL-XPS', name='Dell XPS 13 Laptop', category='Electronics')
+        make_product('HP-MON', name='HP 27 inch Monitor', category='Electronics')
+        make_product('CASE-1', name='Sleeve for Dell laptops', category='Accessories')
+        self.assertEqual(self.search('DELL-X'), ['DELL-XPS'])
+        self.assertEqual(self.search('dell'), ['DELL-XPS', 'CASE-1'])
+        self.assertEqual(self.search('mon'), ['HP-MON'])
+        self.assertEqual(self.search('-'), [])
+
+    def test_index_follows_writes(self):
+        product = make_product('OLD-1', name='Widget')
+        Product.objects.bulk_create([Product(sku='BULK-1', name='Gadget', category='Misc', cost_price=1, selling_price=2)])
+        self.assertEqual(self.search('gadg'), ['BULK-1'])
+
+        product.name = 'Sprocket'
+        product.save()
+        self.assertEqual(self.search('widget'), [])
+        self.assertEqual(self.search('sprock'), ['OLD-1'])
+
+        Product.objects.filter(pk=product.pk).update(stock_qty=5)
+        product.delete()
+        self.assertEqual(self.search('sprock'), [])
+
+    def test_product_list_uses_index(self):
+        self.client.force_login(User.objects.create_user('sales', password='sales'))
+        make_product('LOGI-MX', name='Logitech MX Master 3', category='Accessories')
+        make_product('USB-C', name='USB-C Cable', category='Accessories')
+        response = self.client.get(reverse('product-list'), {'q': 'logi', 'category': 'Accessories'})
+        self.assertEqual([p.sku for p in response.context['products']], ['LOGI-MX'])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('sales', password='sales'))
+
+    def test_walks_forwards_and_backwards(self):
+        customer = make_customer()
+        orders = [SalesOrder.objects.create(customer=customer) for _ in range(7)]
+        days = ['2026-01-02', '2026-01-01', '2026-01-02', '2026-01-03', '2026-01-01', '2026-01-03', '2026-01-02']
+        for order, day in zip(orders, days):
+            SalesOrder.objects.filter(pk=order.pk).update(order_date=day)
+        expected = list(SalesOrder.objects.order_by('-order_date', '-id').values_list('pk', flat=True))
+
+        paginator = CursorPaginator(SalesOrder.objects.all(), ['-order_date', '-id'], per_page=3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([order.pk for page in pages for order in page], expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.page(pages[2].previous_cursor)
+        self.assertEqual(list(back.object_list), list(pages[1].object_list))
+        back = paginator.page(back.previous_cursor)
+        self.assertEqual(list(back.object_list), list(pages[0].object_list))
+        self.assertFalse(back.has_previous())
+
+    def test_list_views_skip_count_unless_asked(self):
+        for i in range(12):
+            make_customer(f'Cust-{i:02d}')
+        url = reverse('customer-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        self.assertEqual(len(response.context['customers']), 10)
+        self.assertContains(response, 'Show total')
+
+        page = response.context['page_obj']
+        response = self.client.get(url, {'cursor': page.next_cursor, 'count': '1'})
+        self.assertEqual([c.code for c in response.context['customers']], ['Cust-10', 'Cust-11'])
+        self.assertContains(response, '12 in total')
+
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    def test_tampered_cursors_are_not_found(self):
+        make_product('USB-C')
+        make_customer()
+        for name, cursor in [
+            ('product-list', encode_cursor('next', ['abc'])),
+            ('product-list', encode_cursor('next', [1, 2])),
+            ('product-list', encode_cursor('sideways', [1])),
+            ('customer-list', encode_cursor('next', [{'id': 1}])),
+            ('order-list', encode_cursor('prev', ['not-a-date', 1])),
+        ]:
+            self.assertEqual(self.client.get(reverse(name), {'cursor': cursor}).status_code, 404, (name, cursor))
+
+
+class OrderImportTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer('Cust-001')
+        self.cable = make_product('USB-C', stock_qty=100, selling_price='2.50')
+        self.mouse = make_product('LOGI-MX', stock_qty=200, selling_price=40)
+
+    def test_csv_import_skips_bad_orders_and_keeps_the_rest(self):
+        data = io.StringIO(
+            "order_ref,customer_code,sku,qty,status\n"
+            "WEB-1,Cust-001,USB-C,4,\n"
+            "WEB-1,Cust-001,LOGI-MX,1,\n"
+            "WEB-2,Cust-404,USB-C,1,\n"
+            "WEB-3,Cust-001,NOPE,1,\n"
+            "WEB-4,Cust-001,USB-C,two,\n"
+            "WEB-5,Cust-001,USB-C,10,confirmed\n"
+        )
+        report = importers.import_orders(importers.read_csv(data), chunk_size=2)
+
+        self.assertEqual((report.orders, report.lines, report.skipped), (2, 3, 3))
+        self.assertEqual(sorted(error[:2] for error in report.errors), [(4, 'WEB-2'), (5, 'WEB-3'), (6, 'WEB-4')])
+        first, second = SalesOrder.objects.order_by('pk')
+        self.assertEqual((first.status, first.total_amount, first.items.count()), ('PENDING', 50, 2))
+        self.assertEqual((second.status, second.total_amount), ('CONFIRMED', 25))
+        self.assertNotEqual(first.order_number, second.order_number)
+        self.cable.refresh_from_db()
+        self.assertEqual(self.cable.stock_qty, 90)
+        self.assertEqual(counter(stats.orders_on(first.order_date)), 2)
+
+    def test_jsonl_import_queries_per_chunk_not_per_order(self):
+        def jsonl(count):
+            return io.StringIO(''.join(
+                '{"ref": "W-%d", "customer": "Cust-001", "items": [{"sku": "USB-C", "qty": 1}, {"sku": "LOGI-MX", "qty": 2}]}\n' % i
+                for i in range(count)
+            ) + 'not json\n')
+
+        with CaptureQueriesContext(connection) as small:
+            importers.import_orders(importers.read_jsonl(jsonl(2)))
+        with CaptureQueriesContext(connection) as large:
+            report = importers.import_orders(importers.read_jsonl(jsonl(60)))
+        self.assertEqual((report.orders, report.lines, report.skipped), (60, 120, 1))
+        self.assertLessEqual(len(large), len(small) + 4)
+
+    def test_upload_endpoint(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        upload = io.BytesIO(b'{"ref": "W-1", "customer": "Cust-001", "items": [{"sku": "USB-C", "qty": 2}]}\n')
+        upload.name = 'orders.jsonl'
+        response = self.client.post(reverse('order-import'), {'file': upload, 'format': 'jsonl'})
+        self.assertEqual(response.context['report'].orders, 1)
+        self.assertEqual(SalesOrder.objects.get().total_amount, 5)
+
+    def test_undecodable_uploads_are_reported_not_raised(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        for fmt, text in [
+            ('csv', 'order_ref,customer_code,sku,qty\nWEB-1,Café-001,USB-C,1\n'),
+            ('jsonl', '{"ref": "W-1", "customer": "Café-001", "items": [{"sku": "USB-C", "qty": 1}]}\n'),
+        ]:
+            upload = io.BytesIO(text.encode('latin-1'))
+            upload.name = f'orders.{fmt}'
+            response = self.client.post(reverse('order-import'), {'file': upload, 'format': fmt})
+            self.assertEqual(response.status_code, 200)
+            report = response.context['report']
+            self.assertEqual((report.orders, report.skipped), (0, 1))
+            self.assertIn('unreadable', report.errors[0][2])
+        self.assertFalse(SalesOrder.objects.exists())
+
+    def test_csv_reading_stops_at_the_first_unreadable_line(self):
+        def lines():
+            yield 'order_ref,customer_code,sku,qty\n'
+            yield 'WEB-1,Cust-001,USB-C,1\n'
+            yield 'WEB-2,Cust-001,USB-C,1\n'
+            raise UnicodeDecodeError('utf-8', b'\xe9', 0, 1, 'invalid continuation byte')
+
+        report = importers.import_orders(importers.read_csv(lines()))
+        self.assertEqual((report.orders, report.skipped), (1, 1))
+        self.assertEqual(report.errors[0][:2], (3, 'WEB-2'))
+        self.assertTrue(report.errors[0][2].startswith('line 4: unreadable'))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sales', password='sales')
+        customer = make_customer('Cust-001', name='Acme, "Ltd"')
+        cable = make_product('USB-C', selling_price=3)
+        self.old = make_order(customer, [(cable, 2)], user=self.user)
+        self.new = make_order(customer, [(cable, 4)], user=self.user)
+        SalesOrder.objects.filter(pk=self.old.pk).update(order_date=datetime.date(2026, 1, 5), total_amount=6)
+
+    def test_csv_export_filters_by_date(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        response = self.client.get(reverse('export', args=['orders', 'csv']), {'from': '2026-01-01', 'to': '2026-01-31'})
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="orders.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], exports.EXPORTS['orders'].headers)
+        self.assertEqual(rows[1:], [[self.old.order_number, '2026-01-05', 'Cust-001', 'Acme, "Ltd"', 'PENDING', '6.00', 'sales']])
+
+        response = self.client.get(reverse('export', args=['orders', 'csv']), {'from': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_xlsx_export_is_a_valid_workbook(self):
+        chunks = exports.stream_xlsx(['SKU', 'Qty'], exports.EXPORTS['order-items'].queryset().values_list('product__sku', 'qty'))
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as workbook:
+            self.assertIsNone(workbook.testzip())
+            self.assertIn('xl/workbook.xml', workbook.namelist())
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 3)
+        self.assertIn('<c><v>4</v></c>', sheet)
+
+    def test_export_requires_view_permission(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('export', args=['orders', 'csv'])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('export', args=['invoices', 'csv'])).status_code, 404)
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        instrumentation.registry.reset()
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        make_product('USB-C')
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('product-list'))
+        timings = dict(entry.strip().split(';', 1) for entry in response['Server-Timing'].split(','))
+        self.assertEqual(set(timings), {'db', 'tpl', 'total', 'frag'})
+        self.assertRegex(timings['db'], r'dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timings['frag'], r'dur=[\d.]+;desc="\d+/2 cached"')
+
+    def test_metrics_are_labelled_by_view(self):
+        self.client.get(reverse('product-list'))
+        self.client.get(reverse('product-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('erp_http_responses_total{view="product-list",method="GET",status="200"} 2', body)
+        self.assertIn('erp_http_request_duration_seconds_count{view="product-list"} 2', body)
+        self.assertIn('erp_db_queries_per_request_bucket{view="product-list",le="+Inf"} 2', body)
+
+    def test_metric_labels_are_bounded_and_escaped(self):
+        self.client.generic('FROB', reverse('product-list'))
+        self.client.generic('PURGE', reverse('product-list'))
+        instrumentation.record_fragment('a"b\\c\nd', True, 0.1)
+        body = instrumentation.registry.render()
+        self.assertIn('erp_http_responses_total{view="product-list",method="other",status="405"} 2', body)
+        self.assertNotIn('FROB', body)
+        self.assertIn('erp_fragment_cache_requests_total{fragment="a\\"b\\\\c\\nd",result="hit"} 1', body)
+
+    def test_metrics_are_not_public(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.9').status_code, 403)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs('erp.performance', 'WARNING') as logs:
+            self.client.get(reverse('product-list'))
+        self.assertIn('(product-list)', logs.output[0])
+        self.assertIn('FROM "erp_product"', logs.output[0])
+        self.assertIn('erp_http_slow_requests_total{view="product-list"} 1', instrumentation.registry.render())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        make_product('OLD-SKU')
+        replication.sync('replica')
+        self.product = make_product('NEW-SKU')
+
+    def test_list_views_read_from_the_replica(self):
+        response = self.client.get(reverse('product-list'))
+        self.assertContains(response, 'OLD-SKU')
+        self.assertNotContains(response, 'NEW-SKU')
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_search_reads_from_the_replica(self):
+        response = self.client.get(reverse('product-list'), {'q': 'sku'})
+        self.assertContains(response, 'OLD-SKU')
+        self.assertNotContains(response, 'NEW-SKU')
+
+    def test_other_views_read_from_the_primary(self):
+        response = self.client.get(reverse('product-edit', args=[self.product.pk]))
+        self.assertContains(response, 'NEW-SKU')
+
+    def test_writes_stick_to_the_primary(self):
+        response = self.client.post(reverse('product-edit', args=[self.product.pk]), {
+            'sku': 'NEW-SKU', 'name': 'Renamed', 'category': 'General',
+            'cost_price': 5, 'selling_price': 10, 'stock_qty': 100,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        self.assertContains(self.client.get(reverse('product-list')), 'Renamed')
+
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            self.client.post(reverse('product-edit', args=[self.product.pk]), {
+                'sku': 'NEW-SKU', 'name': 'Renamed again', 'category': 'General',
+                'cost_price': 5, 'selling_price': 10, 'stock_qty': 100,
+            })
+        self.assertNotContains(self.client.get(reverse('product-list')), 'NEW-SKU')
+        replication.sync('replica')
+        self.assertContains(self.client.get(reverse('product-list')), 'Renamed again')
+
+    def test_fragments_read_from_the_replica_are_not_cached(self):
+        cache.clear()
+        make_product('AUDIO-1', category='Audio')
+        self.assertNotContains(self.client.get(reverse('product-list')), 'Audio')
+        self.client.cookies[routers.STICKY_COOKIE] = str(time.time() + 60)
+        self.assertContains(self.client.get(reverse('product-list')), '<option value="Audio">Audio</option>', html=True)
+
+    def test_permissions_revoked_on_the_primary_are_not_cached_from_the_replica(self):
+        from django.contrib.auth.models import Group, Permission
+        cache.clear()
+        group = Group.objects.create(name='Clerks')
+        group.permissions.add(Permission.objects.get(codename='view_product'))
+        clerk = User.objects.create_user('clerk', password='clerk')
+        clerk.groups.add(group)
+        replication.sync('replica')
+        group.permissions.clear()
+
+        self.client.force_login(clerk)
+        self.client.get(reverse('product-list'))
+        self.assertEqual(self.client.get(reverse('api-catalog', args=['products'])).status_code, 403)
+
+    def test_dashboard_counts_read_from_the_replica_are_not_cached(self):
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('dashboard')).context['total_products'], 1)
+        self.client.cookies[routers.STICKY_COOKIE] = str(time.time() + 60)
+        self.assertEqual(self.client.get(reverse('dashboard')).context['total_products'], 2)
+
+
+class ConcurrentViewTests(TransactionTestCase):
+    # Outside a transaction the views' queries run on executor threads.
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='admin')
+        self.product = make_product('LOW-1', stock_qty=2)
+        make_order(make_customer(), [(self.product, 1)], user=self.admin, status='CONFIRMED')
+
+    async def test_views_under_asgi(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertContains(response, 'LOW-1')
+        queries = int(response['Server-Timing'].split('desc="')[1].split()[0])
+        self.assertGreaterEqual(queries, 5)
+
+        response = await self.async_client.get(reverse('product-list'), {'category': 'General'})
+        self.assertContains(response, 'LOW-1')
+        self.assertContains(response, '<option value="General" selected>General</option>', html=True)
+        response = await self.async_client.get(reverse('order-list'))
+        self.assertContains(response, 'Cust-1')
+
+    def test_views_under_wsgi(self):
+        self.client.force_login(User.objects.create_user('sales', password='sales'))
+        self.assertContains(self.client.get(reverse('dashboard')), 'LOW-1')
+        self.assertContains(self.client.get(reverse('product-list'), {'q': 'low'}), 'LOW-1')
+        self.assertEqual(self.client.get(reverse('order-list'), {'cursor': 'nope'}).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('product-list')).status_code, 302)
+
+    async def test_pool_threads_close_their_connections_like_requests(self):
+        used = []
+
+        def count():
+            used.append(connections['default'])
+            return Product.objects.count()
+
+        self.assertEqual(await concurrency.gather(count, count), [1, 1])
+        # CONN_MAX_AGE is 0, so they are closed as at the end of a request.
+        self.assertEqual([conn.connection for conn in used], [None, None])
+
+
+def png(size=(400, 300), color=(200, 30, 30, 255)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGBA', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def make_product_with_image(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            product = make_product('MOUSE', image=SimpleUploadedFile('mouse.png', png()))
+        futures = [future for future in (callback() for callback in callbacks) if future is not None]
+        self.assertEqual(len(futures), 1)
+        futures[0].result()
+        return product
+
+    def test_thumbnails_are_made_after_upload(self):
+        from PIL import Image
+        product = self.make_product_with_image()
+        for variant, size in thumbnails.VARIANTS.items():
+            for fmt, expected in [('webp', 'WEBP'), ('jpg', 'JPEG')]:
+                name = f'thumbnails/{variant}/{product.image.name}.{fmt}'
+                self.assertEqual(thumbnails.thumbnail_name(product.image.name, variant, fmt), name)
+                with default_storage.open(name) as file, Image.open(file) as image:
+                    self.assertEqual((image.format, image.size), (expected, size))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.name = 'Mouse'
+            product.save()
+        self.assertEqual([callback for callback in callbacks if callback() is not None], [])
+
+    def test_missing_thumbnails_are_regenerated_on_request(self):
+        product = self.make_product_with_image()
+        name = thumbnails.thumbnail_name(product.image.name, 'list', 'webp')
+        default_storage.delete(name)
+        response = self.client.get(default_storage.url(name))
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'RIFF'))
+        self.assertTrue(default_storage.exists(name))
+
+        self.assertEqual(self.client.get('/media/thumbnails/huge/products/mouse.png.webp').status_code, 404)
+        self.assertEqual(self.client.get('/media/thumbnails/list/products/nope.png.webp').status_code, 404)
+
+    def test_only_product_images_get_thumbnails(self):
+        product = self.make_product_with_image()
+        nested = f'/media/thumbnails/list/thumbnails/list/{product.image.name}.webp.webp'
+        self.assertEqual(self.client.get(nested).status_code, 404)
+        self.assertIsNone(thumbnails.source_name(f'thumbnails/card/thumbnails/list/{product.image.name}.webp.jpg'))
+
+        stray = default_storage.save('products/stray.png', ContentFile(png()))
+        self.assertEqual(self.client.get(f'/media/thumbnails/list/{stray}.webp').status_code, 404)
+        self.assertFalse(default_storage.exists(thumbnails.thumbnail_name(stray, 'list', 'webp')))
+
+    def test_template_tag_and_backfill(self):
+        product = self.make_product_with_image()
+        html = Template("{% load thumbnails %}{% thumbnail product.image 'list' alt=product.name %}").render(Context({'product': product}))
+        self.assertIn(f'srcset="/media/thumbnails/list/{product.image.name}.webp"', html)
+        self.assertIn(f'src="/media/thumbnails/list/{product.image.name}.jpg" width="40" height="40" alt="MOUSE"', html)
+
+        default_storage.delete(thumbnails.thumbnail_name(product.image.name, 'card', 'jpg'))
+        out = io.StringIO()
+        call_command('build_thumbnails', workers=1, stdout=out)
+        self.assertIn('Wrote 1 thumbnails for 1 images', out.getvalue())
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.registry.reset()
+        self.admin = User.objects.create_superuser('admin', password='admin')
+        self.client.force_login(self.admin)
+        self.product = make_product('MOUSE', stock_qty=40)
+
+    def test_product_list_fragments_are_reused_until_a_product_changes(self):
+        url = reverse('product-list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertIn('desc="2/2 cached"', response['Server-Timing'])
+        self.assertFalse([query for query in queries if 'DISTINCT' in query['sql']])
+        self.assertContains(response, '<td>40</td>', html=True)
+
+        order = make_order(make_customer(), [(self.product, 15)])
+        order.confirm()
+        self.assertContains(self.client.get(url), '<td>25</td>', html=True)
+        self.product.refresh_from_db()
+        self.product.category = 'Peripherals'
+        self.product.save()
+        self.assertContains(self.client.get(url), '<option value="Peripherals">Peripherals</option>', html=True)
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('erp_fragment_cache_requests_total{fragment="product-rows",result="hit"} 1', body)
+        self.assertIn('erp_fragment_cache_requests_total{fragment="product-rows",result="miss"} 3', body)
+
+    def test_fragments_vary_by_permission_set(self):
+        from django.contrib.auth.models import Permission
+        self.assertContains(self.client.get(reverse('product-list')), 'Edit')
+        clerk = User.objects.create_user('clerk', password='clerk')
+        clerk.user_permissions.add(Permission.objects.get(codename='view_product'))
+        self.client.force_login(clerk)
+        self.assertNotContains(self.client.get(reverse('product-list')), 'Edit')
+
+    def test_order_detail_follows_status_and_item_changes(self):
+        order = make_order(make_customer(), [(self.product, 2)])
+        url = reverse('order-detail', args=[order.pk])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get(url), 'Confirm Order')
+        self.assertFalse([query for query in queries if 'erp_salesorderitem' in query['sql']])
+
+        order.confirm()
+        self.assertNotContains(self.client.get(url), 'Confirm Order')
+        SalesOrderItem.objects.create(order=order, product=make_product('CABLE'), qty=1, price=3)
+        self.assertContains(self.client.get(url), 'CABLE')
+
+
+class PermissionCacheTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import Group, Permission
+        cache.clear()
+        self.add_product = Permission.objects.get(codename='add_product')
+        self.group = Group.objects.create(name='Sales User')
+        self.group.permissions.add(self.add_product)
+        self.user = User.objects.create_user('sales', password='sales')
+        self.user.groups.add(self.group)
+        self.client.force_login(self.user)
+
+    def status(self):
+        return self.client.get(reverse('product-add')).status_code
+
+    def test_steady_state_checks_run_no_queries(self):
+        self.assertEqual(self.status(), 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.status(), 200)
+        self.assertFalse([query['sql'] for query in queries if 'auth_permission' in query['sql']])
+
+    def test_revocation_takes_effect_immediately(self):
+        self.assertEqual(self.status(), 200)
+        self.group.permissions.remove(self.add_product)
+        self.assertEqual(self.status(), 403)
+        self.add_product.group_set.add(self.group)
+        self.assertEqual(self.status(), 200)
+
+        self.user.groups.remove(self.group)
+        self.assertEqual(self.status(), 403)
+        self.user.user_permissions.add(self.add_product)
+        self.assertEqual(self.status(), 200)
+        self.add_product.user_set.clear()
+        self.assertEqual(self.status(), 403)
+
+        self.group.user_set.add(self.user)
+        self.assertEqual(self.status(), 200)
+        self.group.delete()
+        self.assertEqual(self.status(), 403)
+
+    def test_losing_superuser_status_drops_its_permissions(self):
+        self.user.groups.clear()
+        User.objects.filter(pk=self.user.pk).update(is_superuser=True)
+        self.assertEqual(self.status(), 200)
+        User.objects.filter(pk=self.user.pk).update(is_superuser=False)
+        self.assertEqual(self.status(), 403)
+
+
+def _increment(location, times):
+    cache = shared_cache.SharedMemoryCache(location, {'OPTIONS': {'SLOTS': 64, 'SLOT_SIZE': 256}})
+    for _ in range(times):
+        cache.incr('hits')
+
+
+class SharedMemoryCacheTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.location = os.path.join(self.directory, 'cache')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        options = {'SLOTS': 64, 'SLOT_SIZE': 256, **options}
+        return shared_cache.SharedMemoryCache(self.location, {'OPTIONS': options})
+
+    def test_cache_api(self):
+        cache = self.cache
+        self.assertIsNone(cache.get('missing'))
+        cache.set('a', {'x': 1})
+        self.assertEqual(cache.get('a'), {'x': 1})
+        self.assertFalse(cache.add('a', 2))
+        self.assertTrue(cache.add('b', 2))
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': {'x': 1}, 'b': 2})
+        self.assertEqual(cache.incr('b', 3), 5)
+        self.assertEqual(cache.decr('b'), 4)
+        with self.assertRaises(ValueError):
+            cache.incr('c')
+        self.assertTrue(cache.delete('a'))
+        self.assertFalse(cache.delete('a'))
+        cache.set('forever', 1, None)
+        self.assertTrue(cache.has_key('forever'))
+        cache.clear()
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNone(cache.get('forever'))
+
+    def test_expiry(self):
+        self.cache.set('a', 1, 0)
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('b', 1, 60)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get('b'))
+            self.assertTrue(self.cache.add('b', 2))
+        self.assertTrue(self.cache.touch('b', None))
+
+    def test_full_set_evicts_least_recently_used(self):
+        cache = self.make_cache(SLOTS=4, WAYS=4)
+        for key in 'abcd':
+            cache.set(key, key)
+        cache.get('a')
+        cache.set('e', 'e')
+        self.assertEqual(cache.get_many('abcde'), {'a': 'a', 'c': 'c', 'd': 'd', 'e': 'e'})
+
+    def test_values_too_large_are_not_cached(self):
+        self.cache.set('a', 'small')
+        self.cache.set('a', 'x' * 1000)
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_shared_between_processes(self):
+        self.cache.set('hits', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_increment, args=(self.location, 200)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('hits'), 600)
+
+    def test_geometry_change_replaces_the_file(self):
+        self.cache.set('a', 1)
+        old = self.cache.table
+        other = self.make_cache(SLOTS=32)
+        self.assertIsNone(other.get('a'))
+        other.set('a', 2)
+        self.assertEqual(other.get('a'), 2)
+        # The old file is left whole for the processes still mapping it, marked retired.
+        self.assertEqual(os.fstat(old.fd).st_size, old.size)
+        self.assertTrue(old.retired)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNot(self.cache.table, old)
+
+    def test_clear_empties_the_file_in_place(self):
+        self.cache.set('a', 1)
+        table = self.cache.table
+        size = os.path.getsize(self.location)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIs(self.cache.table, table)
+        self.assertEqual(os.path.getsize(self.location), size)
+
+
+class StaticServingTests(TestCase):
+    css = b'body { padding-top: 56px; }\n' * 200
+
+    def setUp(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        settings = override_settings(STATIC_ROOT=static_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        serving.metadata.clear()
+        self.root = static_root
+        self.path = f'{static_root}/erp.0123456789ab.css'
+        with open(self.path, 'wb') as f:
+            f.write(self.css)
+        self.encodings = serving.compress(self.path)
+
+    def test_hashed_names_are_immutable_and_precompressed(self):
+        import gzip
+        response = self.client.get('/static/erp.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Cache-Control'], serving.IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual((response['Content-Encoding'], response['Vary']), ('gzip', 'Accept-Encoding'))
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.css)
+
+        response = self.client.get('/static/erp.0123456789ab.css')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.css)
+        if serving.brotli is not None:
+            response = self.client.get('/static/erp.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertEqual(serving.brotli.decompress(b''.join(response.streaming_content)), self.css)
+
+    def test_conditional_and_range_requests(self):
+        url = '/static/erp.0123456789ab.css'
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=5-9', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, f'bytes 5-9/{len(self.css)}'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.css[5:10])
+        response = self.client.get(url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), self.css[-4:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(self.css)}-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 400)
+
+    def test_unhashed_media_is_revalidated(self):
+        with override_settings(MEDIA_ROOT=self.root):
+            response = self.client.get('/media/erp.0123456789ab.css')
+            self.assertEqual(response['Cache-Control'], serving.MEDIA_CACHE_CONTROL)
+            with open(self.path, 'ab') as f:
+                f.write(b'/* changed */')
+            serving.metadata.get(self.path).checked -= serving.MEDIA_RECHECK_SECONDS
+            self.assertNotEqual(self.client.get('/media/erp.0123456789ab.css')['ETag'], response['ETag'])
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        call_command('collectstatic', interactive=False, verbosity=0)
+        staticfiles_storage.load_manifest()
+        name = staticfiles_storage.stored_name('admin/css/base.css')
+        self.assertRegex(name, serving.HASHED_NAME)
+        self.assertTrue(staticfiles_storage.exists(name + '.gz'))
+        response = self.client.get(staticfiles_storage.url('admin/css/base.css'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((response.status_code, response['Content-Encoding']), (200, 'gzip'))
+
+
+class CustomerBalanceTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer(opening_balance=50)
+        self.product = make_product(selling_price=10)
+
+    def entries(self, customer=None):
+        return list(CustomerLedgerEntry.objects.filter(customer=customer or self.customer)
+                    .order_by('id').values_list('amount', 'balance', 'notes'))
+
+    def test_balance_follows_confirmations_and_cancellations(self):
+        self.assertEqual(self.customer.balance, 50)
+        order = make_order(self.customer, [(self.product, 3)])
+        order.total_amount = 30
+        order.save()
+        order.confirm()
+        order.cancel()
+        make_order(self.customer, [(self.product, 1)]).cancel()
+        self.customer.refresh_from_db()
+        self.customer.opening_balance = 40
+        self.customer.save()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.balance, 40)
+        self.assertEqual(self.entries(), [
+            (50, 50, 'Opening balance'),
+            (30, 80, f'Order {order.order_number} Confirmed'),
+            (-30, 50, f'Order {order.order_number} Cancelled'),
+            (-10, 40, 'Opening balance changed'),
+        ])
+
+    def test_stale_customer_saves_keep_the_balance(self):
+        stale = Customer.objects.get(pk=self.customer.pk)
+        create_orders([(self.customer, 'CONFIRMED', [(self.product, 2)])])
+        stale.phone = '555-0199'
+        stale.save()
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).balance, 70)
+        stale.opening_balance = 60
+        stale.save()
+        self.assertEqual(stale.balance, 80)
+        self.assertEqual(Customer.objects.get(pk=self.customer.pk).balance, 80)
+        self.assertEqual(self.entries()[-1], (10, 80, 'Opening balance changed'))
+
+    def test_bulk_created_confirmed_orders_are_charged(self):
+        other = make_customer('Cust-2')
+        create_orders([
+            (self.customer, 'CONFIRMED', [(self.product, 1)]),
+            (other, 'CONFIRMED', [(self.product, 2)]),
+            (self.customer, 'CONFIRMED', [(self.product, 4)]),
+            (self.customer, 'PENDING', [(self.product, 8)]),
+        ])
+        self.assertEqual([balance for amount, balance, notes in self.entries()], [50, 60, 100])
+        self.assertEqual(Customer.objects.get(pk=other.pk).balance, 20)
+
+    def test_statement_reads_stored_running_totals(self):
+        create_orders([(self.customer, 'CONFIRMED', [(self.product, n)]) for n in (1, 2, 3)])
+        for entry, number in zip(CustomerLedgerEntry.objects.order_by('id'), [1, 3, 5, 7]):
+            CustomerLedgerEntry.objects.filter(pk=entry.pk).update(timestamp=day(number))
+
+        with self.assertNumQueries(2):
+            statement = balances.statement(self.customer, day(2).date(), day(5).date())
+        self.assertEqual((statement.opening_balance, statement.closing_balance), (50, 80))
+        self.assertEqual([entry.balance for entry in statement.entries], [60, 80])
+        self.assertEqual((statement.charges, statement.credits), (30, 0))
+        empty = balances.statement(self.customer, day(8).date(), day(9).date())
+        self.assertEqual((empty.opening_balance, empty.closing_balance, empty.entries), (110, 110, []))
+
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        url = reverse('customer-statement', args=[self.customer.pk])
+        response = self.client.get(url, {'from': '2026-01-02', 'to': '2026-01-05'})
+        self.assertContains(response, '$80.00')
+        self.assertEqual(self.client.get(url, {'from': '2026-01-05', 'to': '2026-01-02'}).status_code, 400)
+
+    def test_reconcile_posts_drift(self):
+        create_orders([(self.customer, 'CONFIRMED', [(self.product, 2)])])
+        Customer.objects.filter(pk=self.customer.pk).update(balance=0)
+        out = io.StringIO()
+        call_command('reconcile_balances', dry_run=True, stdout=out)
+        self.assertIn('Cust-1: balance 0.00, orders say 70.00 (would be corrected by +70.00)', out.getvalue())
+        self.assertEqual(balances.reconcile(), {self.customer.pk: (0, 70)})
+        self.assertEqual(self.entries()[-1], (70, 70, 'Reconciliation adjustment'))
+        self.assertEqual(balances.reconcile(), {})
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.customer = make_customer('Cust-001')
+        self.mouse = make_product('MOUSE', category='Peripherals', cost_price=6, selling_price=10)
+        self.cable = make_product('CABLE', category='Cables', cost_price=1, selling_price=3)
+
+    def rollups(self):
+        return sorted(DailySalesRollup.objects.values_list('product__sku', 'units', 'revenue', 'cost'))
+
+    def test_confirm_and_cancel_maintain_rollups(self):
+        first = make_order(self.customer, [(self.mouse, 2), (self.cable, 5), (self.mouse, 1)])
+        second = make_order(self.customer, [(self.mouse, 1)])
+        for order in (first, second):
+            order.status = 'CONFIRMED'
+            order.save()
+        self.assertEqual(self.rollups(), [('CABLE', 5, 15, 5), ('MOUSE', 4, 40, 24)])
+
+        first.status = 'CANCELLED'
+        first.save()
+        self.assertEqual(self.rollups(), [('CABLE', 0, 0, 0), ('MOUSE', 1, 10, 6)])
+
+        rollups.rebuild()
+        self.assertEqual(self.rollups(), [('MOUSE', 1, 10, 6)])
+
+    def test_cancellation_reverses_the_cost_booked_at_confirmation(self):
+        order = make_order(self.customer, [(self.mouse, 2)])
+        self.assertTrue(order.confirm())
+        imported, = create_orders([(self.customer, 'CONFIRMED', [(self.mouse, 1)])])
+        Product.objects.filter(pk=self.mouse.pk).update(cost_price=9)
+        self.assertEqual(self.rollups(), [('MOUSE', 3, 30, 18)])
+
+        self.assertTrue(order.cancel())
+        self.assertTrue(imported.cancel())
+        self.assertEqual(self.rollups(), [('MOUSE', 0, 0, 0)])
+
+    def test_imported_confirmed_orders_are_rolled_up(self):
+        data = io.StringIO(
+            '{"ref": "W-1", "customer": "Cust-001", "status": "CONFIRMED", "items": [{"sku": "MOUSE", "qty": 2}]}\n'
+            '{"ref": "W-2", "customer": "Cust-001", "status": "CONFIRMED", "items": [{"sku": "MOUSE", "qty": 1}]}\n'
+            '{"ref": "W-3", "customer": "Cust-001", "items": [{"sku": "CABLE", "qty": 1}]}\n'
+        )
+        importers.import_orders(importers.read_jsonl(data))
+        self.assertEqual(self.rollups(), [('MOUSE', 3, 30, 18)])
+
+    def test_analytics(self):
+        today = datetime.date(2026, 3, 10)
+        DailySalesRollup.objects.bulk_create([
+            DailySalesRollup(day=today, product=self.mouse, units=2, revenue=20, cost=12),
+            DailySalesRollup(day=today, product=self.cable, units=10, revenue=35, cost=10),
+            DailySalesRollup(day=today - datetime.timedelta(days=1), product=self.mouse, units=1, revenue=10, cost=6),
+            DailySalesRollup(day=today - datetime.timedelta(days=2), product=self.mouse, units=4, revenue=40, cost=24),
+        ])
+        report = analytics.sales_report(today - datetime.timedelta(days=1), today, group='category', window=2)
+
+        self.assertEqual((report['current']['revenue'], report['current']['margin']), (65, 37))
+        self.assertEqual(report['previous']['revenue'], 40)
+        self.assertEqual(report['change']['revenue'], 62.5)
+        self.assertEqual([(label, figures['revenue']) for label, figures in report['groups']], [('Cables', 35), ('Peripherals', 30)])
+        self.assertEqual(report['daily'], [(today - datetime.timedelta(days=1), 10, 25), (today, 55, 32.5)])
+
+        data = analytics.SalesData(today - datetime.timedelta(days=2), today)
+        self.assertEqual([figures['units'] for label, figures in data.group_by('day')], [4, 1, 12])
+        self.assertEqual(analytics.moving_average([3, 6, 9, 12], 3).tolist(), [3, 4.5, 6, 9])
+
+    def test_report_view_requires_permission(self):
+        self.client.force_login(User.objects.create_user('sales'))
+        self.assertEqual(self.client.get(reverse('sales-report')).status_code, 403)
+        self.client.force_login(User.objects.create_superuser('admin'))
+        response = self.client.get(reverse('sales-report'), {'group': 'product', 'from': '2026-01-01', 'to': '2025-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', password='admin'))
+        self.products = [make_product(f'SKU-{i}', stock_qty=10 + i) for i in range(3)]
+        self.url = reverse('api-catalog', args=['products'])
+
+    def catalog_queries(self, queries):
+        return [query['sql'] for query in queries if '"erp_product"' in query['sql']]
+
+    def test_sparse_fields_and_cursor_pages(self):
+        first = self.client.get(self.url, {'fields': 'sku,available_qty', 'limit': 2}).json()
+        self.assertEqual(first['results'], [{'sku': 'SKU-0', 'available_qty': 10}, {'sku': 'SKU-1', 'available_qty': 11}])
+        self.assertIsNone(first['previous'])
+        second = self.client.get(self.url, {'fields': 'sku', 'limit': 2, 'cursor': first['next']}).json()
+        self.assertEqual((second['results'], second['next']), ([{'sku': 'SKU-2'}], None))
+        self.assertEqual(len(self.client.get(self.url, {'cursor': second['previous']}).json()['results']), 2)
+
+        customers = self.client.get(reverse('api-catalog', args=['customers']), {'fields': 'code,balance', 'count': 1}).json()
+        self.assertEqual((customers['results'], customers['count']), ([], 0))
+        for params in [{'fields': 'sku,secret'}, {'limit': 0}, {'cursor': 'nonsense'}]:
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-catalog', args=['orders'])).status_code, 405)
+        self.assertEqual(self.client.get(reverse('api-catalog', args=['users'])).status_code, 404)
+
+    def test_invalid_cursors_are_a_json_400(self):
+        etag = self.client.get(self.url)['ETag']
+        for cursor in ['nonsense', encode_cursor('next', ['abc']), encode_cursor('next', [[1]]), encode_cursor('up', [1])]:
+            response = self.client.get(self.url, {'cursor': cursor}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((response.status_code, response.json()), (400, {'errors': ["Invalid cursor."]}), cursor)
+
+    def test_bulk_lookup_by_sku_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            body = self.client.get(self.url, {'fields': 'sku,selling_price', 'sku': ['SKU-2,NOPE', 'SKU-0']}).json()
+        self.assertEqual(body, {
+            'results': [{'sku': 'SKU-2', 'selling_price': '10.00'}, {'sku': 'SKU-0', 'selling_price': '10.00'}],
+            'missing': ['NOPE'],
+        })
+        self.assertEqual(len(self.catalog_queries(queries)), 1)
+
+    def test_unchanged_pages_are_not_modified(self):
+        response = self.client.get(self.url, {'fields': 'sku,stock_qty'})
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'sku,stock_qty'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+        self.assertEqual(self.catalog_queries(queries), [])
+        # Another query is another representation.
+        self.assertEqual(self.client.get(self.url, {'fields': 'sku'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Stock moves with update(), which bumps the version like save() does.
+        create_orders([(make_customer(), 'CONFIRMED', [(self.products[0], 4)])])
+        response = self.client.get(self.url, {'fields': 'sku,stock_qty'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0], {'sku': 'SKU-0', 'stock_qty': 6})
+
+    def test_requires_view_permission(self):
+        self.client.force_login(User.objects.create_user('clerk'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+# Maximum number of queries per URL name, measured as a superuser with 10,
+# 100 and 1000 rows in every table. A view or template that starts loading
+# related rows one by one blows the budget as soon as the data grows.
+QUERY_BUDGETS = {
+    'login': 0,
+    'logout': 4,
+    'dashboard': 6,
+    'product-list': 5,
+    'product-add': 3,
+    'product-edit': 4,
+    'product-delete': 4,
+    'customer-list': 4,
+    'customer-add': 3,
+    'customer-edit': 4,
+    'customer-delete': 4,
+    'customer-statement': 6,
+    'order-list': 4,
+    'order-add': 5,
+    'order-import': 3,
+    'order-detail': 5,
+    'order-status-change': 20,
+    'export': 3,
+    'sales-report': 5,
+    'api-order-create': 17,
+    'api-catalog': 3,
+    'metrics': 0,
+}
+
+
+def seed_rows(count):
+    """Create ``count`` products, customers and orders, plus one order with ``count`` lines."""
+    products = Product.objects.bulk_create([
+        Product(sku=f'SKU-{i}', name=f'Product {i}', category=f'Category {i % 7}', cost_price=5, selling_price=10, stock_qty=1 + i % 20)
+        for i in range(count)
+    ])
+    customers = Customer.objects.bulk_create([
+        Customer(code=f'Cust-{i}', name=f'Customer {i}', phone='555-0100', address='123 Fake St')
+        for i in range(count)
+    ])
+    user = User.objects.create_user(f'clerk-{count}')
+    orders = SalesOrder.objects.bulk_create([
+        SalesOrder(order_number=f'BULK-{count}-{i}', customer=customers[i], created_by=user)
+        for i in range(count)
+    ])
+    SalesOrderItem.objects.bulk_create(
+        [SalesOrderItem(order=order, product=products[i], qty=1, price=10, total=10) for i, order in enumerate(orders)]
+        + [SalesOrderItem(order=orders[0], product=product, qty=1, price=10, total=10) for product in products]
+    )
+    StockMovement.objects.bulk_create([StockMovement(product=product, qty=-1, user=user) for product in products])
+    return products[0], customers[0], orders[0]
+
+
+class QueryBudgetTests(TestCase):
+    sizes = (10, 100, 1000)
+
+    def requests(self, product, customer, order):
+        status_order = SalesOrder.objects.exclude(pk=order.pk).first()
+        return {
+            'login': ('get', reverse('login')),
+            'logout': ('post', reverse('logout')),
+            'dashboard': ('get', reverse('dashboard')),
+            'product-list': ('get', reverse('product-list')),
+            'product-add': ('get', reverse('product-add')),
+            'product-edit': ('get', reverse('product-edit', args=[product.pk])),
+            'product-delete': ('get', reverse('product-delete', args=[product.pk])),
+            'customer-list': ('get', reverse('customer-list')),
+            'customer-add': ('get', reverse('customer-add')),
+            'customer-edit': ('get', reverse('customer-edit', args=[customer.pk])),
+            'customer-delete': ('get', reverse('customer-delete', args=[customer.pk])),
+            'customer-statement': ('get', reverse('customer-statement', args=[customer.pk])),
+            'order-list': ('get', reverse('order-list')),
+            'order-add': ('get', reverse('order-add')),
+            'order-import': ('get', reverse('order-import')),
+            'order-detail': ('get', reverse('order-detail', args=[order.pk])),
+            'order-status-change': ('get', reverse('order-status-change', args=[status_order.pk, 'confirm'])),
+            'export': ('get', reverse('export', args=['order-items', 'csv'])),
+            'sales-report': ('get', reverse('sales-report') + '?group=product'),
+            'api-order-create': ('post', reverse('api-order-create'), {
+                'data': {'customer': customer.code, 'items': [{'sku': product.sku, 'qty': 1}]},
+                'content_type': 'application/json',
+            }),
+            'api-catalog': ('get', reverse('api-catalog', args=['products']) + '?fields=sku,available_qty&limit=500'),
+            'metrics': ('get', reverse('metrics')),
+        }
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns}, set(QUERY_BUDGETS))
+
+    def test_query_counts_stay_within_budget_as_data_grows(self):
+        admin = User.objects.create_superuser('admin', password='admin')
+        for size in self.sizes:
+            with transaction.atomic():
+                rows = seed_rows(size)
+                for name, (method, url, *options) in self.requests(*rows).items():
+                    cache.clear()
+                    if name == 'login':
+                        self.client.logout()
+                    else:
+                        self.client.force_login(admin)
+                    with self.subTest(url=name, rows=size), CaptureQueriesContext(connection) as queries:
+                        response = getattr(self.client, method)(url, **(options[0] if options else {}))
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                        self.assertLess(response.status_code, 400)
+                        self.assertLessEqual(
+                            len(queries), QUERY_BUDGETS[name],
+                            '\n'.join(query['sql'] for query in queries),
+                        )
+                transaction.set_rollback(True)
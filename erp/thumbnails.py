@@ -0,0 +1,129 @@
+"""
+Fixed-size thumbnails of product images.
+
+Every image gets one file per variant (``VARIANTS``) and format (WebP, plus
+JPEG for browsers without WebP) at a path derived from the original's name::
+
+    products/mouse.png  ->  thumbnails/list/products/mouse.png.webp
+                            thumbnails/list/products/mouse.png.jpg
+
+so a thumbnail's URL is known without touching the database or the disk,
+and the original can be found from a thumbnail's name.
+
+Thumbnails are generated
+
+* in a background thread pool once a transaction that saved a new image
+  commits (see ``erp.signals``);
+* lazily, by ``thumbnail_view``, when a thumbnail URL is requested but the
+  file is missing, e.g. for images uploaded before thumbnails existed or
+  after a variant changed - only for images of a ``Product``;
+* in bulk by ``manage.py build_thumbnails``, which spreads the work over
+  all CPU cores.
+
+Templates use the ``thumbnails`` tag library: ``{% thumbnail image 'list' %}``
+renders a ``<picture>`` element and ``{% thumbnail_url image 'list' %}``
+a single URL.
+"""
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+ROOT = 'thumbnails'
+VARIANTS = {
+    # name: (width, height); twice the CSS size, for high-density screens.
+    'list': (80, 80),
+    'card': (320, 320),
+}
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+BACKGROUND = (255, 255, 255)
+
+# Pillow releases the GIL while decoding, resizing and encoding.
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='erp-thumbnails')
+
+
+def thumbnail_name(source_name, variant, fmt):
+    if variant not in VARIANTS or fmt not in FORMATS:
+        raise ValueError(f"unknown thumbnail {variant}.{fmt}")
+    return posixpath.join(ROOT, variant, f'{source_name}.{fmt}')
+
+
+def source_name(name):
+    """The original of thumbnail ``name`` and its variant and format, or None if it is not a thumbnail name."""
+    parts = name.split('/', 2)
+    if len(parts) != 3 or parts[0] != ROOT or parts[1] not in VARIANTS:
+        return None
+    source, dot, fmt = parts[2].rpartition('.')
+    if not dot or fmt not in FORMATS or not source:
+        return None
+    if source.split('/', 1)[0] == ROOT:
+        # No thumbnails of thumbnails.
+        return None
+    return source, parts[1], fmt
+
+
+def _render(image, variant, fmt):
+    pil_format, content_type, options = FORMATS[fmt]
+    thumbnail = ImageOps.fit(image, VARIANTS[variant], Image.Resampling.LANCZOS)
+    if pil_format == 'JPEG' and thumbnail.mode != 'RGB':
+        background = Image.new('RGB', thumbnail.size, BACKGROUND)
+        rgba = thumbnail.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        thumbnail = background
+    elif thumbnail.mode not in ('RGB', 'RGBA'):
+        thumbnail = thumbnail.convert('RGBA')
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate(source, variants=None, force=False, storage=None):
+    """
+    Write the missing thumbnails of image ``source`` (all of them with
+    ``force``). Returns the number written; 0 if the original is missing or
+    is not an image.
+    """
+    storage = storage or default_storage
+    names = {
+        (variant, fmt): thumbnail_name(source, variant, fmt)
+        for variant in (variants or VARIANTS) for fmt in FORMATS
+    }
+    if not force:
+        names = {key: name for key, name in names.items() if not storage.exists(name)}
+    if not names:
+        return 0
+    try:
+        with storage.open(source, 'rb') as original, Image.open(original) as image:
+            # JPEGs can be decoded at 1/2 to 1/8 scale, much faster than in full.
+            largest = max(max(VARIANTS[variant]) for variant, fmt in names)
+            image.draft(None, (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except FileNotFoundError:
+        return 0
+    except (UnidentifiedImageError, OSError) as exc:
+        logger.warning("Cannot make thumbnails of %s: %s", source, exc)
+        return 0
+    for (variant, fmt), name in names.items():
+        content = _render(image, variant, fmt)
+        # Storage.save() never overwrites; it would pick another name.
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(content))
+    return len(names)
+
+
+def schedule(source):
+    """Generate the thumbnails of ``source`` in the background once the current transaction commits."""
+    transaction.on_commit(partial(executor.submit, generate, source))
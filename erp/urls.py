@@ -1,5 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
+from django.contrib.auth.decorators import login_required
 from . import views
 
 urlpatterns = [
@@ -9,7 +10,7 @@ urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('dashboard/', views.dashboard, name='dashboard'),
 
-    path('products/', views.ProductListView.as_view(), name='product-list'),
+    path('products/', login_required(views.ProductListView.as_view()), name='product-list'),
     path('products/add/', views.ProductCreateView.as_view(), name='product-add'),
     path('products/<int:pk>/edit/', views.ProductUpdateView.as_view(), name='product-edit'),
     path('products/<int:pk>/delete/', views.ProductDeleteView.as_view(), name='product-delete'),
@@ -19,10 +20,20 @@ urlpatterns = [
     path('customers/add/', views.CustomerCreateView.as_view(), name='customer-add'),
     path('customers/<int:pk>/edit/', views.CustomerUpdateView.as_view(), name='customer-edit'),
     path('customers/<int:pk>/delete/', views.CustomerDeleteView.as_view(), name='customer-delete'),
+    path('customers/<int:pk>/statement/', views.customer_statement, name='customer-statement'),
 
     # Order URLs
-    path('orders/', views.OrderListView.as_view(), name='order-list'),
+    path('orders/', login_required(views.OrderListView.as_view()), name='order-list'),
     path('orders/add/', views.order_create_view, name='order-add'),
+    path('orders/import/', views.order_import_view, name='order-import'),
     path('orders/<int:pk>/', views.OrderDetailView.as_view(), name='order-detail'),
     path('orders/<int:pk>/status/<str:action>/', views.order_status_change, name='order-status-change'),
+
+    path('api/orders/', views.order_api_create, name='api-order-create'),
+    path('api/<str:kind>/', views.catalog_api, name='api-catalog'),
+
+    path('exports/<str:kind>.<str:fmt>', views.export_view, name='export'),
+    path('reports/sales/', views.sales_report, name='sales-report'),
+
+    path('metrics', views.metrics, name='metrics'),
 ]
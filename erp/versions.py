@@ -0,0 +1,64 @@
+"""
+Version counters for cached data.
+
+A cache entry derived from some rows carries the versions of the models (or
+single objects) it was built from in its key. Changing a row bumps the
+version, so every entry built from the old rows is simply never read again
+and expires on its own; nothing has to find and delete it. Template
+fragments (``erp.fragments``) and the permission cache (``erp.permissions``)
+are keyed this way.
+
+Versions are named after a model label, model class or instance
+(``dependency()``) and live in the default cache, which has to be shared by
+all processes for a bump to reach all of them. ``bump()`` bumps as soon as
+the change is made and again when its transaction commits, so an entry
+built from the old rows by a concurrent request cannot outlive the commit.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import models, transaction
+
+
+def dependency(value, pk=None):
+    """The version name for a model label, model class or instance, or a model and ``pk``."""
+    if isinstance(value, models.Model):
+        return f'{value._meta.label_lower}:{value.pk}'
+    if isinstance(value, type) and issubclass(value, models.Model):
+        value = value._meta.label_lower
+    return f'{value.lower()}:{pk}' if pk is not None else value.lower()
+
+
+def _version_key(name):
+    return f'erp:version:{name}'
+
+
+def versions(*dependencies):
+    """The current versions of ``dependencies``, with one cache round trip."""
+    names = [dependency(value) for value in dependencies]
+    keys = [_version_key(name) for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start evicted or new counters at the clock, never at a number
+            # that entries cached before the eviction could carry.
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def _bump(names):
+    for name in names:
+        key = _version_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump(*dependencies):
+    """Invalidate everything cached from ``dependencies``, now and when the transaction commits."""
+    names = [dependency(value) for value in dependencies]
+    _bump(names)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(names))
@@ -1,3 +1,8 @@
+import io
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required, user_passes_test
 from django.utils.decorators import method_decorator
@@ -6,45 +11,97 @@ from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMix
 from django.urls import reverse_lazy
 from django.db.models import Sum, Q
 from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views import csrf
+from django.views.decorators.http import require_POST, require_safe
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.utils import timezone
 from .models import Product, Customer, SalesOrder, SalesOrderItem, StockMovement
-from .forms import OrderCreateForm, OrderItemFormSet
+from .forms import OrderCreateForm, OrderImportForm, OrderItemFormSet
+from .pagination import CursorPaginationMixin, InvalidCursor
+from . import analytics, balances, catalog, concurrency, exports, importers, instrumentation, orders, search, serving, stats, thumbnails
+from .reservations import InsufficientStock
+
+LOW_STOCK_ALERTS = 20
+
+class ConcurrentListView(ListView):
+    """
+    ``ListView`` served by an async handler. The page of objects, the user's
+    permissions and the extra queries from ``get_context_queries()`` are run
+    concurrently (see ``erp.concurrency``); the template is then rendered by
+    the handler, in a thread. Wrap ``as_view()`` in ``login_required``, which
+    supports async views, rather than using ``LoginRequiredMixin``.
+    """
+
+    def get_context_queries(self):
+        """Return ``{context_name: callable}`` for queries to run alongside the page."""
+        return {}
+
+    async def get(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        queries = self.get_context_queries()
+        results = await concurrency.gather(
+            lambda: self.paginate_queryset(self.object_list, page_size),
+            lambda: concurrency.load_permissions(request.user),
+            *queries.values(),
+        )
+        paginator, page, object_list, is_paginated = results[0]
+        context = {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': is_paginated,
+            'object_list': object_list,
+            self.get_context_object_name(object_list): object_list,
+            'view': self,
+        }
+        context.update(zip(queries, results[2:]))
+        context.update(kwargs)
+        return self.render_to_response(context)
 
 @login_required
-def dashboard(request):
-    low_stock_threshold = 10
-    context = {
-        'total_products': Product.objects.count(),
-        'total_customers': Customer.objects.count(),
-        'orders_today': SalesOrder.objects.filter(order_date=timezone.now().date()).count(),
-        'low_stock_count': Product.objects.filter(stock_qty__lt=low_stock_threshold).count(),
-        'low_stock_products': Product.objects.filter(stock_qty__lt=low_stock_threshold),
-        'recent_logs': StockMovement.objects.order_by('-timestamp')[:5]
-    }
-    return render(request, 'erp/dashboard.html', context)
-
-class ProductListView(LoginRequiredMixin, ListView):
+async def dashboard(request):
+    request.user = await request.auser()
+    counts, low_stock_products, recent_logs, _ = await concurrency.gather(
+        stats.dashboard_counts,
+        lambda: list(Product.objects.filter(stock_qty__lt=stats.LOW_STOCK_THRESHOLD).order_by('stock_qty')[:LOW_STOCK_ALERTS]),
+        lambda: list(StockMovement.objects.select_related('product').order_by('-timestamp')[:5]),
+        lambda: concurrency.load_permissions(request.user),
+    )
+    context = dict(counts, low_stock_products=low_stock_products, recent_logs=recent_logs)
+    return await sync_to_async(render)(request, 'erp/dashboard.html', context)
+
+class ProductListView(CursorPaginationMixin, ConcurrentListView):
     model = Product
     template_name = 'erp/product_list.html'
     context_object_name = 'products'
     paginate_by = 10
+    cursor_ordering = ['id']
+
+    def get_cursor_ordering(self):
+        # Search results are ordered by rank, so they keep page numbers.
+        if self.request.GET.get('q'):
+            return None
+        return super().get_cursor_ordering()
 
     def get_queryset(self):
         queryset = super().get_queryset()
         q = self.request.GET.get('q')
         cat = self.request.GET.get('category')
         
-        if q:
-            queryset = queryset.filter(Q(name__icontains=q) | Q(sku__icontains=q))
         if cat:
-            queryset = queryset.filter(category__icontains=cat)
+            queryset = queryset.filter(category=cat)
+        if q:
+            queryset = search.search_products(queryset, q)
         
         return queryset
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['categories'] = Product.objects.values_list('category', flat=True).distinct()
-        return context
+    def categories(self):
+        # Called by the template, so a cached dropdown costs no query.
+        return Product.objects.values_list('category', flat=True).distinct()
 
 class ProductCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     model = Product
@@ -66,11 +123,12 @@ class ProductDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView)
     success_url = reverse_lazy('product-list')
     permission_required = 'erp.delete_product'
 
-class CustomerListView(LoginRequiredMixin, ListView):
+class CustomerListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Customer
     template_name = 'erp/customer_list.html'
     context_object_name = 'customers'
     paginate_by = 10
+    cursor_ordering = ['id']
 
 class CustomerCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     model = Customer
@@ -92,12 +150,13 @@ class CustomerDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView
     success_url = reverse_lazy('customer-list')
     permission_required = 'erp.delete_customer'
 
-class OrderListView(LoginRequiredMixin, ListView):
+class OrderListView(CursorPaginationMixin, ConcurrentListView):
     model = SalesOrder
     template_name = 'erp/order_list.html'
     context_object_name = 'orders'
     ordering = ['-order_date', '-id']
     paginate_by = 10
+    cursor_ordering = ['-order_date', '-id']
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -112,12 +171,17 @@ class OrderListView(LoginRequiredMixin, ListView):
         if status:
             queryset = queryset.filter(status=status)
             
-        return queryset.order_by('-order_date', '-id')
+        return queryset.select_related('customer').order_by('-order_date', '-id')
 
 class OrderDetailView(LoginRequiredMixin, DetailView):
     model = SalesOrder
     template_name = 'erp/order_detail.html'
     context_object_name = 'order'
+    queryset = SalesOrder.objects.select_related('customer', 'created_by')
+
+    def items(self):
+        # Called by the template, so a cached order body costs no query.
+        return self.object.items.select_related('product')
 
 @login_required
 @permission_required('erp.add_salesorder', raise_exception=True)
@@ -126,30 +190,180 @@ def order_create_view(request):
         form = OrderCreateForm(request.POST)
         formset = OrderItemFormSet(request.POST)
         if form.is_valid() and formset.is_valid():
-            with transaction.atomic():
-                order = form.save(commit=False)
-                order.created_by = request.user
-                order.save()
-                
-                items = formset.save(commit=False)
-                total = 0
-                for item in items:
-                    item.order = order
-                    item.price = item.product.selling_price
-                    item.save()
-                    total += item.total
-                
-                order.total_amount = total
-                order.save()
-                
-            messages.success(request, 'Order created successfully.')
-            return redirect('order-list')
+            try:
+                orders.create_order(form.cleaned_data['customer'], formset.order_lines(), user=request.user)
+            except InsufficientStock as exc:
+                form.add_error(None, f"Not enough stock: {exc}")
+            else:
+                messages.success(request, 'Order created successfully.')
+                return redirect('order-list')
     else:
         form = OrderCreateForm()
         formset = OrderItemFormSet()
     
     return render(request, 'erp/order_form.html', {'form': form, 'formset': formset})
 
+def csrf_failure(request, reason=''):
+    """CSRF_FAILURE_VIEW: the usual page, or a JSON error for the API."""
+    match = request.resolver_match
+    if match and (match.url_name or '').startswith('api-'):
+        return JsonResponse({'errors': [f"CSRF check failed: {reason}"]}, status=403)
+    return csrf.csrf_failure(request, reason)
+
+@require_POST
+def order_api_create(request):
+    """
+    Create an order from a JSON body shaped like an import record:
+    ``{"customer": "Cust-001", "status": "PENDING", "items": [{"sku": "USB-C", "qty": 3}]}``.
+
+    Clients authenticate with the session cookie of a login (POST
+    ``/login/``) and, as for any POST, send the ``csrftoken`` cookie
+    back in an ``X-CSRFToken`` header; a request without it gets a JSON 403.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'errors': ["Authentication required."]}, status=401)
+    if not request.user.has_perm('erp.add_salesorder'):
+        return JsonResponse({'errors': ["You don't have permission to create orders."]}, status=403)
+
+    report = importers.ImportReport()
+    try:
+        records = list(importers.read_jsonl([request.body.decode('utf-8')]))
+    except UnicodeDecodeError:
+        records = []
+    entries = importers.resolve(records, report)
+    if not entries:
+        errors = [message for line, ref, message in report.errors] or ["Request body must be a JSON order."]
+        return JsonResponse({'errors': errors}, status=400)
+
+    try:
+        order = orders.create_orders(entries, user=request.user)[0]
+    except InsufficientStock as exc:
+        return JsonResponse({'errors': [f"Not enough stock: {exc}"]}, status=409)
+    return JsonResponse({
+        'id': order.pk,
+        'order_number': order.order_number,
+        'status': order.status,
+        'total_amount': str(order.total_amount),
+        'lines': len(entries[0][2]),
+    }, status=201)
+
+@require_safe
+def catalog_api(request, kind):
+    """JSON product and customer catalog; see erp.catalog."""
+    resource = catalog.CATALOGS.get(kind)
+    if resource is None:
+        raise Http404("Unknown catalog.")
+    if not request.user.is_authenticated:
+        return JsonResponse({'errors': ["Authentication required."]}, status=401)
+    if not request.user.has_perm(resource.permission):
+        return JsonResponse({'errors': [f"You don't have permission to view {kind}."]}, status=403)
+
+    try:
+        query = resource.parse(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'errors': [str(exc)]}, status=400)
+    except InvalidCursor:
+        # Before the ETag check, so a bad cursor is never answered 304.
+        return JsonResponse({'errors': ["Invalid cursor."]}, status=400)
+    etag = resource.etag(query)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(resource.fetch(query))
+    response['ETag'] = etag
+    # Clients keep the page but check back every time; the check is cheap.
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+@login_required
+@permission_required('erp.add_salesorder', raise_exception=True)
+def order_import_view(request):
+    report = None
+    if request.method == 'POST':
+        form = OrderImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Uploads are spooled to disk by Django; parse them line by line.
+            stream = io.TextIOWrapper(form.cleaned_data['file'].open('rb'), encoding='utf-8', newline='')
+            reader = importers.READERS[form.cleaned_data['format']]
+            report = importers.import_orders(reader(stream), user=request.user)
+            messages.success(request, f"Imported {report.orders} orders.")
+    else:
+        form = OrderImportForm()
+    return render(request, 'erp/order_import.html', {'form': form, 'report': report})
+
+@login_required
+def export_view(request, kind, fmt):
+    export = exports.EXPORTS.get(kind)
+    if export is None or fmt not in exports.FORMATS:
+        raise Http404("Unknown export.")
+    if not request.user.has_perm(f'erp.view_{export.model._meta.model_name}'):
+        raise PermissionDenied
+
+    try:
+        date_from = exports.parse_day(request.GET.get('from'))
+        date_to = exports.parse_day(request.GET.get('to'))
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be valid and in YYYY-MM-DD format.")
+
+    stream, content_type = exports.FORMATS[fmt]
+    response = StreamingHttpResponse(stream(export.headers, export.queryset(date_from, date_to)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+@login_required
+@permission_required('erp.view_dailysalesrollup', raise_exception=True)
+def sales_report(request):
+    try:
+        date_to = exports.parse_day(request.GET.get('to')) or timezone.now().date()
+        date_from = exports.parse_day(request.GET.get('from')) or date_to - timedelta(days=29)
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be valid and in YYYY-MM-DD format.")
+    if date_from > date_to:
+        return HttpResponseBadRequest("The start date must not be after the end date.")
+    group = request.GET.get('group')
+    if group not in analytics.GROUPINGS:
+        group = 'category'
+
+    context = analytics.sales_report(date_from, date_to, group)
+    context.update({'date_from': date_from, 'date_to': date_to, 'group': group, 'groupings': analytics.GROUPINGS})
+    return render(request, 'erp/sales_report.html', context)
+
+@login_required
+@permission_required('erp.view_customer', raise_exception=True)
+def customer_statement(request, pk):
+    customer = get_object_or_404(Customer, pk=pk)
+    try:
+        date_to = exports.parse_day(request.GET.get('to')) or timezone.now().date()
+        date_from = exports.parse_day(request.GET.get('from')) or date_to - timedelta(days=29)
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be valid and in YYYY-MM-DD format.")
+    if date_from > date_to:
+        return HttpResponseBadRequest("The start date must not be after the end date.")
+    statement = balances.statement(customer, date_from, date_to)
+    return render(request, 'erp/customer_statement.html', {'customer': customer, 'statement': statement})
+
+def thumbnail_view(request, path):
+    """Serve a thumbnail, generating it first if it is missing."""
+    name = f'{thumbnails.ROOT}/{path}'
+    parsed = thumbnails.source_name(name)
+    if parsed is None:
+        raise Http404("Unknown thumbnail.")
+    source, variant, fmt = parsed
+    if not default_storage.exists(name):
+        # The view is public: only spend the work on images in the catalog.
+        if not Product.objects.filter(image=source).exists():
+            raise Http404("No such image.")
+        thumbnails.generate(source, [variant])
+        if not default_storage.exists(name):
+            raise Http404("No such image.")
+    return serving.serve_media(request, name)
+
+def metrics(request):
+    """Prometheus scrape endpoint; open to ``INTERNAL_IPS`` and staff users."""
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(instrumentation.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
 def order_status_change(request, pk, action):
     order = get_object_or_404(SalesOrder, pk=pk)
@@ -158,15 +372,10 @@ def order_status_change(request, pk, action):
          messages.error(request, "You don't have permission to update orders.")
          return redirect('order-detail', pk=pk)
 
-    if action == 'confirm' and order.status == 'PENDING':
-        order.status = 'CONFIRMED'
-        order.save()
+    if action == 'confirm' and order.confirm():
         messages.success(request, f"Order {order.order_number} confirmed.")
-    elif action == 'cancel' and order.status != 'CANCELLED':
-        order.status = 'CANCELLED'
-        order.save()
+    elif action == 'cancel' and order.cancel():
         messages.success(request, f"Order {order.order_number} cancelled.")
     
     return redirect('order-detail', pk=pk)
 
-from django.db import transaction
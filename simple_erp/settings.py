@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import hashlib
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,7 +46,12 @@ LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/login/'
 LOGIN_URL = '/login/'
 
+# JSON errors for the API's POSTs; see erp.views.order_api_create.
+CSRF_FAILURE_VIEW = 'erp.views.csrf_failure'
+
 MIDDLEWARE = [
+    'erp.instrumentation.PerformanceMiddleware',
+    'erp.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,7 +65,7 @@ ROOT_URLCONF = 'simple_erp.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'erp.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,6 +80,32 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'simple_erp.wsgi.application'
 
+# Whether async views run their independent queries concurrently, on a
+# thread pool (erp.concurrency). Worth it when queries wait on the database
+# server; with SQLite's sub-millisecond reads the thread hops cost more.
+CONCURRENT_QUERIES = True
+
+# How long a pending order holds its stock before the reservation lapses;
+# `manage.py expire_reservations --interval 60` releases lapsed ones.
+STOCK_RESERVATION_MINUTES = 30
+
+# Requests slower than this are logged, with their SQL, to 'erp.performance'.
+SLOW_REQUEST_MS = 500
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'erp.performance': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Addresses allowed to scrape /metrics without logging in as staff.
+INTERNAL_IPS = ['127.0.0.1']
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
@@ -82,9 +114,73 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {
+            # Take the write lock when a transaction begins, so concurrent
+            # stock updates queue on the busy timeout instead of failing.
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'TEST': {
+            # File-backed so tests can exercise real cross-connection locking.
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Read replica of 'default'. Locally it is kept in sync by
+    # `manage.py sync_replica --interval 2`, a stand-in for real replication.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db_replica.sqlite3',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['erp.routers.PrimaryReplicaRouter']
+
+# Aliases the views in REPLICA_VIEWS may read from. Empty until the replica
+# is actually being replicated, e.g. ['replica'] with sync_replica running.
+DATABASE_REPLICAS = []
+
+REPLICA_VIEWS = [
+    'dashboard', 'product-list', 'customer-list', 'order-list', 'order-detail', 'sales-report',
+]
+
+# After a request writes, that user's reads stay on the primary this long.
+REPLICA_STICKY_SECONDS = 5
+
+# Cache
+# One memory-mapped table shared by every worker process on the machine
+# (erp.shared_cache): dashboard counts, template fragments, permissions and
+# the version counters they are keyed on are computed once, not per process.
+# On tmpfs where available, so it never waits on the disk. The file is named
+# after the database, so other checkouts and databases on the machine never
+# read each other's entries.
+
+_CACHE_NAME = 'simple_erp-%s.cache' % hashlib.sha256(str(DATABASES['default']['NAME']).encode()).hexdigest()[:12]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'erp.shared_cache.SharedMemoryCache',
+        'LOCATION': Path('/dev/shm') / _CACHE_NAME if Path('/dev/shm').is_dir() else BASE_DIR / _CACHE_NAME,
+        'OPTIONS': {
+            # 4096 entries of up to 16 KB each; only the pages in use take memory.
+            'SLOTS': 4096,
+            'SLOT_SIZE': 16384,
+            'WAYS': 8,
+        },
+    },
+}
+
+# Sessions are read from the cache and written through to the database, so an
+# evicted session costs a query rather than a login.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Permissions are cached across requests; see erp.permissions.
+AUTHENTICATION_BACKENDS = ['erp.permissions.CachedModelBackend']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -121,6 +217,15 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed copies plus .gz/.br variants, which
+# erp.serving serves with far-future cache headers. Re-run it after changing
+# any static file: {% static %} fails for files missing from the manifest.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'erp.serving.CompressedManifestStaticFilesStorage'},
+}
 
 # Media files
 MEDIA_URL = '/media/'
@@ -18,12 +18,16 @@ from django.contrib import admin
 from django.urls import path, include
 
 from django.conf import settings
-from django.conf.urls.static import static
-from django.views.static import serve
 from django.urls import re_path
 
+from erp import serving, thumbnails
+from erp.views import thumbnail_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('erp.urls')),
-    re_path(r'^static/(?P<path>.*)$', serve,{'document_root': settings.STATIC_ROOT}),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(r'^static/(?P<path>.*)$', serving.serve_static),
+    # Thumbnails missing from MEDIA_ROOT are generated on first request.
+    path(f"{settings.MEDIA_URL.strip('/')}/{thumbnails.ROOT}/<path:path>", thumbnail_view, name='thumbnail'),
+    re_path(rf"^{settings.MEDIA_URL.strip('/')}/(?P<path>.*)$", serving.serve_media),
+]